@@ -0,0 +1,64 @@
+"""
+Image preparation for Gemini vision calls.
+
+Handing generate_content() a PIL image made the SDK re-encode it as a
+lossless WebP at full resolution, so a 12 MP photo went out as several MB
+(and as many image tokens) for a safety check that doesn't need the detail.
+prepare_gemini_image() decodes at reduced scale where the format allows it
+(JPEG draft mode), applies the EXIF orientation, shrinks the longest edge to
+max_edge and re-encodes as JPEG or WebP without EXIF/ICC/XMP metadata. The
+result is passed to the SDK as an inline blob, which it sends unchanged.
+"""
+import io
+import time
+from typing import Any, Dict
+
+from PIL import Image, ImageOps
+
+GEMINI_IMAGE_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp")}
+
+
+def prepare_gemini_image(image_data: bytes, max_edge: int = 1024, image_format: str = "jpeg",
+                         quality: int = 85) -> Dict[str, Any]:
+    """
+    {"blob": {"mime_type", "data"}, "original_bytes", "sent_bytes",
+    "original_size", "sent_size", "prepare_ms"} for encoded image bytes.
+    max_edge <= 0 keeps the resolution (metadata is still stripped).
+    """
+    started = time.perf_counter()
+    pil_format, mime_type = GEMINI_IMAGE_FORMATS.get(image_format, GEMINI_IMAGE_FORMATS["jpeg"])
+    img = Image.open(io.BytesIO(image_data))
+    original_size = img.size
+    if max_edge > 0:
+        # Reduced-scale JPEG decode, never below max_edge on the longest side
+        scale = max_edge / max(original_size)
+        if scale < 1:
+            img.draft('RGB', (max(1, round(original_size[0] * scale)), max(1, round(original_size[1] * scale))))
+    if img.mode != 'RGB':
+        if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+            # Transparent areas become white rather than whatever colour hides under the alpha
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            rgba = img.convert('RGBA')
+            background.paste(rgba, mask=rgba.getchannel('A'))
+            # Keep the EXIF orientation for exif_transpose below
+            background.info = dict(img.info)
+            img = background
+        else:
+            img = img.convert('RGB')
+    if max_edge > 0 and max(img.size) > max_edge:
+        img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    # Rotate per EXIF (on the small image) before the tag is dropped
+    img = ImageOps.exif_transpose(img)
+
+    # A fresh save without exif=/icc_profile= writes no metadata
+    buffer = io.BytesIO()
+    img.save(buffer, format=pil_format, quality=quality)
+    data = buffer.getvalue()
+    return {
+        "blob": {"mime_type": mime_type, "data": data},
+        "original_bytes": len(image_data),
+        "sent_bytes": len(data),
+        "original_size": list(original_size),
+        "sent_size": list(img.size),
+        "prepare_ms": (time.perf_counter() - started) * 1000,
+    }
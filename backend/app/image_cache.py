@@ -0,0 +1,235 @@
+"""
+On-disk HTTP cache of downloaded image bytes.
+
+Images are stored content-addressed (blobs/ab/<sha256>, shared by every URL
+that serves the same bytes) with a SQLite index keyed by normalized URL that
+records the validators and freshness of each response. ImageFetcher consults
+it before downloading:
+
+    fresh entry          served from disk, no request at all
+    stale + validators   conditional GET (If-None-Match / If-Modified-Since);
+                         a 304 refreshes the entry and serves the stored bytes
+    otherwise            normal download, stored if the response allows it
+
+Freshness follows Cache-Control (no-store, no-cache, max-age, Age), then
+Expires, then the usual heuristic of 10% of the time since Last-Modified.
+Blobs are evicted least recently used once their total size exceeds max_bytes.
+Index and blobs live on disk, so warm entries survive restarts and are shared
+by pre-forked workers.
+"""
+import os
+import sqlite3
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Mapping, Optional
+
+from .verdict_cache import content_digest, normalize_image_url
+
+
+def _http_date(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def cache_directives(headers: Mapping[str, str]) -> Dict[str, Optional[str]]:
+    """Cache-Control directives as {name: value or None}."""
+    directives = {}
+    for part in headers.get("cache-control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"') or None
+    return directives
+
+
+def freshness_lifetime(headers: Mapping[str, str], now: float, heuristic_max_seconds: float) -> Optional[float]:
+    """Seconds the response stays fresh from now (0 = revalidate before every use), None if it must not be stored."""
+    directives = cache_directives(headers)
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    age_header = headers.get("age", "")
+    age = float(age_header) if age_header.isdigit() else 0.0
+    max_age = directives.get("max-age")
+    if max_age is not None and max_age.isdigit():
+        return max(0.0, int(max_age) - age)
+
+    date = _http_date(headers.get("date")) or now
+    expires = _http_date(headers.get("expires"))
+    if "expires" in headers:
+        # An invalid Expires (e.g. "0") means already expired
+        return max(0.0, expires - date - age) if expires is not None else 0.0
+    last_modified = _http_date(headers.get("last-modified"))
+    if last_modified is not None and last_modified < date:
+        return min(0.1 * (date - last_modified), heuristic_max_seconds)
+    return 0.0
+
+
+class ImageDiskCache:
+    """Content-addressed image bytes with a per-URL index of validators and expiry, bounded by max_bytes."""
+
+    def __init__(self, directory: Path, max_bytes: int = 256 * 1024 * 1024, heuristic_max_seconds: float = 86400):
+        self.directory = Path(directory)
+        self.max_bytes = max(1, max_bytes)
+        self.heuristic_max_seconds = heuristic_max_seconds
+        self._blobs = self.directory / "blobs"
+        self._blobs.mkdir(parents=True, exist_ok=True)
+        self._lock = Lock()
+
+        # Metrics
+        self.hits = 0
+        self.stale = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.stored = 0
+        self.not_stored = 0
+        self.evictions = 0
+
+        # Several worker processes may share the directory; SQLite serializes their writes
+        self._db = sqlite3.connect(str(self.directory / "index.sqlite3"), timeout=5, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS urls (url TEXT PRIMARY KEY, digest TEXT NOT NULL, etag TEXT, "
+            "last_modified TEXT, expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        # The budget may have been lowered since the last run
+        self._evict()
+        self._db.commit()
+
+    def _blob_path(self, digest: str) -> Path:
+        return self._blobs / digest[:2] / digest
+
+    def lookup(self, url: str) -> Optional[Dict[str, Any]]:
+        """
+        Index entry for url with its bytes: {"data", "etag", "last_modified", "fresh"},
+        or None (counted as a miss) if the URL or its blob is unknown.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, etag, last_modified, expires_at FROM urls WHERE url = ?", (normalize_image_url(url),)
+            ).fetchone()
+            data = None
+            if row is not None:
+                try:
+                    data = self._blob_path(row[0]).read_bytes()
+                except OSError:
+                    # Evicted (possibly by another worker) after the index row was read
+                    data = None
+            if data is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), row[0]))
+            self._db.commit()
+        fresh = row[3] > time.time()
+        if fresh:
+            self.hits += 1
+        else:
+            self.stale += 1
+        return {"data": data, "etag": row[1], "last_modified": row[2], "fresh": fresh}
+
+    def refresh(self, url: str, headers: Mapping[str, str]) -> None:
+        """Record a 304 Not Modified: new expiry (and validators, if the server sent them)."""
+        now = time.time()
+        lifetime = freshness_lifetime(headers, now, self.heuristic_max_seconds)
+        with self._lock:
+            self.revalidated += 1
+            key = normalize_image_url(url)
+            if lifetime is None:
+                self._db.execute("DELETE FROM urls WHERE url = ?", (key,))
+            else:
+                self._db.execute(
+                    "UPDATE urls SET expires_at = ?, etag = coalesce(?, etag), "
+                    "last_modified = coalesce(?, last_modified) WHERE url = ?",
+                    (now + lifetime, headers.get("etag"), headers.get("last-modified"), key),
+                )
+            self._db.commit()
+
+    def store(self, url: str, data: bytes, headers: Mapping[str, str]) -> bool:
+        """Store a 200 response if its headers allow it; returns whether it was stored."""
+        now = time.time()
+        lifetime = freshness_lifetime(headers, now, self.heuristic_max_seconds)
+        etag, last_modified = headers.get("etag"), headers.get("last-modified")
+        # Without freshness or a validator an entry could never be used
+        if lifetime is None or (lifetime <= 0 and not etag and not last_modified) or len(data) > self.max_bytes:
+            self.not_stored += 1
+            return False
+
+        digest = content_digest(data)
+        path = self._blob_path(digest)
+        key = normalize_image_url(url)
+        with self._lock:
+            previous = self._db.execute("SELECT digest FROM urls WHERE url = ?", (key,)).fetchone()
+            if not path.exists():
+                path.parent.mkdir(exist_ok=True)
+                temporary = path.with_name(f"{digest}.{os.getpid()}.tmp")
+                temporary.write_bytes(data)
+                os.replace(temporary, path)
+            self._db.execute(
+                "INSERT OR REPLACE INTO blobs (digest, size, last_used) VALUES (?, ?, ?)", (digest, len(data), now)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO urls (url, digest, etag, last_modified, expires_at) VALUES (?, ?, ?, ?, ?)",
+                (key, digest, etag, last_modified, now + lifetime),
+            )
+            if previous is not None and previous[0] != digest:
+                # The URL now serves other bytes: drop the old blob unless another URL still uses it
+                self._drop_unreferenced(previous[0])
+            self._evict()
+            self._db.commit()
+            self.stored += 1
+        return True
+
+    def _drop_unreferenced(self, digest: str) -> None:
+        if self._db.execute("SELECT 1 FROM urls WHERE digest = ? LIMIT 1", (digest,)).fetchone() is None:
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._blob_path(digest).unlink(missing_ok=True)
+
+    def _evict(self) -> None:
+        """Drop least recently used blobs (and the URLs pointing at them) until under max_bytes (caller holds the lock)."""
+        total = self._db.execute("SELECT coalesce(sum(size), 0) FROM blobs").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in self._db.execute("SELECT digest, size FROM blobs ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.execute("DELETE FROM urls WHERE digest = ?", (digest,))
+            self._blob_path(digest).unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            entries, blobs, total = self._db.execute(
+                "SELECT (SELECT count(*) FROM urls), count(*), coalesce(sum(size), 0) FROM blobs"
+            ).fetchone()
+        lookups = self.hits + self.stale + self.misses
+        return {
+            "directory": str(self.directory),
+            "urls": entries,
+            "blobs": blobs,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "stale": self.stale,
+            "revalidated": self.revalidated,
+            "misses": self.misses,
+            # Downloads avoided entirely, or reduced to a 304
+            "hit_rate": round((self.hits + self.revalidated) / lookups, 4) if lookups else None,
+            "stored": self.stored,
+            "not_stored": self.not_stored,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,329 @@
+"""
+Shared async HTTP client for downloading images.
+
+The image endpoints used to call urllib.request.urlopen, which blocks the
+event loop (or a worker thread) for up to the whole timeout and opens a new
+TCP+TLS connection per image. ImageFetcher keeps one httpx.AsyncClient per
+process with a per-host keep-alive connection pool, so repeated images from
+the same CDN reuse warm connections and downloads never block the loop.
+
+Bodies are streamed under a byte cap. Before the first byte is buffered the
+Content-Type and Content-Length are checked. The header of the image is then
+parsed from the first chunks, so a video behind an image URL or a 20000x20000
+PNG is dropped after a few KB instead of being buffered and decoded in full.
+
+With an ImageDiskCache (app/image_cache.py) fresh images are served from disk
+and stale ones are revalidated with a conditional GET. Its SQLite and file I/O
+runs in a worker thread; if it fails, the image is downloaded as if uncached.
+"""
+import asyncio
+import io
+import sqlite3
+import struct
+import warnings
+import weakref
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+import httpx
+from PIL import Image
+
+from .image_cache import ImageDiskCache
+
+# Content types that are never images; anything else (missing, octet-stream,
+# mislabeled) still has to pass the magic-byte check
+REJECTED_CONTENT_TYPES = (
+    "video/", "audio/", "text/html", "text/css", "text/javascript", "application/json",
+    "application/javascript", "application/pdf", "application/zip",
+)
+# Give up parsing the header (and leave it to the decoder) after this many bytes
+HEADER_PROBE_BYTES = 256 * 1024
+
+REJECT_REASONS = ("content_type", "too_large", "not_an_image", "too_many_pixels")
+
+
+class ImageFetchError(RuntimeError):
+    """Raised when an image can't be downloaded (status is the HTTP status, if any)."""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class ImageRejectedError(ImageFetchError):
+    """Raised when a download is aborted because it isn't an acceptable image (reason in REJECT_REASONS)."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def sniff_image_format(head: bytes) -> Optional[str]:
+    """Image format from the magic bytes at the start of the data, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "GIF"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    if head[:2] == b"BM":
+        return "BMP"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "TIFF"
+    if head[:4] == b"\x00\x00\x01\x00":
+        return "ICO"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"avif", b"avis", b"heic", b"heix", b"mif1", b"msf1"):
+        return "AVIF"
+    text = head[:512].lstrip().lower()
+    if text.startswith(b"<svg") or (text.startswith(b"<?xml") and b"<svg" in text):
+        # Same markers as triage_bytes(), which answers SVGs without decoding; other XML (RSS, XHTML) isn't an image
+        return "SVG"
+    return None
+
+
+def _webp_size(head: bytes) -> Optional[Tuple[int, int]]:
+    chunk = head[12:16]
+    if chunk == b"VP8X" and len(head) >= 30:
+        return (int.from_bytes(head[24:27], "little") + 1, int.from_bytes(head[27:30], "little") + 1)
+    if chunk == b"VP8 " and len(head) >= 30:
+        width, height = struct.unpack("<HH", head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b"VP8L" and len(head) >= 25:
+        bits = int.from_bytes(head[21:25], "little")
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    return None
+
+
+def probe_image_size(head: bytes, image_format: str) -> Optional[Tuple[int, int]]:
+    """(width, height) from the first bytes of an image, or None while the header is incomplete."""
+    # Fixed-offset headers are read directly (PIL needs the whole file for WebP)
+    if image_format == "PNG":
+        return struct.unpack(">II", head[16:24]) if len(head) >= 24 else None
+    if image_format == "GIF":
+        return struct.unpack("<HH", head[6:10]) if len(head) >= 10 else None
+    if image_format == "WEBP":
+        return _webp_size(head)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            with Image.open(io.BytesIO(head)) as img:
+                return img.size
+    except Exception:
+        return None
+
+
+class ImageFetcher:
+    """
+    Pooled image downloader. start() creates the client in the serving process
+    (after any pre-fork), close() releases its connections. transport lets a
+    caller point the client at a stub (e.g. httpx.MockTransport).
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 10.0,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_seconds: float = 30.0,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_pixels: int = 40_000_000,
+        headers: Optional[Dict[str, str]] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        cache: Optional[ImageDiskCache] = None,
+    ):
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(
+            max_connections=max(1, max_connections),
+            max_keepalive_connections=max(0, max_keepalive_connections),
+            keepalive_expiry=keepalive_seconds,
+        )
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.headers = headers or {}
+        self.transport = transport
+        self.cache = cache
+
+        self._client: Optional[httpx.AsyncClient] = None
+        # Connections seen so far; a response on an unseen one means a new TCP(+TLS) handshake
+        self._streams: "weakref.WeakSet[Any]" = weakref.WeakSet()
+
+        # Metrics
+        self.requests = 0
+        self.failed = 0
+        self.bytes_received = 0
+        self.connections_opened = 0
+        self.rejected = {reason: 0 for reason in REJECT_REASONS}
+        # Announced bytes of rejected responses that were never downloaded
+        self.bytes_avoided = 0
+        self.cache_errors = 0
+
+    def start(self) -> None:
+        """Create the shared client (idempotent)."""
+        if self._client is not None:
+            return
+        # httpx keeps one pool of keep-alive connections per origin (scheme, host, port)
+        self._client = httpx.AsyncClient(
+            transport=self.transport,
+            timeout=self.timeout,
+            limits=self.limits,
+            headers=self.headers,
+            follow_redirects=True,
+        )
+        print(f"🌐 Image fetcher started: up to {self.limits.max_connections} connections, "
+              f"{self.limits.max_keepalive_connections} kept alive")
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _count_connection(self, response: httpx.Response) -> None:
+        stream = response.extensions.get("network_stream")
+        if stream is None:
+            return
+        try:
+            if stream not in self._streams:
+                self._streams.add(stream)
+                self.connections_opened += 1
+        except TypeError:
+            pass
+
+    async def _cache_call(self, method: str, *args: Any) -> Any:
+        """Call an ImageDiskCache method off the event loop; None if there is no cache or it failed."""
+        if self.cache is None:
+            return None
+        try:
+            return await asyncio.to_thread(getattr(self.cache, method), *args)
+        except (sqlite3.Error, OSError) as e:
+            # e.g. "database is locked" with several workers sharing the directory
+            self.cache_errors += 1
+            print(f"⚠️ Image cache {method} failed, skipping the cache: {e}")
+            return None
+
+    def _reject(self, reason: str, message: str) -> ImageRejectedError:
+        self.rejected[reason] += 1
+        return ImageRejectedError(message, reason)
+
+    def check_header(self, head: bytes, final: bool = False) -> bool:
+        """
+        Validate the start of an image body: True once the header was accepted,
+        False if more bytes are needed (never when final). Raises ImageRejectedError.
+        """
+        image_format = sniff_image_format(head)
+        if image_format is None:
+            if len(head) < 16 and not final:
+                return False
+            raise self._reject("not_an_image", "Not a supported image format")
+        if image_format == "SVG":
+            return True
+        size = probe_image_size(head, image_format)
+        if size is None:
+            # Header not complete yet (or beyond the probe window: the decoder will tell)
+            return final or len(head) >= HEADER_PROBE_BYTES
+        if size[0] * size[1] > self.max_pixels:
+            raise self._reject(
+                "too_many_pixels", f"Image too large: {size[0]}x{size[1]} {image_format} (max {self.max_pixels} pixels)"
+            )
+        return True
+
+    def check_bytes(self, image_data: bytes) -> bytes:
+        """The same checks as a download, for image bytes that arrived some other way (base64)."""
+        if len(image_data) > self.max_bytes:
+            raise self._reject("too_large", f"Image too large: {len(image_data)} bytes (max {self.max_bytes})")
+        self.check_header(image_data, final=True)
+        return image_data
+
+    def check_content_length(self, content_length: str, overhead: int = 0, source: str = "upload") -> Optional[int]:
+        """Announced body size (None if unknown); rejects it beyond max_bytes (+ overhead for framing)."""
+        announced = int(content_length) if content_length.isdigit() else None
+        if announced is not None and announced > self.max_bytes + overhead:
+            self.bytes_avoided += announced
+            raise self._reject("too_large", f"Image too large: {announced} bytes (max {self.max_bytes}): {source}")
+        return announced
+
+    async def read_body(self, chunks: AsyncIterator[bytes], content_length: str = "", source: str = "upload") -> bytes:
+        """
+        Collect a streamed body (download or upload) under max_bytes, checking the
+        image header as soon as it has arrived. Raises ImageRejectedError early.
+        """
+        announced = self.check_content_length(content_length, source=source)
+        # One growing buffer (amortized appends). An incomplete header is probed again only
+        # once the buffer has doubled, so small chunks don't re-copy and re-parse the head each time
+        body = bytearray()
+        header_checked = False
+        next_check = 0
+        try:
+            async for chunk in chunks:
+                body += chunk
+                if len(body) > self.max_bytes:
+                    raise self._reject("too_large", f"Image larger than {self.max_bytes} bytes: {source}")
+                if not header_checked and len(body) >= next_check:
+                    header_checked = self.check_header(bytes(body[:HEADER_PROBE_BYTES]))
+                    next_check = 2 * len(body)
+        except ImageRejectedError:
+            if announced is not None:
+                self.bytes_avoided += max(0, announced - len(body))
+            raise
+        data = bytes(body)
+        if not header_checked:
+            self.check_header(data, final=True)
+        return data
+
+    async def fetch(self, url: str, headers: Optional[Dict[str, str]] = None) -> bytes:
+        """
+        Stream url into memory and return the body. Raises ImageRejectedError as
+        soon as the body is known to be unacceptable, ImageFetchError on HTTP or
+        network errors.
+        """
+        self.start()
+        cached = await self._cache_call("lookup", url)
+        if cached is not None:
+            if cached["fresh"]:
+                return cached["data"]
+            # Stale: ask the server whether the stored copy is still current
+            headers = dict(headers or {})
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+        
+        self.requests += 1
+        try:
+            async with self._client.stream("GET", url, headers=headers) as response:
+                self._count_connection(response)
+                if response.status_code == 304 and cached is not None:
+                    await self._cache_call("refresh", url, response.headers)
+                    return cached["data"]
+                if response.status_code >= 400:
+                    raise ImageFetchError(f"HTTP {response.status_code} for {url}", status=response.status_code)
+                content_length = response.headers.get("content-length", "")
+                content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+                if content_type.startswith(REJECTED_CONTENT_TYPES):
+                    self.bytes_avoided += int(content_length) if content_length.isdigit() else 0
+                    raise self._reject("content_type", f"Not an image ({content_type}): {url}")
+                body = await self.read_body(response.aiter_bytes(), content_length, url)
+        except httpx.HTTPError as e:
+            self.failed += 1
+            raise ImageFetchError(f"Failed to download {url}: {e.__class__.__name__}: {e}") from e
+        except ImageFetchError:
+            self.failed += 1
+            raise
+        self.bytes_received += len(body)
+        await self._cache_call("store", url, body, response.headers)
+        return body
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "failed": self.failed,
+            "bytes_received": self.bytes_received,
+            "connections_opened": self.connections_opened,
+            "rejected": dict(self.rejected),
+            "bytes_avoided": self.bytes_avoided,
+            "cache_errors": self.cache_errors,
+            # Requests served over an already open keep-alive connection
+            "connection_reuse_rate": round(1 - self.connections_opened / self.requests, 4)
+            if self.requests else None,
+        }
@@ -1,6 +1,11 @@
 import os
+import asyncio
+import hmac
+import time
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from dotenv import load_dotenv
 import google.generativeai as genai
 from datetime import datetime
@@ -8,110 +13,221 @@ from pathlib import Path
 from threading import Lock
 from typing import Any, Dict, List, Optional
 import json
-import numpy as np
 from PIL import Image
 import io
 import base64
-import urllib.request
 import firebase_admin
 from firebase_admin import credentials, firestore
 
 from pydantic import BaseModel, Field
+from starlette.datastructures import UploadFile as StarletteUploadFile
+
+from .gemini_image import prepare_gemini_image
+from .image_cache import ImageDiskCache
+from .image_fetch import ImageFetcher, ImageFetchError, ImageRejectedError
+from .nsfw_batcher import NSFWBatcher
+from .nsfw_executor import InferenceBusyError, InferenceExecutor
+from .nsfw_registry import NSFWModelRegistry
+from .nsfw_triage import NSFW_TRIAGE, TRIAGE_REASONS
+from .single_flight import SingleFlight
+from .verdict_cache import PerceptualVerdictCache, VerdictCache, content_digest, dhash, normalize_image_url
+from .nsfw_model import (
+    NSFW_MODEL_PATH,
+    get_inference_worker_status,
+    init_inference_worker,
+    nsfw_buffer_pools,
+    nsfw_model_status as get_nsfw_model_status,
+    predict_nsfw,
+    predict_nsfw_batch,
+    predict_nsfw_frames,
+    decode_nsfw_images,
+    prepare_nsfw_image,
+    warm_up_nsfw_model,
+)
+
+load_dotenv()
 
 # --- NSFW Model Setup ---
-NSFW_MODEL = None
-# Model should be placed in: backend/app/models/sentry_content_filter.kiras
-NSFW_MODEL_PATH = Path(__file__).parent / "models" / "sentry_content_filter.kiras"
-
-def load_nsfw_model():
-    """Load the KIRAS NSFW detection model."""
-    global NSFW_MODEL
-    if NSFW_MODEL is None:
+# Load and warm the model at startup instead of on the first image request
+NSFW_PRELOAD = os.getenv("NSFW_PRELOAD", "true").lower() in ("1", "true", "yes")
+
+# Decode, resize and inference run on a dedicated executor, never on the event loop.
+# "thread" shares this process's model; "process" loads the model in every worker.
+NSFW_EXECUTOR = os.getenv("NSFW_EXECUTOR", "thread").lower()
+NSFW_EXECUTOR_WORKERS = int(os.getenv("NSFW_EXECUTOR_WORKERS", "2"))
+NSFW_EXECUTOR_MAX_PENDING = int(os.getenv("NSFW_EXECUTOR_MAX_PENDING", "64"))
+NSFW_EXECUTOR_QUEUE_TIMEOUT_MS = float(os.getenv("NSFW_EXECUTOR_QUEUE_TIMEOUT_MS", "250"))
+nsfw_executor = InferenceExecutor(
+    kind=NSFW_EXECUTOR,
+    workers=NSFW_EXECUTOR_WORKERS,
+    max_pending=NSFW_EXECUTOR_MAX_PENDING,
+    queue_timeout_ms=NSFW_EXECUTOR_QUEUE_TIMEOUT_MS,
+    initializer=init_inference_worker if NSFW_EXECUTOR == "process" else None,
+)
+# Readiness snapshot reported by a worker process (process executor only)
+nsfw_worker_status: Dict[str, Any] = {"loaded": False, "ready": False, "status": "not_loaded"}
+
+# Micro-batching: concurrent /analyze-image-nsfw requests share one forward pass
+NSFW_BATCHING = os.getenv("NSFW_BATCHING", "true").lower() in ("1", "true", "yes")
+NSFW_BATCH_WINDOW_MS = float(os.getenv("NSFW_BATCH_WINDOW_MS", "10"))
+NSFW_BATCH_MAX_SIZE = int(os.getenv("NSFW_BATCH_MAX_SIZE", "16"))
+nsfw_batcher = NSFWBatcher(
+    predict_nsfw_batch,
+    window_ms=NSFW_BATCH_WINDOW_MS,
+    max_batch_size=NSFW_BATCH_MAX_SIZE,
+    run=nsfw_executor.run,
+    # One batch per inference worker at a time
+    max_in_flight=NSFW_EXECUTOR_WORKERS,
+)
+
+# Hot-swappable model versions (see /nsfw-model/* endpoints). Admin endpoints are
+# disabled unless NSFW_ADMIN_TOKEN is set; callers send it as X-Admin-Token.
+NSFW_ADMIN_TOKEN = os.getenv("NSFW_ADMIN_TOKEN", "")
+nsfw_registry = NSFWModelRegistry(NSFW_MODEL_PATH.parent)
+_candidate_load_task: Optional[asyncio.Task] = None
+
+# Icons, tracking pixels, flat-colour chrome etc. settled before inference (app/nsfw_triage.py)
+nsfw_triage_stats = {"checked": 0, "triaged": 0, **{reason: 0 for reason in TRIAGE_REASONS}}
+
+# Two-model cascade (NSFW_SCREEN_* in nsfw_model.py): images decided by the tiny screening model
+nsfw_screen_stats = {"scored": 0, "screened": 0}
+# Animated GIF/WebP frame sampling (NSFW_ANIMATED_* in nsfw_model.py)
+nsfw_animated_stats = {"images": 0, "frames_sampled": 0, "frames_scored": 0, "early_stops": 0}
+
+# Perceptual-hash verdict cache: resized/recompressed copies of an image reuse its verdict
+NSFW_PHASH_CACHE = os.getenv("NSFW_PHASH_CACHE", "true").lower() in ("1", "true", "yes")
+nsfw_phash_cache = PerceptualVerdictCache(
+    capacity=int(os.getenv("NSFW_PHASH_CACHE_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("NSFW_PHASH_CACHE_TTL", "3600")),
+    max_distance=int(os.getenv("NSFW_PHASH_MAX_DISTANCE", "2")),
+)
+
+# Optional on-disk HTTP cache of downloaded image bytes (honours Cache-Control/ETag/Last-Modified),
+# shared by all workers pointing at the same directory
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")
+image_cache = ImageDiskCache(
+    Path(IMAGE_CACHE_DIR),
+    max_bytes=int(float(os.getenv("IMAGE_CACHE_MAX_MB", "256")) * 1024 * 1024),
+) if IMAGE_CACHE_DIR else None
+
+# Shared async HTTP client for image downloads: keep-alive connections pooled per host.
+# Bodies are streamed under IMAGE_MAX_BYTES and dropped early if the header shows a
+# non-image or more than IMAGE_MAX_PIXELS (base64 uploads get the same checks)
+image_fetcher = ImageFetcher(
+    connect_timeout=float(os.getenv("IMAGE_FETCH_CONNECT_TIMEOUT", "3")),
+    read_timeout=float(os.getenv("IMAGE_FETCH_READ_TIMEOUT", "10")),
+    max_connections=int(os.getenv("IMAGE_FETCH_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("IMAGE_FETCH_MAX_KEEPALIVE", "20")),
+    keepalive_seconds=float(os.getenv("IMAGE_FETCH_KEEPALIVE_SECONDS", "30")),
+    max_bytes=int(float(os.getenv("IMAGE_MAX_MB", "10")) * 1024 * 1024),
+    max_pixels=int(float(os.getenv("IMAGE_MAX_MEGAPIXELS", "40")) * 1_000_000),
+    cache=image_cache,
+)
+
+# Concurrent requests for the same image share one download (keyed by normalized URL)
+# and one analysis (keyed by content digest) instead of repeating the work
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+image_flights = SingleFlight(enabled=SINGLE_FLIGHT, kinds=("fetch", "analysis"))
+
+# Exact-match verdict cache shared by the image endpoints: keyed by normalized URL
+# (checked before downloading) and by SHA-256 of the image bytes (checked before inference)
+VERDICT_CACHE = os.getenv("VERDICT_CACHE", "true").lower() in ("1", "true", "yes")
+verdict_cache = VerdictCache(
+    max_bytes=int(float(os.getenv("VERDICT_CACHE_MAX_MB", "16")) * 1024 * 1024),
+    ttl_seconds=float(os.getenv("VERDICT_CACHE_TTL", "86400")),
+    # Optional SQLite file that evicted entries spill to, so verdicts survive restarts
+    disk_path=os.getenv("VERDICT_CACHE_DISK_PATH") or None,
+)
+# Evicted verdicts are written to the SQLite file in one batch this often (and at shutdown)
+VERDICT_CACHE_FLUSH_SECONDS = float(os.getenv("VERDICT_CACHE_FLUSH_SECONDS", "30"))
+
+
+async def _flush_verdict_cache_periodically() -> None:
+    while True:
+        await asyncio.sleep(VERDICT_CACHE_FLUSH_SECONDS)
         try:
-            import pickle
-            from tensorflow.keras import models
-            from tensorflow.keras.optimizers import Adam
-            
-            if NSFW_MODEL_PATH.exists():
-                print(f"📦 Loading NSFW model from: {NSFW_MODEL_PATH}")
-                with open(NSFW_MODEL_PATH, 'rb') as f:
-                    kiras_bundle = pickle.load(f)
-                
-                # Reconstruct the model
-                model = models.model_from_json(kiras_bundle["architecture"])
-                model.set_weights(kiras_bundle["weights"])
-                model.compile(
-                    optimizer=Adam(learning_rate=0.001),
-                    loss='categorical_crossentropy',
-                    metrics=['accuracy']
-                )
-                
-                metadata = kiras_bundle["metadata"]
-                class_indices = kiras_bundle["class_indices"]
-                idx_to_class = {v: k for k, v in class_indices.items()}
-                
-                NSFW_MODEL = {
-                    "model": model,
-                    "metadata": metadata,
-                    "class_indices": class_indices,
-                    "idx_to_class": idx_to_class
-                }
-                print(f"✅ NSFW model loaded! Classes: {metadata['classes']}")
-            else:
-                print(f"⚠️ NSFW model not found at: {NSFW_MODEL_PATH}")
+            await asyncio.to_thread(verdict_cache.flush)
         except Exception as e:
-            print(f"❌ Failed to load NSFW model: {e}")
-    return NSFW_MODEL
+            print(f"⚠️ Verdict cache flush failed: {e}")
+
+
+# Local-first cascade for /analyze-image: the NSFW model scores the image first and
+# only verdicts whose top-class confidence falls inside [BAND_LOW, BAND_HIGH) go on to Gemini
+IMAGE_CASCADE = os.getenv("IMAGE_CASCADE", "false").lower() in ("1", "true", "yes")
+IMAGE_CASCADE_BAND_LOW = float(os.getenv("IMAGE_CASCADE_BAND_LOW", "0.0"))
+IMAGE_CASCADE_BAND_HIGH = float(os.getenv("IMAGE_CASCADE_BAND_HIGH", "0.9"))
+# Triage outcomes that end an /analyze-image request without Gemini
+CASCADE_FINAL_TRIAGE = ("svg", "too_small")
+image_cascade_stats = {
+    "requests": 0,
+    "decided_local": 0,
+    "escalated_uncertain": 0,
+    "escalated_triaged": 0,
+    "escalated_unavailable": 0,
+    "gemini_calls": 0,
+}
+
+# Images sent to Gemini are shrunk to GEMINI_IMAGE_MAX_EDGE and re-encoded without metadata
+# (otherwise the SDK uploads a full-resolution lossless WebP)
+GEMINI_IMAGE_PREPARE = os.getenv("GEMINI_IMAGE_PREPARE", "true").lower() in ("1", "true", "yes")
+GEMINI_IMAGE_MAX_EDGE = int(os.getenv("GEMINI_IMAGE_MAX_EDGE", "1024"))
+GEMINI_IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "jpeg").lower()  # jpeg / webp
+GEMINI_IMAGE_QUALITY = int(os.getenv("GEMINI_IMAGE_QUALITY", "85"))
+gemini_image_stats = {
+    "calls": 0,
+    "prepared": 0,
+    "original_bytes": 0,
+    "sent_bytes": 0,
+    "prepare_ms": 0.0,
+    # Gemini round trips, split by whether the image was prepared, to compare the two
+    "gemini_ms_prepared": 0.0,
+    "gemini_ms_unprepared": 0.0,
+}
+
+
+def _url_verdict_key(namespace: str, image_url: Optional[str]) -> Optional[str]:
+    if not VERDICT_CACHE or not image_url:
+        return None
+    return f"{namespace}:url:{normalize_image_url(image_url)}"
+
 
-def predict_nsfw(img_array):
-    """Predict if an image is NSFW using the local model."""
-    model_data = load_nsfw_model()
-    if model_data is None:
+def _digest_verdict_key(namespace: str, image_data: bytes) -> Optional[str]:
+    if not VERDICT_CACHE:
         return None
-    
-    model = model_data["model"]
-    metadata = model_data["metadata"]
-    idx_to_class = model_data["idx_to_class"]
-    
-    # Ensure numpy array
-    if not isinstance(img_array, np.ndarray):
-        img_array = np.array(img_array)
-    
-    # Handle single image
-    if len(img_array.shape) == 3:
-        img_array = np.expand_dims(img_array, axis=0)
-    
-    # Resize if needed
-    target_h = metadata['img_height']
-    target_w = metadata['img_width']
-    if img_array.shape[1:3] != (target_h, target_w):
-        resized = []
-        for i in range(img_array.shape[0]):
-            img = Image.fromarray(img_array[i].astype('uint8'))
-            img = img.resize((target_w, target_h), Image.Resampling.LANCZOS)
-            resized.append(np.array(img))
-        img_array = np.array(resized)
-    
-    # Normalize
-    if np.max(img_array) > 1:
-        img_array = img_array.astype('float32') / 255.0
-    
-    # Predict
-    predictions = model.predict(img_array, verbose=0)
-    
-    predicted_idx = np.argmax(predictions[0])
-    predicted_class = idx_to_class[predicted_idx]
-    confidence = float(predictions[0][predicted_idx])
-    
-    return {
-        "class": predicted_class,
-        "confidence": confidence,
-        "is_safe": predicted_class == "safe",
-        "probabilities": {
-            idx_to_class[i]: float(predictions[0][i])
-            for i in range(len(predictions[0]))
-        }
-    }
+    return f"{namespace}:sha256:{content_digest(image_data)}"
+
+
+def _analysis_flight_key(namespace: str, image_data: bytes, digest_key: Optional[str]) -> Optional[str]:
+    if not SINGLE_FLIGHT:
+        return None
+    return digest_key or f"{namespace}:sha256:{content_digest(image_data)}"
+
+
+async def _download_image(image_url: str, headers: Dict[str, str]) -> bytes:
+    """Download through the shared client; concurrent requests for the same URL share one download."""
+    image_data, _ = await image_flights.run(
+        f"url:{normalize_image_url(image_url)}", lambda: image_fetcher.fetch(image_url, headers=headers), "fetch"
+    )
+    return image_data
+
+
+async def _cached_verdict(*keys: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Return the first cached response among keys, copying it to the keys that missed."""
+    keys = [key for key in keys if key]
+    for position, key in enumerate(keys):
+        cached = await verdict_cache.get(key)
+        if cached is not None:
+            for missed_key in keys[:position]:
+                verdict_cache.put(missed_key, cached)
+            return cached
+    return None
+
+
+def _remember_verdict(response: Dict[str, Any], *keys: Optional[str]) -> None:
+    for key in keys:
+        if key:
+            verdict_cache.put(key, response)
+
 
 # --- Load custom prompts ---
 try:
@@ -138,8 +254,6 @@ except FileNotFoundError:
     CHAT_PROMPT = "You are Sentry, a helpful AI assistant. Keep your responses concise and friendly."
 
 
-
-load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 if not GEMINI_API_KEY:
@@ -264,7 +378,54 @@ model = genai.GenerativeModel("gemini-2.5-flash", safety_settings=safety_setting
 # A separate model for chat without the strict safety overrides for general conversation
 chat_model = genai.GenerativeModel("gemini-2.5-flash")
 
-app = FastAPI()
+
+async def _wait_for_inference_workers(max_rounds: int = 20) -> None:
+    ready_pids = set()
+    worker_status = None
+    for _ in range(max_rounds):
+        statuses = await asyncio.gather(*[
+            nsfw_executor.run(get_inference_worker_status) for _ in range(NSFW_EXECUTOR_WORKERS)
+        ], return_exceptions=True)
+        for status in statuses:
+            if isinstance(status, dict) and status["ready"]:
+                ready_pids.add(status.pop("pid"))
+                worker_status = status
+            elif isinstance(status, BaseException):
+                print(f"⚠️ Inference worker status check failed: {status}")
+        if len(ready_pids) >= NSFW_EXECUTOR_WORKERS:
+            nsfw_worker_status.update(worker_status)
+            print(f"✅ All {NSFW_EXECUTOR_WORKERS} inference workers ready")
+            return
+    print(f"⚠️ Only {len(ready_pids)}/{NSFW_EXECUTOR_WORKERS} inference workers confirmed ready")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Load and warm the NSFW model before the server starts accepting requests."""
+    nsfw_executor.start()
+    image_fetcher.start()
+    if NSFW_EXECUTOR == "process":
+        # Each worker loads + warms its own model in its initializer. Ready only
+        # once every worker (distinct pid) has answered with a ready model.
+        await _wait_for_inference_workers()
+    elif NSFW_PRELOAD:
+        # Run in a worker thread so the TensorFlow import doesn't freeze the loop
+        await asyncio.to_thread(warm_up_nsfw_model)
+    if NSFW_BATCHING:
+        nsfw_batcher.start()
+    verdict_flusher = asyncio.create_task(_flush_verdict_cache_periodically()) if verdict_cache.disk_enabled else None
+    yield
+    if verdict_flusher is not None:
+        verdict_flusher.cancel()
+    await nsfw_batcher.stop()
+    nsfw_executor.shutdown()
+    await image_fetcher.close()
+    if image_cache is not None:
+        image_cache.close()
+    await asyncio.to_thread(verdict_cache.close)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -660,6 +821,89 @@ Return ONLY the JSON array, nothing else. Format: [{{"safe":...}}, {{"safe":...}
         print(f"Batch endpoint error: {e}")
         raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
 
+
+async def _analyze_image_content(image_data: bytes, context: str, *cache_keys: Optional[str]) -> Dict[str, Any]:
+    """Verdict for downloaded image bytes: the local cascade stage, then Gemini."""
+    # Cascade: confident local verdicts are final, only uncertain images reach Gemini
+    if IMAGE_CASCADE:
+        local_response = await _local_image_verdict(image_data)
+        if local_response is not None:
+            _remember_verdict(local_response, *cache_keys)
+            return local_response
+    
+    prepared = None
+    if GEMINI_IMAGE_PREPARE:
+        # Decode + shrink + re-encode off the event loop; the SDK sends the blob as is
+        prepared = await asyncio.to_thread(
+            prepare_gemini_image, image_data, GEMINI_IMAGE_MAX_EDGE, GEMINI_IMAGE_FORMAT, GEMINI_IMAGE_QUALITY
+        )
+        image = prepared["blob"]
+    else:
+        # Open with PIL
+        image = Image.open(io.BytesIO(image_data))
+    
+    # Create prompt for image analysis
+    analysis_prompt = f"""Analyze this image for inappropriate content. Consider the following context if provided: {context}
+
+Determine if the image contains:
+- Explicit sexual content or nudity
+- Violence, gore, or disturbing imagery
+- Self-harm or suicide-related content
+- Hate symbols or offensive imagery
+- Drug use or alcohol promotion
+- Scams or phishing attempts
+
+Respond in JSON format:
+{{
+  "safe": true/false,
+  "title": "Brief title",
+  "reason": "2-3 sentences explaining what you found (no vulgar words)",
+  "what_to_do": "1-2 sentences of gentle guidance",
+  "category": "explicit_content/violence/hate_speech/self_harm/alcohol_drugs/scam/safe",
+  "confidence": 0-100
+}}
+
+Be strict but not overly sensitive. Only flag genuinely inappropriate content."""
+
+    # Use Gemini to analyze the image
+    image_cascade_stats["gemini_calls"] += 1
+    started = time.perf_counter()
+    response = model.generate_content([analysis_prompt, image])
+    _count_gemini_image(prepared, (time.perf_counter() - started) * 1000)
+    
+    if hasattr(response, 'text') and response.text:
+        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "").strip()
+        parsed_response = json.loads(cleaned_response_text)
+        parsed_response["stage"] = "gemini"
+        _remember_verdict(parsed_response, *cache_keys)
+        return parsed_response
+    else:
+        # Default safe response if AI doesn't respond
+        return {
+            "safe": True,
+            "title": "Content Appears Safe",
+            "reason": "We couldn't fully analyze this image, but no obvious issues were detected.",
+            "what_to_do": "You can proceed, but use your judgment.",
+            "category": "safe",
+            "confidence": 50
+        }
+
+
+def _count_gemini_image(prepared: Optional[Dict[str, Any]], gemini_ms: float) -> None:
+    gemini_image_stats["calls"] += 1
+    if prepared is None:
+        gemini_image_stats["gemini_ms_unprepared"] += gemini_ms
+        return
+    gemini_image_stats["prepared"] += 1
+    gemini_image_stats["original_bytes"] += prepared["original_bytes"]
+    gemini_image_stats["sent_bytes"] += prepared["sent_bytes"]
+    gemini_image_stats["prepare_ms"] += prepared["prepare_ms"]
+    gemini_image_stats["gemini_ms_prepared"] += gemini_ms
+    print(f"🖼️ Gemini image: {prepared['original_size']} {prepared['original_bytes'] // 1024} KB -> "
+          f"{prepared['sent_size']} {prepared['sent_bytes'] // 1024} KB, "
+          f"prepared in {prepared['prepare_ms']:.0f} ms, Gemini {gemini_ms:.0f} ms")
+
+
 @app.post("/analyze-image")
 async def analyze_image(request: Request):
     """
@@ -675,15 +919,18 @@ async def analyze_image(request: Request):
     if not image_url:
         raise HTTPException(status_code=400, detail="Image URL is required")
     
+    # Gemini verdicts depend on the surrounding text too, so it is part of the cache namespace
+    cache_namespace = f"gemini:{content_digest(context.encode('utf-8'))[:16]}"
+    url_key = _url_verdict_key(cache_namespace, image_url)
+    cached = await _cached_verdict(url_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
     try:
         # Use Gemini's multimodal capabilities to analyze the image
         # Gemini 2.5 Flash supports image input
         
         # Download the image (with timeout)
-        import urllib.request
-        from io import BytesIO
-        from PIL import Image
-        
         try:
             # Download image with timeout and better headers for Instagram/Facebook
             headers = {
@@ -698,56 +945,25 @@ async def analyze_image(request: Request):
                 'Sec-Fetch-Mode': 'no-cors',
                 'Sec-Fetch-Site': 'cross-site'
             }
-            req = urllib.request.Request(image_url, headers=headers)
-            with urllib.request.urlopen(req, timeout=10) as response:
-                image_data = response.read()
+            image_data = await _download_image(image_url, headers)
             
-            # Open with PIL
-            image = Image.open(BytesIO(image_data))
+            digest_key = _digest_verdict_key(cache_namespace, image_data)
+            cached = await _cached_verdict(digest_key, url_key)
+            if cached is not None:
+                return {**cached, "cached": True}
             
-            # Create prompt for image analysis
-            analysis_prompt = f"""Analyze this image for inappropriate content. Consider the following context if provided: {context}
-
-Determine if the image contains:
-- Explicit sexual content or nudity
-- Violence, gore, or disturbing imagery
-- Self-harm or suicide-related content
-- Hate symbols or offensive imagery
-- Drug use or alcohol promotion
-- Scams or phishing attempts
-
-Respond in JSON format:
-{{
-  "safe": true/false,
-  "title": "Brief title",
-  "reason": "2-3 sentences explaining what you found (no vulgar words)",
-  "what_to_do": "1-2 sentences of gentle guidance",
-  "category": "explicit_content/violence/hate_speech/self_harm/alcohol_drugs/scam/safe",
-  "confidence": 0-100
-}}
-
-Be strict but not overly sensitive. Only flag genuinely inappropriate content."""
-
-            # Use Gemini to analyze the image
-            response = model.generate_content([analysis_prompt, image])
+            # Concurrent requests for the same image (and context) share one analysis
+            response, shared = await image_flights.run(
+                _analysis_flight_key(cache_namespace, image_data, digest_key),
+                lambda: _analyze_image_content(image_data, context, url_key, digest_key),
+                "analysis",
+            )
+            if shared:
+                print("🔁 Joined an in-flight analysis of the same image")
+            return response
             
-            if hasattr(response, 'text') and response.text:
-                cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "").strip()
-                parsed_response = json.loads(cleaned_response_text)
-                return parsed_response
-            else:
-                # Default safe response if AI doesn't respond
-                return {
-                    "safe": True,
-                    "title": "Content Appears Safe",
-                    "reason": "We couldn't fully analyze this image, but no obvious issues were detected.",
-                    "what_to_do": "You can proceed, but use your judgment.",
-                    "category": "safe",
-                    "confidence": 50
-                }
-                
-        except urllib.error.HTTPError as e:
-            print(f"Failed to download image (HTTP {e.code}): {image_url}")
+        except ImageFetchError as e:
+            print(f"Failed to download image: {e}")
             # Can't download image - return error so frontend can use context analysis
             return {
                 "safe": True,
@@ -1051,6 +1267,267 @@ class NSFWAnalysisRequest(BaseModel):
     image_base64: Optional[str] = Field(None, description="Base64-encoded image data (e.g., data:image/jpeg;base64,/9j/4AAQ...)")
 
 
+class NSFWBatchAnalysisRequest(BaseModel):
+    """Request model for analyzing several images in one call."""
+    images: List[NSFWAnalysisRequest] = Field(..., description="Images to analyze, each with image_url or image_base64")
+
+
+MAX_NSFW_BATCH_IMAGES = 50
+
+
+def _clean_image_input(value: Optional[str]) -> Optional[str]:
+    """Treat empty/default strings from Swagger UI as missing."""
+    if value and value.strip() in ["", "string"]:
+        return None
+    return value
+
+
+async def _fetch_image_bytes(image_url: Optional[str], image_base64: Optional[str]) -> bytes:
+    """Get the encoded image bytes from base64 data or by downloading the URL."""
+    if image_base64 and image_base64.startswith("data:"):
+        # Handle base64 image (must start with data: prefix)
+        if ',' in image_base64:
+            image_base64 = image_base64.split(',')[1]
+        return image_fetcher.check_bytes(base64.b64decode(image_base64))
+    elif image_base64 and len(image_base64) > 100:
+        # Raw base64 without data: prefix (long string = likely base64)
+        return image_fetcher.check_bytes(base64.b64decode(image_base64))
+    elif image_url:
+        # Download from URL
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+            'Accept': 'image/*,*/*;q=0.8',
+        }
+        return await _download_image(image_url, headers)
+    else:
+        raise ValueError("Valid image_url or image_base64 is required")
+
+
+def _format_nsfw_response(result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Format a predict_nsfw result to match the extension's expected format."""
+    if result is None:
+        # Model not loaded, fall back to safe
+        return {
+            "safe": True,
+            "title": "Model Not Available",
+            "reason": "NSFW detection model is not loaded.",
+            "what_to_do": "Proceed with caution.",
+            "category": "error",
+            "confidence": 0
+        }
+    
+    is_safe = result["is_safe"]
+    confidence = result["confidence"] * 100
+    
+    if is_safe:
+        response = {
+            "safe": True,
+            "title": "Image Appears Safe",
+            "reason": f"This image was classified as safe with {confidence:.1f}% confidence.",
+            "what_to_do": "No action needed.",
+            "category": "safe",
+            "confidence": round(confidence),
+            "class": result["class"],
+            "probabilities": result["probabilities"]
+        }
+    else:
+        response = {
+            "safe": False,
+            "title": "Inappropriate Image Detected",
+            "reason": f"This image has been flagged as potentially inappropriate with {confidence:.1f}% confidence.",
+            "what_to_do": "Click to view if you're certain you want to proceed.",
+            "category": "explicit_content",
+            "confidence": round(confidence),
+            "class": result["class"],
+            "probabilities": result["probabilities"]
+        }
+    if "frames" in result:
+        response["frames"] = result["frames"]
+    return response
+
+
+def _count_animated(result: Optional[Dict[str, Any]]) -> None:
+    if result is not None and "frames" in result:
+        frames = result["frames"]
+        nsfw_animated_stats["images"] += 1
+        nsfw_animated_stats["frames_sampled"] += frames["sampled"]
+        nsfw_animated_stats["frames_scored"] += frames["scored"]
+        nsfw_animated_stats["early_stops"] += int(frames["scored"] < frames["sampled"])
+
+
+def _count_screening(result: Optional[Dict[str, Any]]) -> None:
+    if result is not None and "screened" in result:
+        nsfw_screen_stats["scored"] += 1
+        nsfw_screen_stats["screened"] += int(result["screened"])
+
+
+def _count_triage(outcome: Dict[str, Any]) -> None:
+    if not NSFW_TRIAGE or "error" in outcome:
+        return
+    nsfw_triage_stats["checked"] += 1
+    if "triaged" in outcome:
+        nsfw_triage_stats["triaged"] += 1
+        nsfw_triage_stats[outcome["triaged"]] += 1
+
+
+async def _score_nsfw_image(image_data: bytes):
+    """
+    Triage, decode and score one image with the local model. Returns
+    (result, source): source "model" or "perceptual_cache" with a predict_nsfw
+    result (None if the model isn't loaded), or "triage" with {"triaged": reason}.
+    """
+    # Triage + decode + resize on the inference executor
+    outcome = await nsfw_executor.run(prepare_nsfw_image, image_data, NSFW_TRIAGE)
+    _count_triage(outcome)
+    if "triaged" in outcome:
+        return outcome, "triage"
+    if "frames" in outcome:
+        # Animated: worst frame wins. The perceptual cache (one frame's hash) and the batcher are skipped
+        result = await nsfw_executor.run(predict_nsfw_frames, outcome["frames"], outcome["frame_indices"])
+        _count_animated(result)
+        _count_screening(result)
+        return result, "model"
+    img_array = outcome["array"]
+    
+    # Near-identical images we've already scored reuse the cached verdict
+    image_hash = dhash(img_array) if NSFW_PHASH_CACHE else None
+    result = nsfw_phash_cache.get(image_hash) if image_hash is not None else None
+    if result is not None:
+        return result, "perceptual_cache"
+    
+    # Run NSFW prediction (batched with other concurrent requests when enabled)
+    if NSFW_BATCHING:
+        result = await nsfw_batcher.submit(img_array)
+    else:
+        result = await nsfw_executor.run(predict_nsfw, img_array)
+    
+    _count_screening(result)
+    if result is not None and image_hash is not None:
+        nsfw_phash_cache.put(image_hash, result)
+    return result, "model"
+
+
+async def _local_image_verdict(image_data: bytes) -> Optional[Dict[str, Any]]:
+    """
+    First stage of the /analyze-image cascade: the local model's verdict when
+    it is confident, or None to escalate the image to Gemini.
+    """
+    image_cascade_stats["requests"] += 1
+    try:
+        result, source = await _score_nsfw_image(image_data)
+    except Exception as e:
+        print(f"⚠️ Local image stage failed, escalating to Gemini: {e}")
+        image_cascade_stats["escalated_unavailable"] += 1
+        return None
+    
+    if source == "triage":
+        # Triage only rules out explicit content; a flat or skin-free image can still be
+        # a scam, violence or hate symbols. Only icons and pixels are final here
+        if result["triaged"] in CASCADE_FINAL_TRIAGE:
+            image_cascade_stats["decided_local"] += 1
+            return {**_triaged_nsfw_response(result["triaged"]), "stage": "local"}
+        print(f"🔀 Image triaged as {result['triaged']}, escalating to Gemini")
+        image_cascade_stats["escalated_triaged"] += 1
+        return None
+    if result is None:
+        image_cascade_stats["escalated_unavailable"] += 1
+        return None
+    if IMAGE_CASCADE_BAND_LOW <= result["confidence"] < IMAGE_CASCADE_BAND_HIGH:
+        print(f"🔀 Local verdict uncertain ({result['class']} {result['confidence']:.2f}), escalating to Gemini")
+        image_cascade_stats["escalated_uncertain"] += 1
+        return None
+    
+    image_cascade_stats["decided_local"] += 1
+    return {**_format_nsfw_response(result), "stage": "local"}
+
+
+_TRIAGE_DESCRIPTIONS = {
+    "svg": "This is a vector graphic (icon or sprite).",
+    "too_small": "This image is too small to contain meaningful content (icon or tracking pixel).",
+    "uniform": "This image is a flat colour with no visible content.",
+    "low_skin": "This image contains almost no skin tones.",
+}
+
+
+def _triaged_nsfw_response(reason: str) -> Dict[str, Any]:
+    """Response for an image settled by triage, without running the model."""
+    return {
+        "safe": True,
+        "title": "Image Appears Safe",
+        "reason": f"{_TRIAGE_DESCRIPTIONS[reason]} It was not sent to the model.",
+        "what_to_do": "No action needed.",
+        "category": "safe",
+        # Size/shape checks are certain; the skin-tone check is a heuristic
+        "confidence": 90 if reason == "low_skin" else 100,
+        "triaged": reason,
+    }
+
+
+def _nsfw_error_response(error: BaseException) -> Dict[str, Any]:
+    """Error response used when an image can't be downloaded or analyzed."""
+    if isinstance(error, ImageRejectedError):
+        return {
+            "safe": True,
+            "title": "Image Not Analyzed",
+            "reason": "The image is too large or not a supported image format.",
+            "what_to_do": "Proceed with caution.",
+            "category": "error",
+            "confidence": 0,
+            "rejected": error.reason
+        }
+    if isinstance(error, ImageFetchError):
+        return {
+            "safe": True,
+            "title": "Image Not Accessible",
+            "reason": "Could not download the image for analysis.",
+            "what_to_do": "Proceed with caution.",
+            "category": "error",
+            "confidence": 0
+        }
+    return {
+        "safe": True,
+        "title": "Analysis Error",
+        "reason": f"Error analyzing image: {str(error)}",
+        "what_to_do": "Proceed with your own judgment.",
+        "category": "error",
+        "confidence": 0
+    }
+
+
+async def _analyze_nsfw_bytes(image_data: bytes, url_key: Optional[str] = None) -> Dict[str, Any]:
+    """Verdict for encoded image bytes with the local model (shared by the JSON and the upload endpoint)."""
+    # Same bytes seen before (under any URL, as base64 or uploaded): skip decode and inference
+    digest_key = _digest_verdict_key("nsfw", image_data)
+    cached = await _cached_verdict(digest_key, url_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
+    # Concurrent requests for the same bytes share one triage + inference
+    (result, source), shared = await image_flights.run(
+        _analysis_flight_key("nsfw", image_data, digest_key), lambda: _score_nsfw_image(image_data), "analysis"
+    )
+    if shared:
+        print("🔁 Joined an in-flight analysis of the same image")
+    if source == "triage":
+        print(f"📊 NSFW Result (triaged): {result['triaged']}")
+        response = _triaged_nsfw_response(result["triaged"])
+        _remember_verdict(response, url_key, digest_key)
+        return response
+    if source == "perceptual_cache":
+        print(f"📊 NSFW Result (perceptual cache): {result}")
+        response = _format_nsfw_response(result)
+        _remember_verdict(response, url_key, digest_key)
+        return {**response, "cached": True}
+    
+    # Log the raw result
+    print(f"📊 NSFW Result: {result}")
+    
+    response = _format_nsfw_response(result)
+    if result is not None:
+        _remember_verdict(response, url_key, digest_key)
+    return response
+
+
 @app.post("/analyze-image-nsfw")
 async def analyze_image_nsfw(request_data: NSFWAnalysisRequest):
     """
@@ -1061,130 +1538,365 @@ async def analyze_image_nsfw(request_data: NSFWAnalysisRequest):
     
     Returns: { "safe": bool, "class": str, "confidence": float, "probabilities": {...} }
     """
-    image_url = request_data.image_url
-    image_base64 = request_data.image_base64
-    
-    # Clean up empty/default strings from Swagger UI
-    if image_url and image_url.strip() in ["", "string"]:
-        image_url = None
-    if image_base64 and image_base64.strip() in ["", "string"]:
-        image_base64 = None
+    image_url = _clean_image_input(request_data.image_url)
+    image_base64 = _clean_image_input(request_data.image_base64)
     
     if not image_url and not image_base64:
         raise HTTPException(status_code=400, detail="image_url or image_base64 is required")
     
+    # Known URL: answer before downloading anything
+    url_key = _url_verdict_key("nsfw", image_url) if not image_base64 else None
+    cached = await _cached_verdict(url_key)
+    if cached is not None:
+        return {**cached, "cached": True}
+    
     try:
-        # Load image from URL or base64
-        if image_base64 and image_base64.startswith("data:"):
-            # Handle base64 image (must start with data: prefix)
-            if ',' in image_base64:
-                image_base64 = image_base64.split(',')[1]
-            img_bytes = base64.b64decode(image_base64)
-            img = Image.open(io.BytesIO(img_bytes))
-        elif image_base64 and len(image_base64) > 100:
-            # Raw base64 without data: prefix (long string = likely base64)
-            img_bytes = base64.b64decode(image_base64)
-            img = Image.open(io.BytesIO(img_bytes))
-        elif image_url:
-            # Download from URL
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'image/*,*/*;q=0.8',
-            }
-            req = urllib.request.Request(image_url, headers=headers)
-            with urllib.request.urlopen(req, timeout=10) as response:
-                image_data = response.read()
-            img = Image.open(io.BytesIO(image_data))
-        else:
-            raise HTTPException(status_code=400, detail="Valid image_url or image_base64 is required")
-        
-        # Convert to RGB if necessary
-        if img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Log image info for debugging
-        print(f"🔍 NSFW Analysis - Image size: {img.size}, mode: {img.mode}")
+        # Load image from URL (pooled async download) or base64
+        image_data = await _fetch_image_bytes(image_url, image_base64)
         
-        # Run NSFW prediction
-        result = predict_nsfw(np.array(img))
-        
-        # Log the raw result
-        print(f"📊 NSFW Result: {result}")
-        
-        if result is None:
-            # Model not loaded, fall back to safe
-            return {
-                "safe": True,
-                "title": "Model Not Available",
-                "reason": "NSFW detection model is not loaded.",
-                "what_to_do": "Proceed with caution.",
-                "category": "error",
-                "confidence": 0
-            }
-        
-        # Format response to match extension's expected format
-        is_safe = result["is_safe"]
-        confidence = result["confidence"] * 100
-        
-        if is_safe:
-            return {
-                "safe": True,
-                "title": "Image Appears Safe",
-                "reason": f"This image was classified as safe with {confidence:.1f}% confidence.",
-                "what_to_do": "No action needed.",
-                "category": "safe",
-                "confidence": round(confidence),
-                "class": result["class"],
-                "probabilities": result["probabilities"]
-            }
-        else:
-            return {
-                "safe": False,
-                "title": "Inappropriate Image Detected",
-                "reason": f"This image has been flagged as potentially inappropriate with {confidence:.1f}% confidence.",
-                "what_to_do": "Click to view if you're certain you want to proceed.",
-                "category": "explicit_content",
-                "confidence": round(confidence),
-                "class": result["class"],
-                "probabilities": result["probabilities"]
-            }
+        return await _analyze_nsfw_bytes(image_data, url_key)
             
-    except urllib.error.HTTPError as e:
+    except InferenceBusyError as e:
+        print(f"⚠️ NSFW analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ImageFetchError as e:
         print(f"Failed to download image: {e}")
-        return {
-            "safe": True,
-            "title": "Image Not Accessible",
-            "reason": "Could not download the image for analysis.",
-            "what_to_do": "Proceed with caution.",
-            "category": "error",
-            "confidence": 0
-        }
+        return _nsfw_error_response(e)
     except Exception as e:
         print(f"Error in NSFW analysis: {e}")
         import traceback
         traceback.print_exc()
-        return {
-            "safe": True,
-            "title": "Analysis Error",
-            "reason": f"Error analyzing image: {str(e)}",
-            "what_to_do": "Proceed with your own judgment.",
-            "category": "error",
-            "confidence": 0
-        }
+        return _nsfw_error_response(e)
+
+
+# Multipart framing allowance on top of IMAGE_MAX_MB
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+async def _read_multipart_image(request: Request) -> bytes:
+    """Bytes of the "image" file field (or the only file) of a multipart upload."""
+    # Don't let the form parser spool an oversized upload to disk first
+    image_fetcher.check_content_length(request.headers.get("content-length", ""), MULTIPART_OVERHEAD_BYTES)
+    form = await request.form(max_files=1)
+    try:
+        upload = form.get("image")
+        if not isinstance(upload, StarletteUploadFile):
+            upload = next((value for value in form.values() if isinstance(value, StarletteUploadFile)), None)
+        if upload is None:
+            raise HTTPException(status_code=400, detail='multipart upload needs an image file in the "image" field')
+        return image_fetcher.check_bytes(await upload.read())
+    finally:
+        await form.close()
+
+
+@app.post("/analyze-image-nsfw/upload")
+async def analyze_image_nsfw_upload(request: Request):
+    """
+    Same as /analyze-image-nsfw for an image sent as binary: the raw bytes as the
+    body (application/octet-stream or image/*), or a multipart/form-data file in
+    the "image" field. No base64 (33% larger) to encode on the client or decode here.
+
+    Returns: { "safe": bool, "class": str, "confidence": float, "probabilities": {...} }
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    multipart = content_type == "multipart/form-data"
+    raw = content_type in ("", "application/octet-stream") or content_type.startswith("image/")
+    if not multipart and not raw:
+        raise HTTPException(
+            status_code=415, detail="Send the image as application/octet-stream, image/* or multipart/form-data"
+        )
+
+    try:
+        if multipart:
+            image_data = await _read_multipart_image(request)
+        else:
+            # Streamed under IMAGE_MAX_MB; non-images are rejected after the first chunks
+            image_data = await image_fetcher.read_body(request.stream(), request.headers.get("content-length", ""))
+
+        return await _analyze_nsfw_bytes(image_data)
+
+    except InferenceBusyError as e:
+        print(f"⚠️ NSFW analysis rejected: {e}")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except ImageFetchError as e:
+        print(f"Rejected image upload: {e}")
+        return _nsfw_error_response(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in NSFW analysis: {e}")
+        import traceback
+        traceback.print_exc()
+        return _nsfw_error_response(e)
+
+
+@app.post("/analyze-images-nsfw")
+async def analyze_images_nsfw(request_data: NSFWBatchAnalysisRequest):
+    """
+    Analyzes a whole set of images with the LOCAL KIRAS NSFW model in ONE call.
+    Images are downloaded/decoded concurrently and scored with a single batched prediction.
+    
+    Expects: { "images": [{ "image_url": "https://..." }, { "image_base64": "data:image/..." }, ...] }
+    Returns: { "results": [{ "index": 0, "safe": bool, ... }, ...] } in input order.
+    Images that fail to load get their own error result instead of failing the whole batch.
+    """
+    items = request_data.images
+    
+    if len(items) == 0:
+        return {"results": []}
+    
+    if len(items) > MAX_NSFW_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"Maximum {MAX_NSFW_BATCH_IMAGES} images per batch")
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    
+    # Known URLs are answered before downloading anything
+    to_fetch = []
+    for index, item in enumerate(items):
+        image_url = _clean_image_input(item.image_url)
+        image_base64 = _clean_image_input(item.image_base64)
+        url_key = _url_verdict_key("nsfw", image_url) if not image_base64 else None
+        cached = await _cached_verdict(url_key)
+        if cached is not None:
+            results[index] = {"index": index, **cached, "cached": True}
+        else:
+            to_fetch.append((index, image_url, image_base64, url_key))
+    
+    # Fetch the rest concurrently
+    fetched = await asyncio.gather(*[
+        _fetch_image_bytes(image_url, image_base64)
+        for _, image_url, image_base64, _ in to_fetch
+    ], return_exceptions=True)
+    
+    to_score = []
+    for (index, _, _, url_key), image_data in zip(to_fetch, fetched):
+        if isinstance(image_data, BaseException):
+            print(f"Failed to load image {index} in batch: {image_data}")
+            results[index] = {"index": index, **_nsfw_error_response(image_data), "error": str(image_data)}
+            continue
+        digest_key = _digest_verdict_key("nsfw", image_data)
+        cached = await _cached_verdict(digest_key, url_key)
+        if cached is not None:
+            results[index] = {"index": index, **cached, "cached": True}
+        else:
+            to_score.append((index, image_data, (url_key, digest_key)))
+    
+    scored = 0
+    if to_score:
+        try:
+            # Triage + decode everything in one executor task
+            decoded = await nsfw_executor.run(
+                decode_nsfw_images, [image_data for _, image_data, _ in to_score], NSFW_TRIAGE
+            )
+            
+            to_predict = []
+            to_animate = []
+            for (index, _, cache_keys), outcome in zip(to_score, decoded):
+                _count_triage(outcome)
+                if "error" in outcome:
+                    error = ValueError(outcome["error"])
+                    results[index] = {"index": index, **_nsfw_error_response(error), "error": outcome["error"]}
+                    continue
+                if "triaged" in outcome:
+                    response = _triaged_nsfw_response(outcome["triaged"])
+                    _remember_verdict(response, *cache_keys)
+                    results[index] = {"index": index, **response}
+                    continue
+                if "frames" in outcome:
+                    to_animate.append((index, outcome, None, cache_keys))
+                    continue
+                image_hash = dhash(outcome["array"]) if NSFW_PHASH_CACHE else None
+                cached = nsfw_phash_cache.get(image_hash) if image_hash is not None else None
+                if cached is not None:
+                    response = _format_nsfw_response(cached)
+                    _remember_verdict(response, *cache_keys)
+                    results[index] = {"index": index, **response, "cached": True}
+                else:
+                    to_predict.append((index, outcome["array"], image_hash, cache_keys))
+            
+            # One batched prediction for everything the cache didn't answer
+            predictions = []
+            if to_predict:
+                predictions = await nsfw_executor.run(predict_nsfw_batch, [array for _, array, _, _ in to_predict])
+                if predictions is None:
+                    predictions = [None] * len(to_predict)
+            # Animated images are scored chunk by chunk with early stopping, one executor task each
+            if to_animate:
+                predictions = list(predictions) + list(await asyncio.gather(*[
+                    nsfw_executor.run(predict_nsfw_frames, outcome["frames"], outcome["frame_indices"])
+                    for _, outcome, _, _ in to_animate
+                ]))
+            if predictions:
+                for (index, _, image_hash, cache_keys), prediction in zip(to_predict + to_animate, predictions):
+                    _count_animated(prediction)
+                    _count_screening(prediction)
+                    response = _format_nsfw_response(prediction)
+                    if prediction is not None:
+                        if image_hash is not None:
+                            nsfw_phash_cache.put(image_hash, prediction)
+                        _remember_verdict(response, *cache_keys)
+                    results[index] = {"index": index, **response}
+                scored = len(predictions)
+        except InferenceBusyError as e:
+            print(f"⚠️ NSFW batch rejected: {e}")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except Exception as e:
+            print(f"Error in batched NSFW analysis: {e}")
+            for index, _, _ in to_score:
+                if results[index] is None:
+                    results[index] = {"index": index, **_nsfw_error_response(e), "error": str(e)}
+    
+    print(f"📊 NSFW batch analyzed: {scored}/{len(items)} images scored by the model")
+    return {"results": results}
 
 
 @app.get("/nsfw-model-status")
 async def nsfw_model_status():
-    """Check if the NSFW model is loaded and ready."""
-    model_data = load_nsfw_model()
-    if model_data:
-        return {
-            "loaded": True,
-            "model_name": model_data["metadata"]["model_name"],
-            "version": model_data["metadata"]["version"],
-            "classes": model_data["metadata"]["classes"]
-        }
-    return {"loaded": False}
+    """
+    Readiness probe for the NSFW model.
+    Returns 200 once the model is loaded and warmed up, 503 otherwise, so a
+    load balancer can hold back image traffic until this worker is ready.
+    """
+    if NSFW_EXECUTOR == "process":
+        status = dict(nsfw_worker_status)
+    else:
+        status = get_nsfw_model_status()
+    if not status["ready"]:
+        return JSONResponse(status_code=503, content=status)
+    return status
+
+
+@app.get("/nsfw-metrics")
+async def nsfw_metrics():
+    """Runtime metrics for the NSFW inference path (batch sizes, queue wait, latency)."""
+    return {
+        "executor": nsfw_executor.metrics(),
+        "batching": {"enabled": NSFW_BATCHING, **nsfw_batcher.metrics()},
+        # Pools of the API process; with NSFW_EXECUTOR=process each worker keeps its own
+        "input_buffers": nsfw_buffer_pools.metrics(),
+        "perceptual_cache": {"enabled": NSFW_PHASH_CACHE, **nsfw_phash_cache.metrics()},
+        "verdict_cache": {"enabled": VERDICT_CACHE, **verdict_cache.metrics()},
+        "image_fetch": image_fetcher.metrics(),
+        "image_cache": {"enabled": image_cache is not None, **(image_cache.metrics() if image_cache else {})},
+        # Duplicate downloads/analyses avoided by joining an in-flight request
+        "single_flight": image_flights.metrics(),
+        "triage": {
+            "enabled": NSFW_TRIAGE,
+            **nsfw_triage_stats,
+            # Share of decoded images that never reached the model
+            "avoided_rate": round(nsfw_triage_stats["triaged"] / nsfw_triage_stats["checked"], 4)
+            if nsfw_triage_stats["checked"] else None,
+        },
+        "animated": {
+            **nsfw_animated_stats,
+            # Sampled frames the early stop saved from the model
+            "frames_skipped_rate": round(1 - nsfw_animated_stats["frames_scored"] / nsfw_animated_stats["frames_sampled"], 4)
+            if nsfw_animated_stats["frames_sampled"] else None,
+        },
+        "screening": {
+            **nsfw_screen_stats,
+            # Share of model-scored images the full model no longer has to see
+            "screened_rate": round(nsfw_screen_stats["screened"] / nsfw_screen_stats["scored"], 4)
+            if nsfw_screen_stats["scored"] else None,
+        },
+        "gemini_images": _gemini_image_metrics(),
+        "image_cascade": {
+            "enabled": IMAGE_CASCADE,
+            "band": [IMAGE_CASCADE_BAND_LOW, IMAGE_CASCADE_BAND_HIGH],
+            **image_cascade_stats,
+            # Share of cascade traffic Gemini no longer has to see
+            "local_rate": round(image_cascade_stats["decided_local"] / image_cascade_stats["requests"], 4)
+            if image_cascade_stats["requests"] else None,
+        },
+    }
+
+
+def _gemini_image_metrics() -> Dict[str, Any]:
+    stats = gemini_image_stats
+    prepared, unprepared = stats["prepared"], stats["calls"] - stats["prepared"]
+    return {
+        "enabled": GEMINI_IMAGE_PREPARE,
+        "max_edge": GEMINI_IMAGE_MAX_EDGE,
+        "format": GEMINI_IMAGE_FORMAT,
+        "quality": GEMINI_IMAGE_QUALITY,
+        "calls": stats["calls"],
+        "prepared": prepared,
+        "original_bytes": stats["original_bytes"],
+        "sent_bytes": stats["sent_bytes"],
+        "bytes_saved": stats["original_bytes"] - stats["sent_bytes"],
+        "saved_rate": round(1 - stats["sent_bytes"] / stats["original_bytes"], 4) if stats["original_bytes"] else None,
+        "avg_prepare_ms": round(stats["prepare_ms"] / prepared, 2) if prepared else None,
+        "avg_gemini_ms_prepared": round(stats["gemini_ms_prepared"] / prepared, 1) if prepared else None,
+        "avg_gemini_ms_unprepared": round(stats["gemini_ms_unprepared"] / unprepared, 1) if unprepared else None,
+    }
+
+
+class NSFWCandidateRequest(BaseModel):
+    """Request model for loading a candidate NSFW model."""
+    path: str = Field(..., description="Model file inside app/models (.weights.json or .kiras)")
+    shadow_rate: float = Field(0.0, ge=0.0, le=1.0, description="Share of live batches also scored by the candidate")
+
+
+def _require_model_admin(request: Request) -> None:
+    if not NSFW_ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model admin endpoints are disabled (NSFW_ADMIN_TOKEN is not set)")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), NSFW_ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    if NSFW_EXECUTOR == "process":
+        # The models live in the worker processes, which this process can't address individually
+        raise HTTPException(status_code=409, detail="Hot swapping requires NSFW_EXECUTOR=thread")
+
+
+@app.get("/nsfw-model/registry")
+async def nsfw_model_registry():
+    """Active and candidate model versions, shadow-scoring stats and swap history."""
+    return nsfw_registry.status()
+
+
+@app.post("/nsfw-model/candidate", status_code=202)
+async def load_nsfw_candidate(request_data: NSFWCandidateRequest, request: Request):
+    """
+    Load and warm up a candidate model in the background; poll
+    /nsfw-model/registry until it is ready, then POST /nsfw-model/promote.
+    """
+    global _candidate_load_task
+    _require_model_admin(request)
+    try:
+        nsfw_registry.resolve_model_path(request_data.path)
+    except (ValueError, FileNotFoundError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if _candidate_load_task is not None and not _candidate_load_task.done():
+        raise HTTPException(status_code=409, detail="A candidate model is already loading")
+    
+    async def load():
+        try:
+            await asyncio.to_thread(nsfw_registry.load_candidate, request_data.path, request_data.shadow_rate)
+        except Exception:
+            pass  # recorded in the registry's candidate state
+    
+    _candidate_load_task = asyncio.create_task(load())
+    return nsfw_registry.status()
+
+
+@app.post("/nsfw-model/promote")
+async def promote_nsfw_candidate(request: Request):
+    """Atomically switch to the ready candidate model."""
+    _require_model_admin(request)
+    try:
+        status = nsfw_registry.promote()
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    # Cached verdicts came from the previous model
+    nsfw_phash_cache.clear()
+    await asyncio.to_thread(verdict_cache.clear)
+    return status
+
+
+@app.delete("/nsfw-model/candidate")
+async def discard_nsfw_candidate(request: Request):
+    """Drop the candidate model and stop shadow scoring."""
+    _require_model_admin(request)
+    return nsfw_registry.discard_candidate()
 
 
 # --- Activity Logs for Family Monitoring ---
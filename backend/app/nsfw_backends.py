@@ -0,0 +1,129 @@
+"""
+Inference backends for the NSFW model.
+
+Every backend exposes predict(batch) -> class probabilities, where batch is a
+float32 NHWC array already resized and scaled to [0, 1].
+
+    keras   the full-precision model rebuilt from the bundle (default)
+    tflite  a quantized int8 graph exported by tools/export_tflite.py
+    numpy   the bundle's architecture run in pure NumPy (app/nsfw_numpy.py)
+"""
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict
+
+import numpy as np
+
+
+def build_keras_model(bundle: Dict[str, Any]):
+    """Rebuild the Keras model from a bundle. No compile(): inference doesn't need an optimizer."""
+    from tensorflow.keras import models
+
+    model = models.model_from_json(bundle["architecture"])
+    model.set_weights(bundle["weights"])
+    return model
+
+
+class KerasBackend:
+    """
+    Calls the model through one tf.function with a fixed input signature
+    (any batch size, model input height/width) instead of model.predict(),
+    which pays for Keras' data adapter and callback machinery on every call.
+    """
+    name = "keras"
+
+    def __init__(self, bundle: Dict[str, Any]):
+        import tensorflow as tf
+
+        self.model = build_keras_model(bundle)
+        _, height, width, channels = self.model.input_shape
+        self.traces = 0
+        self._forward = tf.function(
+            self._trace,
+            input_signature=[tf.TensorSpec([None, height, width, channels], tf.float32)],
+        )
+
+    def _trace(self, batch):
+        # Python code here only runs while tracing: with the fixed signature that
+        # should happen exactly once, anything more is a retrace worth knowing about
+        self.traces += 1
+        if self.traces > 1:
+            print(f"⚠️ NSFW model retraced ({self.traces} traces) for input {batch.shape}")
+        return self.model(batch, training=False)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._forward(batch).numpy()
+
+
+def _tflite_interpreter(model_path: Path):
+    """Prefer the lightweight tflite_runtime package, fall back to TensorFlow's interpreter."""
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        import tensorflow as tf
+        Interpreter = tf.lite.Interpreter
+    return Interpreter(model_path=str(model_path))
+
+
+class TFLiteBackend:
+    """
+    Runs a (quantized) TFLite graph. Int8 inputs/outputs are quantized and
+    dequantized here, so callers always pass and get float32.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path: Path):
+        self.model_path = Path(model_path)
+        self.interpreter = _tflite_interpreter(self.model_path)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        # The interpreter holds mutable tensor state, one invocation at a time
+        self._lock = Lock()
+
+    def _resize(self, batch_size: int) -> None:
+        if batch_size == self._batch_size:
+            return
+        shape = list(self._input["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(batch.shape[0])
+
+            input_dtype = self._input["dtype"]
+            if input_dtype in (np.int8, np.uint8):
+                scale, zero_point = self._input["quantization"]
+                info = np.iinfo(input_dtype)
+                batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max)
+            self.interpreter.set_tensor(self._input["index"], batch.astype(input_dtype, copy=False))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+
+            if self._output["dtype"] in (np.int8, np.uint8):
+                scale, zero_point = self._output["quantization"]
+                output = (output.astype(np.float32) - zero_point) * scale
+            return np.array(output, dtype=np.float32)
+
+
+class NumpyBackend:
+    """
+    Runs the bundle with app/nsfw_numpy.py: no TensorFlow import, builds in
+    well under a second, and matches Keras to float32 rounding. Slower than
+    Keras per batch, so it suits startup- and memory-bound workers.
+    """
+    name = "numpy"
+
+    def __init__(self, bundle: Dict[str, Any]):
+        from .nsfw_numpy import NumpyModel
+
+        self.model = NumpyModel(bundle["architecture"], bundle["weights"])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self.model.predict(batch)
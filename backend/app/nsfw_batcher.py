@@ -0,0 +1,195 @@
+"""
+Dynamic micro-batching for the local NSFW model.
+
+Concurrent /analyze-image-nsfw requests are collected for a short window (or
+until the batch is full), scored with ONE batched forward pass, and each
+caller gets its own result back. This avoids paying the fixed per-call Keras
+overhead for every single image on busy feeds. Up to max_in_flight batches
+(one per inference worker) run at once; while they are all busy, new requests
+keep queueing and go out together in the next batch.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+
+import numpy as np
+
+
+def _latency_summary(samples: Deque[float]) -> Dict[str, Optional[float]]:
+    """avg/p50/p95/max of a window of latency samples (milliseconds)."""
+    if not samples:
+        return {"avg": None, "p50": None, "p95": None, "max": None}
+    values = np.fromiter(samples, dtype=np.float64)
+    return {
+        "avg": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+class NSFWBatcher:
+    """
+    In-process batching scheduler.
+
+    predict_batch receives a list of HxWx3 image arrays and must return one
+    result per image (or None when the model isn't available). It is called
+    through run(predict_batch, images), which defaults to a worker thread.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[List[np.ndarray]], Optional[List[Any]]],
+        window_ms: float = 10.0,
+        max_batch_size: int = 16,
+        sample_size: int = 1000,
+        run: Optional[Callable[..., Awaitable[Any]]] = None,
+        max_in_flight: int = 1,
+    ):
+        self.predict_batch = predict_batch
+        self.run = run or asyncio.to_thread
+        self.window_ms = window_ms
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_in_flight = max(1, max_in_flight)
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+        # Metrics
+        self.batches = 0
+        self.images = 0
+        self.errors = 0
+        self.batch_size_counts: Dict[int, int] = {}
+        self._queue_wait_ms: Deque[float] = deque(maxlen=sample_size)
+        self._inference_ms: Deque[float] = deque(maxlen=sample_size)
+
+    def start(self) -> None:
+        """Start the scheduler task on the running event loop (idempotent)."""
+        if self._worker is not None and not self._worker.done():
+            return
+        self._queue = asyncio.Queue()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the scheduler, let running batches finish and fail any requests still waiting in the queue."""
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("NSFW batcher stopped"))
+
+    async def submit(self, image: np.ndarray) -> Any:
+        """Queue one image and wait for its own prediction result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future, time.perf_counter()))
+        if self._queue.qsize() >= self.max_batch_size:
+            self._wakeup.set()
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        """Wait for the first request, then gather more until the window closes or the batch is full."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.window_ms / 1000.0
+
+        while len(batch) < self.max_batch_size:
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if len(batch) >= self.max_batch_size:
+                break
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+        return batch
+
+    def _finished(self, task: asyncio.Task) -> None:
+        self._in_flight.discard(task)
+        self._slots.release()
+
+    async def _run(self) -> None:
+        while True:
+            # Only collect the next batch once a worker can take it
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+            task = asyncio.create_task(self._process(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._finished)
+
+    async def _process(self, batch: List[tuple]) -> None:
+        # Drop callers that went away (client disconnected) before we spend inference on them
+        batch = [item for item in batch if not item[1].done()]
+        if not batch:
+            return
+
+        dequeued_at = time.perf_counter()
+        for _, _, enqueued_at in batch:
+            self._queue_wait_ms.append((dequeued_at - enqueued_at) * 1000)
+
+        images = [image for image, _, _ in batch]
+        try:
+            results = await self.run(self.predict_batch, images)
+        except Exception as e:
+            self.errors += 1
+            print(f"❌ NSFW batch of {len(batch)} failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._inference_ms.append((time.perf_counter() - dequeued_at) * 1000)
+        self.batches += 1
+        self.images += len(batch)
+        self.batch_size_counts[len(batch)] = self.batch_size_counts.get(len(batch), 0) + 1
+
+        if results is None:
+            results = [None] * len(batch)
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Batch-size and queue-wait statistics for tuning the window."""
+        return {
+            "window_ms": self.window_ms,
+            "max_batch_size": self.max_batch_size,
+            "running": self._worker is not None and not self._worker.done(),
+            "max_in_flight": self.max_in_flight,
+            "in_flight": len(self._in_flight),
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "images": self.images,
+            "errors": self.errors,
+            "avg_batch_size": round(self.images / self.batches, 3) if self.batches else None,
+            "batch_size_histogram": {
+                str(size): count for size, count in sorted(self.batch_size_counts.items())
+            },
+            "queue_wait_ms": _latency_summary(self._queue_wait_ms),
+            "inference_ms": _latency_summary(self._inference_ms),
+        }
@@ -0,0 +1,129 @@
+"""
+Reusable float32 input buffers for the NSFW models.
+
+predict_nsfw_batch() normalizes every batch straight into a buffer taken from
+a pool instead of allocating a fresh (N, H, W, 3) array per call, so sustained
+load doesn't churn the allocator or fragment the heap. Buffers are allocated
+on first use and grown (to the next power of two) up to the largest batch
+seen; batches that find every buffer busy, or that exceed max_batch_size, get
+a one-off array and are counted as overflows.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+
+class BatchBufferPool:
+    """Up to max_buffers (max_batch_size, height, width, channels) float32 buffers for THIS process."""
+
+    def __init__(self, height: int, width: int, max_buffers: int = 4, max_batch_size: int = 64, channels: int = 3):
+        self.shape = (height, width, channels)
+        self.max_buffers = max(1, max_buffers)
+        self.max_batch_size = max(1, max_batch_size)
+        self._free: List[np.ndarray] = []
+        self._allocated = 0
+        self._lock = Lock()
+
+        # Metrics
+        self.acquired = 0
+        self.reused = 0
+        self.grown = 0
+        self.overflows = 0
+
+    def _capacity_for(self, batch_size: int) -> int:
+        return min(1 << (batch_size - 1).bit_length(), self.max_batch_size)
+
+    def _take(self, buffer: np.ndarray) -> None:
+        # By identity: list.remove() compares arrays with == (caller holds the lock)
+        del self._free[next(index for index, free in enumerate(self._free) if free is buffer)]
+
+    def _acquire(self, batch_size: int) -> Tuple[np.ndarray, bool]:
+        """(buffer with room for batch_size images, whether it belongs to the pool)."""
+        with self._lock:
+            self.acquired += 1
+            if batch_size <= self.max_batch_size:
+                # Smallest free buffer that fits, else a new one; at the limit a free
+                # buffer that is too small is replaced by a larger one
+                fitting = [buffer for buffer in self._free if len(buffer) >= batch_size]
+                if fitting:
+                    buffer = min(fitting, key=len)
+                    self._take(buffer)
+                    self.reused += 1
+                    return buffer, True
+                if self._allocated >= self.max_buffers and self._free:
+                    self._take(min(self._free, key=len))
+                    self._allocated -= 1
+                    self.grown += 1
+                if self._allocated < self.max_buffers:
+                    self._allocated += 1
+                    return np.empty((self._capacity_for(batch_size), *self.shape), dtype=np.float32), True
+            self.overflows += 1
+        return np.empty((batch_size, *self.shape), dtype=np.float32), False
+
+    def _release(self, buffer: np.ndarray) -> None:
+        with self._lock:
+            self._free.append(buffer)
+
+    @contextmanager
+    def batch(self, batch_size: int) -> Iterator[np.ndarray]:
+        """A (batch_size, H, W, C) view that stays valid until the block exits."""
+        buffer, pooled = self._acquire(batch_size)
+        try:
+            yield buffer[:batch_size]
+        finally:
+            if pooled:
+                self._release(buffer)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            capacities = sorted(len(buffer) for buffer in self._free)
+        return {
+            "input_size": list(self.shape[:2]),
+            "buffers": self._allocated,
+            "max_buffers": self.max_buffers,
+            "free_capacities": capacities,
+            "acquired": self.acquired,
+            "reused": self.reused,
+            "grown": self.grown,
+            "overflows": self.overflows,
+            "reuse_rate": round(self.reused / self.acquired, 4) if self.acquired else None,
+        }
+
+
+class BatchBufferPools:
+    """One BatchBufferPool per model input size (the full and the screening model differ)."""
+
+    def __init__(self, enabled: bool = True, max_buffers: int = 4, max_batch_size: int = 64):
+        self.enabled = enabled
+        self.max_buffers = max_buffers
+        self.max_batch_size = max_batch_size
+        self._pools: Dict[Tuple[int, int], BatchBufferPool] = {}
+        self._lock = Lock()
+
+    def get(self, height: int, width: int) -> Optional[BatchBufferPool]:
+        if not self.enabled:
+            return None
+        pool = self._pools.get((height, width))
+        if pool is None:
+            with self._lock:
+                pool = self._pools.setdefault(
+                    (height, width), BatchBufferPool(height, width, self.max_buffers, self.max_batch_size)
+                )
+        return pool
+
+    @contextmanager
+    def batch(self, batch_size: int, height: int, width: int) -> Iterator[np.ndarray]:
+        pool = self.get(height, width)
+        if pool is None:
+            yield np.empty((batch_size, height, width, 3), dtype=np.float32)
+            return
+        with pool.batch(batch_size) as buffer:
+            yield buffer
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "pools": [pool.metrics() for pool in list(self._pools.values())],
+        }
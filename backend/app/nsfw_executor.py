@@ -0,0 +1,138 @@
+"""
+Dedicated executor for CPU-heavy image work (decode, resize, inference).
+
+Keeps TensorFlow and PIL off the uvicorn event loop so /chat, /flagged-events
+and /activity-logs stay responsive while images are being scored. The number
+of pending tasks is bounded: once the queue is full new work waits up to
+queue_timeout_ms for a slot and is then rejected with InferenceBusyError.
+
+In process mode every worker waits at a barrier after its initializer, so no
+worker takes tasks (such as the startup status checks) before all of them
+have loaded their model.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+
+# How long a process worker waits at the startup barrier for the others
+WORKER_READY_TIMEOUT_SECONDS = 600
+
+
+class InferenceBusyError(RuntimeError):
+    """Raised when the inference queue is full (callers should answer 503)."""
+
+
+def _initialize_process_worker(initializer: Optional[Callable[[], None]], ready: threading.Barrier) -> None:
+    """Process-pool initializer: run the real initializer, then wait until every worker has."""
+    if initializer is not None:
+        initializer()
+    try:
+        ready.wait(timeout=WORKER_READY_TIMEOUT_SECONDS)
+    except threading.BrokenBarrierError:
+        # Another worker failed or timed out; serve anyway, readiness is checked by the caller
+        print("⚠️ Inference workers did not all become ready in time")
+
+
+class InferenceExecutor:
+    """
+    kind="thread": a thread pool sharing the model loaded in this process.
+    kind="process": a spawn-based process pool; initializer should load the
+    model in each worker, and submitted functions must be importable module
+    level functions.
+    """
+
+    def __init__(
+        self,
+        kind: str = "thread",
+        workers: int = 2,
+        max_pending: int = 64,
+        queue_timeout_ms: float = 0,
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending)
+        self.queue_timeout_ms = queue_timeout_ms
+        self.initializer = initializer
+
+        self._pool: Optional[Executor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # Metrics
+        self.pending = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def start(self) -> None:
+        """Create the worker pool (idempotent)."""
+        if self._pool is not None:
+            return
+        if self.kind == "process":
+            context = multiprocessing.get_context("spawn")
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=_initialize_process_worker,
+                initargs=(self.initializer, context.Barrier(self.workers)),
+            )
+        else:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.workers,
+                thread_name_prefix="nsfw-inference",
+                initializer=self.initializer,
+            )
+        print(f"⚙️ Inference executor started: {self.workers} {self.kind} worker(s), max {self.max_pending} pending")
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def _acquire_slot(self) -> None:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if not self._slots.locked():
+            await self._slots.acquire()
+            return
+        if self.queue_timeout_ms > 0:
+            try:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout_ms / 1000.0)
+                return
+            except asyncio.TimeoutError:
+                pass
+        self.rejected += 1
+        raise InferenceBusyError(f"Inference queue is full ({self.max_pending} pending)")
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(*args) on the executor, waiting for a queue slot first."""
+        self.start()
+        await self._acquire_slot()
+        self.pending += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.pending -= 1
+            self._slots.release()
+        self.completed += 1
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "queue_timeout_ms": self.queue_timeout_ms,
+            "pending": self.pending,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
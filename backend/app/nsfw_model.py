@@ -0,0 +1,675 @@
+"""
+Local NSFW classifier (sentry_content_filter.kiras).
+
+Loading, warm-up and prediction live here rather than in main.py so that
+inference worker processes can import them without bootstrapping Gemini,
+Firebase or the FastAPI app.
+"""
+import io
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from PIL import Image, ImageSequence
+
+from .nsfw_backends import KerasBackend, NumpyBackend, TFLiteBackend
+from .nsfw_buffers import BatchBufferPools
+from .nsfw_triage import NSFW_TRIAGE, triage_bytes, triage_pixels, triage_size
+from .nsfw_weights import load_weights_bundle, read_kiras_bundle, weights_paths
+
+load_dotenv()
+
+# --- NSFW Model Setup ---
+NSFW_MODEL = None
+# Model should be placed in: backend/app/models/sentry_content_filter.kiras
+NSFW_MODEL_PATH = Path(__file__).parent / "models" / "sentry_content_filter.kiras"
+# Memory-mappable copy written by tools/convert_model.py; preferred over the pickle when present
+NSFW_WEIGHTS_PATH, _ = weights_paths(NSFW_MODEL_PATH.with_suffix(""))
+NSFW_MODEL_FORMAT = os.getenv("NSFW_MODEL_FORMAT", "auto").lower()  # auto / mmap / kiras
+# Inference backend: "keras" (full precision), "tflite" (int8 graph from tools/export_tflite.py)
+# or "numpy" (pure-NumPy forward pass, no TensorFlow import; app/nsfw_numpy.py)
+NSFW_BACKEND = os.getenv("NSFW_BACKEND", "keras").lower()
+NSFW_TFLITE_PATH = Path(os.getenv("NSFW_TFLITE_PATH", str(NSFW_MODEL_PATH.with_suffix(".int8.tflite"))))
+NSFW_WARMUP_RUNS = int(os.getenv("NSFW_WARMUP_RUNS", "3"))
+# Resample filter used to shrink images to the model input. Bicubic has a smaller
+# kernel than lanczos and stays within a few percent of its class probabilities
+# (see tools/bench_preprocess.py); bilinear is cheaper still but drifts more.
+NSFW_RESAMPLE = os.getenv("NSFW_RESAMPLE", "bicubic").lower()
+_RESAMPLE_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "bilinear": Image.Resampling.BILINEAR,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+NSFW_RESAMPLE_FILTER = _RESAMPLE_FILTERS.get(NSFW_RESAMPLE, Image.Resampling.BICUBIC)
+# Shrink with a cheap box reduce first while the image is > reducing_gap x the target size
+NSFW_REDUCING_GAP = 2.0
+# Optional tiny first-stage model (tools/train_screen_model.py). It scores every image;
+# only images where some non-safe class reaches its threshold go on to the full model.
+NSFW_SCREEN = os.getenv("NSFW_SCREEN", "auto").lower()  # auto (use it if the file exists) / off
+NSFW_SCREEN_MODEL_PATH = Path(os.getenv(
+    "NSFW_SCREEN_MODEL_PATH", str(NSFW_MODEL_PATH.with_name("sentry_screen.weights.json"))
+))
+NSFW_SCREEN_DEFAULT_THRESHOLD = float(os.getenv("NSFW_SCREEN_DEFAULT_THRESHOLD", "0.1"))
+# Per-class overrides, e.g. "unsafe=0.05"; class names come from metadata['classes']
+NSFW_SCREEN_THRESHOLDS = os.getenv("NSFW_SCREEN_THRESHOLDS", "")
+NSFW_SCREEN_MODEL = None
+# Animated GIF/WebP: number of frames scored per image (below 2 scores the first frame only),
+# picked "even"ly spaced or at the largest "scene" changes (decodes every frame to find them)
+NSFW_ANIMATED_FRAMES = int(os.getenv("NSFW_ANIMATED_FRAMES", "8"))
+NSFW_ANIMATED_SAMPLING = os.getenv("NSFW_ANIMATED_SAMPLING", "even").lower()
+# Frames are scored this many per forward pass; scoring stops after the pass in
+# which a frame is unsafe with at least NSFW_ANIMATED_STOP_CONFIDENCE
+NSFW_ANIMATED_CHUNK = int(os.getenv("NSFW_ANIMATED_CHUNK", "4"))
+NSFW_ANIMATED_STOP_CONFIDENCE = float(os.getenv("NSFW_ANIMATED_STOP_CONFIDENCE", "0.9"))
+_nsfw_model_lock = Lock()
+_screen_model_lock = Lock()
+_screen_model_checked = False
+# (bundle, format) read by prepare_nsfw_model_for_fork() in the pre-fork parent
+_prefork_bundle = None
+# Set by set_nsfw_shadow_scorer()
+_shadow_scorer = None
+# Pooled float32 input batches (app/nsfw_buffers.py); the pool size should cover the inference threads
+NSFW_BUFFER_POOL = os.getenv("NSFW_BUFFER_POOL", "true").lower() in ("1", "true", "yes")
+nsfw_buffer_pools = BatchBufferPools(
+    enabled=NSFW_BUFFER_POOL,
+    max_buffers=int(os.getenv("NSFW_BUFFER_POOL_SIZE", "4")),
+    max_batch_size=int(os.getenv("NSFW_BUFFER_POOL_MAX_BATCH", "64")),
+)
+
+# Readiness state reported by /nsfw-model-status
+NSFW_MODEL_STATE: Dict[str, Any] = {
+    "status": "not_loaded",  # not_loaded / loading / warming_up / ready / missing / failed
+    "format": None,  # mmap / kiras
+    "source": None,  # model file name
+    "backend": None,  # keras / tflite
+    "load_seconds": None,
+    "warmup_ms": [],
+    "error": None,
+    "preloaded": None,  # full / bundle when prepared by the pre-fork parent (app/prefork.py)
+}
+
+def read_nsfw_model_bundle():
+    """
+    Read the model bundle (architecture, weights, metadata, class_indices).
+    Prefers the memory-mappable format and falls back to the .kiras pickle.
+    Returns (bundle, format) or (None, None) if no model file exists.
+    """
+    if NSFW_MODEL_FORMAT != "kiras" and NSFW_WEIGHTS_PATH.exists():
+        if NSFW_MODEL_PATH.exists() and NSFW_MODEL_PATH.stat().st_mtime > NSFW_WEIGHTS_PATH.stat().st_mtime:
+            print(f"⚠️ {NSFW_WEIGHTS_PATH.name} is older than {NSFW_MODEL_PATH.name}, re-run tools/convert_model.py. Using the .kiras bundle.")
+        else:
+            print(f"📦 Loading NSFW model from: {NSFW_WEIGHTS_PATH}")
+            return load_weights_bundle(NSFW_WEIGHTS_PATH), "mmap"
+    elif NSFW_MODEL_FORMAT == "mmap":
+        print(f"⚠️ Memory-mapped weights not found at: {NSFW_WEIGHTS_PATH}, falling back to .kiras")
+
+    if NSFW_MODEL_PATH.exists():
+        print(f"📦 Loading NSFW model from: {NSFW_MODEL_PATH}")
+        return read_kiras_bundle(NSFW_MODEL_PATH), "kiras"
+    return None, None
+
+
+def read_nsfw_model_bundle_at(path: Path):
+    """Read a bundle from an explicit .weights.json or .kiras path. Returns (bundle, format)."""
+    path = Path(path)
+    if path.name.endswith(".weights.json"):
+        return load_weights_bundle(path), "mmap"
+    if path.suffix == ".kiras":
+        return read_kiras_bundle(path), "kiras"
+    raise ValueError(f"Unsupported model file: {path.name} (expected .weights.json or .kiras)")
+
+
+def create_nsfw_backend(bundle: Dict[str, Any], tflite_path: Optional[Path] = NSFW_TFLITE_PATH):
+    """
+    Create the configured inference backend, falling back to Keras if the
+    TFLite graph is missing or the NumPy engine can't run the architecture.
+    tflite_path=None never uses a TFLite graph.
+    """
+    if NSFW_BACKEND == "numpy":
+        try:
+            return NumpyBackend(bundle)
+        except ValueError as e:
+            print(f"⚠️ NumPy backend can't run this model ({e}). Using Keras.")
+            return KerasBackend(bundle)
+    if tflite_path is None:
+        return KerasBackend(bundle)
+    if NSFW_BACKEND == "tflite":
+        if tflite_path.exists():
+            print(f"📦 Using quantized TFLite backend: {tflite_path}")
+            return TFLiteBackend(tflite_path)
+        print(f"⚠️ TFLite model not found at: {tflite_path}, run tools/export_tflite.py. Using Keras.")
+    elif NSFW_BACKEND != "keras":
+        print(f"⚠️ Unknown NSFW_BACKEND '{NSFW_BACKEND}', using Keras.")
+    return KerasBackend(bundle)
+
+
+def build_nsfw_model(bundle: Dict[str, Any], tflite_path: Optional[Path] = NSFW_TFLITE_PATH) -> Dict[str, Any]:
+    """Reconstruct the model (or open the quantized graph) from a bundle."""
+    backend = create_nsfw_backend(bundle, tflite_path)
+    class_indices = bundle["class_indices"]
+    return {
+        "backend": backend,
+        "metadata": bundle["metadata"],
+        "class_indices": class_indices,
+        "idx_to_class": {v: k for k, v in class_indices.items()},
+    }
+
+
+def load_nsfw_model():
+    """Load the KIRAS NSFW detection model."""
+    global NSFW_MODEL
+    if NSFW_MODEL is not None:
+        return NSFW_MODEL
+    with _nsfw_model_lock:
+        if NSFW_MODEL is not None:
+            return NSFW_MODEL
+        NSFW_MODEL_STATE["status"] = "loading"
+        started = time.perf_counter()
+        try:
+            if _prefork_bundle is not None:
+                kiras_bundle, model_format = _prefork_bundle
+            else:
+                kiras_bundle, model_format = read_nsfw_model_bundle()
+            if kiras_bundle is not None:
+                NSFW_MODEL = build_nsfw_model(kiras_bundle)
+                metadata = NSFW_MODEL["metadata"]
+                NSFW_MODEL_STATE["format"] = model_format
+                NSFW_MODEL_STATE["source"] = (NSFW_WEIGHTS_PATH if model_format == "mmap" else NSFW_MODEL_PATH).name
+                NSFW_MODEL_STATE["backend"] = NSFW_MODEL["backend"].name
+                NSFW_MODEL_STATE["load_seconds"] = round(time.perf_counter() - started, 3)
+                # Lazily loaded models are usable right away; warm_up_nsfw_model() refines this at startup
+                NSFW_MODEL_STATE["status"] = "ready"
+                print(f"✅ NSFW model loaded in {NSFW_MODEL_STATE['load_seconds']}s! Classes: {metadata['classes']}")
+            else:
+                NSFW_MODEL_STATE["status"] = "missing"
+                print(f"⚠️ NSFW model not found at: {NSFW_MODEL_PATH}")
+        except Exception as e:
+            NSFW_MODEL_STATE["status"] = "failed"
+            NSFW_MODEL_STATE["error"] = str(e)
+            print(f"❌ Failed to load NSFW model: {e}")
+    return NSFW_MODEL
+
+
+def parse_screen_thresholds(spec: str) -> Dict[str, float]:
+    """Parse "class=threshold,class=threshold" into a dict."""
+    thresholds = {}
+    for item in spec.split(","):
+        if item.strip():
+            name, _, value = item.partition("=")
+            thresholds[name.strip()] = float(value)
+    return thresholds
+
+
+def screen_thresholds(classes: List[str], overrides: Dict[str, float],
+                      default: float = NSFW_SCREEN_DEFAULT_THRESHOLD) -> np.ndarray:
+    """
+    Suspicion threshold per output index. The safe class can never make an
+    image suspicious; every other class escalates once its probability
+    reaches its threshold.
+    """
+    unknown = set(overrides) - set(classes)
+    if unknown:
+        print(f"⚠️ Ignoring screen thresholds for unknown classes: {sorted(unknown)}")
+    return np.array([
+        np.inf if name == "safe" else overrides.get(name, default) for name in classes
+    ], dtype=np.float32)
+
+
+def screen_threshold_summary(screen: Dict[str, Any]) -> Dict[str, float]:
+    """{class: threshold} for the classes that can escalate an image."""
+    return {
+        screen["idx_to_class"][i]: round(float(threshold), 4)
+        for i, threshold in enumerate(screen["thresholds"]) if np.isfinite(threshold)
+    }
+
+
+def load_nsfw_screen_model():
+    """Load the optional first-stage screening model (None when absent or disabled)."""
+    global NSFW_SCREEN_MODEL, _screen_model_checked
+    if _screen_model_checked:
+        return NSFW_SCREEN_MODEL
+    with _screen_model_lock:
+        if _screen_model_checked:
+            return NSFW_SCREEN_MODEL
+        if NSFW_SCREEN != "off" and NSFW_SCREEN_MODEL_PATH.exists():
+            try:
+                bundle, _ = read_nsfw_model_bundle_at(NSFW_SCREEN_MODEL_PATH)
+                # Never the TFLite graph (it belongs to the full model); NumPy when NSFW_BACKEND=numpy
+                screen = build_nsfw_model(bundle, tflite_path=None)
+            except Exception as e:
+                screen = None
+                print(f"❌ Failed to load NSFW screening model: {e}")
+            if screen is not None:
+                # One threshold per output column
+                classes = [screen["idx_to_class"][i] for i in range(len(screen["idx_to_class"]))]
+                screen["thresholds"] = screen_thresholds(classes, parse_screen_thresholds(NSFW_SCREEN_THRESHOLDS))
+                NSFW_SCREEN_MODEL = screen
+                print(f"✅ NSFW screening model loaded: {NSFW_SCREEN_MODEL_PATH.name}, "
+                      f"thresholds {screen_threshold_summary(screen)}")
+        _screen_model_checked = True
+    return NSFW_SCREEN_MODEL
+
+
+def swap_nsfw_model(model_data: Dict[str, Any], state: Dict[str, Any]):
+    """
+    Make model_data the active model in one assignment and return the previous
+    one. Batches already running keep their own reference to the old model, so
+    it is only released once the last of them has finished.
+    """
+    global NSFW_MODEL
+    with _nsfw_model_lock:
+        previous = NSFW_MODEL
+        NSFW_MODEL = model_data
+        NSFW_MODEL_STATE.update(state)
+        NSFW_MODEL_STATE["status"] = "ready"
+        NSFW_MODEL_STATE["error"] = None
+    return previous
+
+
+def set_nsfw_shadow_scorer(scorer: Optional[Callable[[np.ndarray, np.ndarray, float], None]]) -> None:
+    """
+    Register a callback that sees every live batch after the active model has
+    scored it: (preprocessed batch, active predictions, active latency in ms).
+    The batch may be a reused buffer, so copy it to keep it beyond the call.
+    Used by the model registry's shadow mode; None disables it.
+    """
+    global _shadow_scorer
+    _shadow_scorer = scorer
+
+
+def prepare_nsfw_model_for_fork() -> Optional[str]:
+    """
+    Load as much of the model as survives fork(), in the parent process of a
+    pre-forked server, so every worker shares it copy-on-write.
+
+    TensorFlow's runtime (thread pools, eager context) does not survive fork:
+    a Keras model built in the parent deadlocks in the children. For Keras the
+    parent therefore only imports TensorFlow and reads the weights bundle, and
+    each worker builds its own graph from it. A TFLite interpreter or the
+    NumPy engine has no such state and is loaded and warmed up completely.
+    Returns "full", "bundle" or None (no model file).
+    """
+    global _prefork_bundle
+
+    if NSFW_BACKEND == "numpy" or (NSFW_BACKEND == "tflite" and NSFW_TFLITE_PATH.exists()):
+        if load_nsfw_model() is None:
+            return None
+        warm_up_nsfw_model()
+        preloaded = "full"
+    else:
+        import tensorflow  # noqa: F401 -- the import alone is most of a worker's memory
+        _prefork_bundle = read_nsfw_model_bundle()
+        if _prefork_bundle[0] is None:
+            _prefork_bundle = None
+            return None
+        preloaded = "bundle"
+
+    NSFW_MODEL_STATE["preloaded"] = preloaded
+    return preloaded
+
+
+def warm_up_nsfw_model(runs: int = NSFW_WARMUP_RUNS) -> List[float]:
+    """
+    Run a few dummy predictions so TensorFlow builds its graph and allocates
+    buffers before real traffic arrives. Returns the latency of each run in ms.
+    """
+    model_data = load_nsfw_model()
+    if model_data is None:
+        return []
+
+    NSFW_MODEL_STATE["status"] = "warming_up"
+    metadata = model_data["metadata"]
+    dummy = np.zeros((1, metadata['img_height'], metadata['img_width'], 3), dtype='float32')
+
+    timings = []
+    try:
+        for _ in range(max(runs, 0)):
+            started = time.perf_counter()
+            model_data["backend"].predict(dummy)
+            timings.append(round((time.perf_counter() - started) * 1000, 2))
+    except Exception as e:
+        NSFW_MODEL_STATE["status"] = "failed"
+        NSFW_MODEL_STATE["error"] = f"Warm-up failed: {e}"
+        print(f"❌ NSFW model warm-up failed: {e}")
+        return timings
+
+    screen = load_nsfw_screen_model()
+    if screen is not None:
+        screen_metadata = screen["metadata"]
+        screen["backend"].predict(
+            np.zeros((1, screen_metadata['img_height'], screen_metadata['img_width'], 3), dtype='float32')
+        )
+    
+    NSFW_MODEL_STATE["warmup_ms"] = timings
+    NSFW_MODEL_STATE["status"] = "ready"
+    print(f"🔥 NSFW model warmed up ({len(timings)} runs): {timings} ms")
+    return timings
+
+
+def _format_nsfw_prediction(prediction, idx_to_class):
+    """Turn one row of model output into the result dict used by the endpoints."""
+    predicted_idx = int(np.argmax(prediction))
+    predicted_class = idx_to_class[predicted_idx]
+    confidence = float(prediction[predicted_idx])
+
+    return {
+        "class": predicted_class,
+        "confidence": confidence,
+        "is_safe": predicted_class == "safe",
+        "probabilities": {
+            idx_to_class[i]: float(prediction[i])
+            for i in range(len(prediction))
+        }
+    }
+
+
+def resize_for_model(img: Image.Image, target_w: int, target_h: int) -> Image.Image:
+    """Resize a PIL image to the model input with the configured filter."""
+    if img.size == (target_w, target_h):
+        return img
+    return img.resize((target_w, target_h), NSFW_RESAMPLE_FILTER, reducing_gap=NSFW_REDUCING_GAP)
+
+
+def preprocess_nsfw_batch(images, target_h: int, target_w: int, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resize a list of HxWx3 images to the model input and write them into one
+    float32 batch scaled to [0, 1]. uint8 images are scaled by 1/255 straight
+    into the batch buffer (no intermediate float copies); float images are
+    assumed to already be in [0, 1]. out, if given, is used as the batch buffer.
+    """
+    batch = out if out is not None else np.empty((len(images), target_h, target_w, 3), dtype=np.float32)
+    for i, image in enumerate(images):
+        if not isinstance(image, np.ndarray):
+            image = np.asarray(image)
+        if image.shape[0:2] != (target_h, target_w):
+            img = Image.fromarray(image.astype('uint8', copy=False))
+            image = np.asarray(resize_for_model(img, target_w, target_h))
+        
+        # Normalize
+        if image.dtype == np.uint8:
+            np.multiply(image, np.float32(1.0 / 255.0), out=batch[i])
+        else:
+            batch[i] = image
+    return batch
+
+
+def predict_nsfw_batch(images):
+    """
+    Predict a list of images (HxWx3 arrays of any size) in ONE forward pass.
+    Returns one result per image, in order, or None if the model isn't loaded.
+    With a screening model, only images it finds suspicious reach the full
+    model; the others keep the screening verdict ("screened": True).
+    """
+    model_data = load_nsfw_model()
+    if model_data is None:
+        return None
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(images)
+    to_full = list(range(len(images)))
+    screen = load_nsfw_screen_model()
+    if screen is not None:
+        screen_h, screen_w = screen["metadata"]['img_height'], screen["metadata"]['img_width']
+        with nsfw_buffer_pools.batch(len(images), screen_h, screen_w) as out:
+            screen_predictions = screen["backend"].predict(preprocess_nsfw_batch(images, screen_h, screen_w, out=out))
+        suspicious = np.any(screen_predictions >= screen["thresholds"], axis=1)
+        for i in np.flatnonzero(~suspicious):
+            results[i] = {**_format_nsfw_prediction(screen_predictions[i], screen["idx_to_class"]), "screened": True}
+        to_full = np.flatnonzero(suspicious).tolist()
+        if not to_full:
+            return results
+        images = [images[i] for i in to_full]
+    
+    metadata = model_data["metadata"]
+    idx_to_class = model_data["idx_to_class"]
+    height, width = metadata['img_height'], metadata['img_width']
+    # Images are normalized straight into a pooled buffer, which goes back to the pool after predict
+    with nsfw_buffer_pools.batch(len(images), height, width) as out:
+        img_array = preprocess_nsfw_batch(images, height, width, out=out)
+        
+        # Predict
+        started = time.perf_counter()
+        predictions = model_data["backend"].predict(img_array)
+        
+        shadow_scorer = _shadow_scorer
+        if shadow_scorer is not None:
+            shadow_scorer(img_array, predictions, (time.perf_counter() - started) * 1000)
+    
+    for i, prediction in zip(to_full, predictions):
+        results[i] = _format_nsfw_prediction(prediction, idx_to_class)
+        if screen is not None:
+            results[i]["screened"] = False
+    return results
+
+
+def _unsafe_score(result: Dict[str, Any]) -> float:
+    return 1.0 - result["probabilities"].get("safe", 0.0)
+
+
+def predict_nsfw_frames(frames: List[np.ndarray], frame_indices: Optional[List[int]] = None,
+                        chunk: int = NSFW_ANIMATED_CHUNK,
+                        stop_confidence: float = NSFW_ANIMATED_STOP_CONFIDENCE) -> Optional[Dict[str, Any]]:
+    """
+    Worst-case verdict over the sampled frames of an animated image: the
+    result of the frame with the lowest safe probability, plus
+    "frames": {"sampled", "scored", "worst" (frame index)}. Frames are scored
+    `chunk` at a time, stopping once one is confidently unsafe.
+    """
+    worst, worst_index, scored = None, None, 0
+    for start in range(0, len(frames), max(chunk, 1)):
+        results = predict_nsfw_batch(frames[start:start + max(chunk, 1)])
+        if results is None:
+            return None
+        for offset, result in enumerate(results):
+            if worst is None or _unsafe_score(result) > _unsafe_score(worst):
+                worst, worst_index = result, start + offset
+        scored += len(results)
+        if not worst["is_safe"] and worst["confidence"] >= stop_confidence:
+            break
+    if worst is None:
+        return None
+    if frame_indices is not None:
+        worst_index = frame_indices[worst_index]
+    return {**worst, "frames": {"sampled": len(frames), "scored": scored, "worst": worst_index}}
+
+
+def predict_nsfw(img_array):
+    """
+    Predict if an image is NSFW using the local model.
+    A single HxWx3 image returns one result; a 4-D batch returns a list of results.
+    """
+    # Ensure numpy array
+    if not isinstance(img_array, np.ndarray):
+        img_array = np.array(img_array)
+    
+    # Handle single image
+    if len(img_array.shape) == 3:
+        results = predict_nsfw_batch([img_array])
+        return results[0] if results else None
+    
+    return predict_nsfw_batch(list(img_array))
+
+
+def open_nsfw_image(image_data: bytes, target_size: Optional[tuple] = None) -> Image.Image:
+    """
+    Decode image bytes to an RGB PIL image. With a (width, height) target_size,
+    JPEGs are decoded with draft mode, so libjpeg only produces pixels at 1/2,
+    1/4 or 1/8 scale (never below the target) instead of decoding the full
+    resolution just to throw most of it away.
+    """
+    img = Image.open(io.BytesIO(image_data))
+    if target_size is not None:
+        # No-op for formats without reduced-scale decoding
+        img.draft('RGB', target_size)
+    
+    # Convert to RGB if necessary
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+
+def decode_nsfw_image(image_data: bytes) -> np.ndarray:
+    """
+    Decode image bytes into an RGB array at the model's input size
+    (runs in the inference executor, so only the small array crosses
+    process boundaries).
+    """
+    model_data = load_nsfw_model()
+    target_size = None
+    if model_data is not None:
+        target_size = (model_data["metadata"]['img_width'], model_data["metadata"]['img_height'])
+    img = open_nsfw_image(image_data, target_size)
+    
+    # Log image info for debugging
+    print(f"🔍 NSFW Analysis - Image size: {img.size}, mode: {img.mode}")
+    
+    if target_size is not None:
+        img = resize_for_model(img, *target_size)
+    return np.asarray(img)
+
+
+def sample_frame_indices(frame_count: int, count: int) -> List[int]:
+    """count evenly spaced frame indices, always including the first and last frame."""
+    if frame_count <= count:
+        return list(range(frame_count))
+    return sorted(set(np.linspace(0, frame_count - 1, count).round().astype(int).tolist()))
+
+
+def scene_change_indices(img: Image.Image, count: int) -> List[int]:
+    """The first frame plus the count - 1 frames that differ most from the frame before them."""
+    previous, changes = None, []
+    for index, frame in enumerate(ImageSequence.Iterator(img)):
+        thumbnail = np.asarray(frame.convert('L').resize((16, 16), Image.Resampling.BOX), dtype=np.float32)
+        if previous is not None:
+            changes.append((float(np.abs(thumbnail - previous).mean()), index))
+        previous = thumbnail
+    picked = sorted(changes, reverse=True)[:count - 1]
+    return sorted([0] + [index for _, index in picked])
+
+
+def decode_nsfw_frames(image_data: bytes, count: int = NSFW_ANIMATED_FRAMES,
+                       sampling: str = NSFW_ANIMATED_SAMPLING) -> Optional[Dict[str, Any]]:
+    """
+    Sampled frames of an animated GIF/WebP at the model's input size:
+    {"frames": [...], "frame_indices": [...], "frame_count": n}. None for still
+    images (or when frame sampling is off), which decode_nsfw_image() handles.
+    """
+    model_data = load_nsfw_model()
+    if count < 2 or model_data is None:
+        return None
+    img = Image.open(io.BytesIO(image_data))
+    frame_count = getattr(img, "n_frames", 1)
+    if frame_count < 2:
+        return None
+    
+    target_w, target_h = model_data["metadata"]['img_width'], model_data["metadata"]['img_height']
+    if sampling == "scene":
+        indices = scene_change_indices(img, count)
+    else:
+        indices = sample_frame_indices(frame_count, count)
+    frames = []
+    for index in indices:
+        img.seek(index)
+        frames.append(np.asarray(resize_for_model(img.convert('RGB'), target_w, target_h)))
+    print(f"🎞️ NSFW Analysis - Animated image: {img.size}, {frame_count} frames, sampled {indices}")
+    return {"frames": frames, "frame_indices": indices, "frame_count": frame_count}
+
+
+def prepare_nsfw_image(image_data: bytes, triage: bool = NSFW_TRIAGE) -> Dict[str, Any]:
+    """
+    decode_nsfw_image() preceded by the cheap triage checks (app/nsfw_triage.py).
+    Returns {"array": ...} for images that need the model, {"frames": [...], ...}
+    for animated images (see decode_nsfw_frames), or {"triaged": reason}.
+    """
+    if triage:
+        reason = triage_bytes(image_data)
+        if reason is None:
+            # Image.open only parses the header here, pixels aren't decoded yet
+            with Image.open(io.BytesIO(image_data)) as header:
+                reason = triage_size(*header.size)
+        if reason is not None:
+            return {"triaged": reason}
+    
+    animated = decode_nsfw_frames(image_data)
+    if animated is not None:
+        if triage:
+            # Only frames that pass triage are scored (animations often fade in from a flat colour)
+            reasons = [triage_pixels(frame) for frame in animated["frames"]]
+            if all(reasons):
+                return {"triaged": reasons[0]}
+            animated["frames"] = [frame for frame, reason in zip(animated["frames"], reasons) if reason is None]
+            animated["frame_indices"] = [
+                index for index, reason in zip(animated["frame_indices"], reasons) if reason is None
+            ]
+        return animated
+    
+    img_array = decode_nsfw_image(image_data)
+    if triage:
+        reason = triage_pixels(img_array)
+        if reason is not None:
+            return {"triaged": reason}
+    return {"array": img_array}
+
+
+def decode_nsfw_images(images: List[bytes], triage: bool = False) -> List[Dict[str, Any]]:
+    """
+    Decode a list of encoded images in one executor task.
+    Returns {"array": ...}, {"frames": [...], ...}, {"triaged": reason} or {"error": "..."} per image,
+    in order, so one undecodable image doesn't fail the rest of the batch.
+    """
+    outcomes = []
+    for image_data in images:
+        try:
+            outcomes.append(prepare_nsfw_image(image_data, triage))
+        except Exception as e:
+            outcomes.append({"error": str(e)})
+    return outcomes
+
+
+def nsfw_model_status() -> Dict[str, Any]:
+    """Readiness snapshot of the model in THIS process (used by /nsfw-model-status)."""
+    model_data = NSFW_MODEL
+    status = {
+        "loaded": model_data is not None,
+        "ready": model_data is not None and NSFW_MODEL_STATE["status"] == "ready",
+        "status": NSFW_MODEL_STATE["status"],
+        "format": NSFW_MODEL_STATE["format"],
+        "source": NSFW_MODEL_STATE["source"],
+        "backend": NSFW_MODEL_STATE["backend"],
+        "load_seconds": NSFW_MODEL_STATE["load_seconds"],
+        "warmup_ms": NSFW_MODEL_STATE["warmup_ms"],
+    }
+    if NSFW_MODEL_STATE["error"]:
+        status["error"] = NSFW_MODEL_STATE["error"]
+    if NSFW_SCREEN_MODEL is not None:
+        status["screen_model"] = {
+            "source": NSFW_SCREEN_MODEL_PATH.name,
+            "thresholds": screen_threshold_summary(NSFW_SCREEN_MODEL),
+        }
+    if NSFW_MODEL_STATE["preloaded"]:
+        status["preloaded"] = NSFW_MODEL_STATE["preloaded"]
+        status["pid"] = os.getpid()
+    if model_data:
+        status.update({
+            "model_name": model_data["metadata"]["model_name"],
+            "version": model_data["metadata"]["version"],
+            "classes": model_data["metadata"]["classes"]
+        })
+    return status
+
+
+def get_inference_worker_status() -> Dict[str, Any]:
+    """nsfw_model_status() of the process that runs it, with its pid (process executor)."""
+    # Hold the worker briefly so concurrent status checks land on different workers
+    time.sleep(0.05)
+    return {**nsfw_model_status(), "pid": os.getpid()}
+
+
+def init_inference_worker() -> None:
+    """Process-pool initializer: every worker loads and warms its own copy of the model."""
+    print(f"⚙️ Inference worker {os.getpid()} starting")
+    warm_up_nsfw_model()
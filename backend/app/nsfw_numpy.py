@@ -0,0 +1,369 @@
+"""
+Pure-NumPy forward pass for the NSFW models (NSFW_BACKEND=numpy).
+
+Interprets the Keras architecture JSON stored in the model bundle and runs it
+with NumPy alone, so API workers never import TensorFlow. Convolutions use
+im2col (1x1 convolutions are a plain matmul), depthwise convolutions are
+one einsum over a strided window view, and BatchNormalization/ReLU
+layers that directly follow a convolution or dense layer are folded into it
+when the model is built.
+
+The supported layers cover sentry_content_filter (MobileNetV2 plus a dense
+head) and the screening model; anything else raises ValueError at build time.
+"""
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Inference-time no-ops
+_IDENTITY_LAYERS = {"InputLayer", "Dropout", "SpatialDropout2D", "GaussianNoise", "GaussianDropout"}
+# Layers a following BatchNormalization or activation can be folded into
+_FOLDABLE_LAYERS = {"Conv2D", "DepthwiseConv2D", "SeparableConv2D", "Dense"}
+
+
+class _Node:
+    """One layer of the flattened graph."""
+
+    def __init__(self, name: str, kind: str, config: Dict[str, Any], inputs: List[str], weights: List[np.ndarray]):
+        self.name = name
+        self.kind = kind
+        self.config = config
+        self.inputs = inputs
+        self.weights = [np.asarray(weight, dtype=np.float32) for weight in weights]
+        self.bias: Optional[np.ndarray] = None
+        self.activation: Optional[Callable[[np.ndarray], np.ndarray]] = None
+
+
+def _weight_count(kind: str, config: Dict[str, Any]) -> int:
+    """Number of tensors a layer contributes to model.get_weights()."""
+    use_bias = bool(config.get("use_bias", True))
+    if kind in ("Conv2D", "DepthwiseConv2D", "Dense"):
+        return 1 + use_bias
+    if kind == "SeparableConv2D":
+        return 2 + use_bias
+    if kind == "BatchNormalization":
+        return bool(config.get("scale", True)) + bool(config.get("center", True)) + 2
+    return 0
+
+
+def _relu(max_value: Optional[float] = None, negative_slope: float = 0.0,
+          threshold: float = 0.0) -> Callable[[np.ndarray], np.ndarray]:
+    """Keras ReLU (in place where possible): relu, relu6, leaky or thresholded."""
+    if negative_slope == 0.0 and threshold == 0.0:
+        if max_value is None:
+            return lambda x: np.maximum(x, 0.0, out=x)
+        return lambda x: np.clip(x, 0.0, max_value, out=x)
+
+    def relu(x: np.ndarray) -> np.ndarray:
+        x = np.where(x >= threshold, x, negative_slope * (x - threshold)).astype(np.float32, copy=False)
+        return np.minimum(x, max_value, out=x) if max_value is not None else x
+    return relu
+
+
+def _softmax(x: np.ndarray) -> np.ndarray:
+    x = np.exp(x - x.max(axis=-1, keepdims=True))
+    return x / x.sum(axis=-1, keepdims=True)
+
+
+_ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "relu": _relu(),
+    "relu6": _relu(6.0),
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "tanh": np.tanh,
+    "softmax": _softmax,
+}
+
+
+def _activation(name: Optional[str]) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    if name in (None, "linear"):
+        return None
+    if name not in _ACTIVATIONS:
+        raise ValueError(f"Unsupported activation: {name}")
+    return _ACTIVATIONS[name]
+
+
+def _same_padding(size: int, kernel: int, stride: int) -> Tuple[int, int]:
+    """TensorFlow's 'same' padding: the odd pixel goes to the bottom/right."""
+    total = max((-(-size // stride) - 1) * stride + kernel - size, 0)
+    return total // 2, total - total // 2
+
+
+def _pad(x: np.ndarray, kh: int, kw: int, strides: Tuple[int, int], padding: str) -> np.ndarray:
+    if padding != "same":
+        return x
+    top, bottom = _same_padding(x.shape[1], kh, strides[0])
+    left, right = _same_padding(x.shape[2], kw, strides[1])
+    if top == bottom == left == right == 0:
+        return x
+    return np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)))
+
+
+def _conv2d(x: np.ndarray, kernel: np.ndarray, strides: Tuple[int, int], padding: str) -> np.ndarray:
+    """Convolution as one matmul over im2col patches; kernel is (kh, kw, in, out)."""
+    kh, kw, cin, cout = kernel.shape
+    sh, sw = strides
+    if kh == kw == 1:
+        x = x[:, ::sh, ::sw] if (sh, sw) != (1, 1) else x
+        n, h, w, _ = x.shape
+        return (x.reshape(-1, cin) @ kernel.reshape(cin, cout)).reshape(n, h, w, cout)
+    x = _pad(x, kh, kw, strides, padding)
+    windows = sliding_window_view(x, (kh, kw), axis=(1, 2))[:, ::sh, ::sw]  # N, Ho, Wo, C, kh, kw
+    n, ho, wo = windows.shape[:3]
+    patches = windows.transpose(0, 1, 2, 4, 5, 3).reshape(n * ho * wo, kh * kw * cin)
+    return (patches @ kernel.reshape(kh * kw * cin, cout)).reshape(n, ho, wo, cout)
+
+
+def _depthwise_conv2d(x: np.ndarray, kernel: np.ndarray, strides: Tuple[int, int], padding: str) -> np.ndarray:
+    """Per-channel convolution; kernel is (kh, kw, channels) with the depth multiplier already applied."""
+    kh, kw, channels = kernel.shape
+    if x.shape[-1] != channels:
+        x = np.repeat(x, channels // x.shape[-1], axis=-1)
+    x = _pad(x, kh, kw, strides, padding)
+    windows = sliding_window_view(x, (kh, kw), axis=(1, 2))[:, ::strides[0], ::strides[1]]  # N, Ho, Wo, C, kh, kw
+    # One pass over the strided windows; ~2.5x faster than accumulating kh*kw shifted products
+    return np.einsum('nhwcij,ijc->nhwc', windows, kernel)
+
+
+def _pool2d(x: np.ndarray, pool: Tuple[int, int], strides: Tuple[int, int], padding: str, reduce) -> np.ndarray:
+    if padding == "same":
+        if reduce is not np.max:
+            raise ValueError("Only 'valid' padding is supported for average pooling")
+        top, bottom = _same_padding(x.shape[1], pool[0], strides[0])
+        left, right = _same_padding(x.shape[2], pool[1], strides[1])
+        x = np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)), constant_values=-np.inf)
+    windows = sliding_window_view(x, pool, axis=(1, 2))[:, ::strides[0], ::strides[1]]
+    return reduce(windows, axis=(-2, -1))
+
+
+class NumpyModel:
+    """A Keras Sequential/Functional architecture compiled to NumPy operations."""
+
+    def __init__(self, architecture, weights: List[np.ndarray], max_batch_size: int = 16):
+        config = json.loads(architecture) if isinstance(architecture, str) else architecture
+        # Larger batches are run in slices to bound the size of intermediate activations
+        self.max_batch_size = max(1, max_batch_size)
+        self.input_shape = _input_shape(config)
+
+        self._weights = iter(weights)
+        self._nodes: List[_Node] = []
+        self.input_name = "input"
+        output = self._flatten(config, self.input_name)
+        if next(self._weights, None) is not None:
+            raise ValueError("Bundle has more weight tensors than the architecture uses")
+        del self._weights
+
+        self._aliases: Dict[str, str] = {}
+        self._fold()
+        self.output_name = self._resolve(output)
+        self._steps = [(node.name, self._compile(node), [self._resolve(i) for i in node.inputs]) for node in self._nodes]
+
+        # How many steps read each value, so intermediates are freed right after their last use
+        self._uses: Dict[str, int] = {}
+        for _, _, inputs in self._steps:
+            for name in inputs:
+                self._uses[name] = self._uses.get(name, 0) + 1
+        self._uses[self.output_name] = self._uses.get(self.output_name, 0) + 1
+
+    def _flatten(self, layer: Dict[str, Any], input_name: str) -> str:
+        """Append the nodes of a model (or one layer) fed by input_name; returns its output name."""
+        kind, config = layer["class_name"], layer["config"]
+        if kind == "Sequential":
+            current = input_name
+            for inner in config["layers"]:
+                current = self._flatten(inner, current)
+            return current
+
+        if kind in ("Functional", "Model"):
+            if len(config["input_layers"]) != 1 or len(config["output_layers"]) != 1:
+                raise ValueError(f"Only single-input, single-output models are supported ({config['name']})")
+            outputs = {config["input_layers"][0][0]: input_name}
+            for inner in config["layers"]:
+                name = inner["config"]["name"]
+                if name in outputs:
+                    continue
+                nodes = inner.get("inbound_nodes") or []
+                if len(nodes) != 1 or not all(isinstance(entry, list) for entry in nodes[0]):
+                    raise ValueError(f"Unsupported connectivity for layer {name}")
+                inputs = [outputs[entry[0]] for entry in nodes[0]]
+                if inner["class_name"] in ("Sequential", "Functional", "Model"):
+                    outputs[name] = self._flatten(inner, inputs[0])
+                else:
+                    outputs[name] = self._add_node(inner, inputs)
+            return outputs[config["output_layers"][0][0]]
+
+        return self._add_node(layer, [input_name])
+
+    def _add_node(self, layer: Dict[str, Any], inputs: List[str]) -> str:
+        kind, config = layer["class_name"], layer["config"]
+        weights = [next(self._weights, None) for _ in range(_weight_count(kind, config))]
+        if any(weight is None for weight in weights):
+            raise ValueError("Bundle has fewer weight tensors than the architecture uses")
+        if kind in _IDENTITY_LAYERS:
+            return inputs[0]
+
+        if config.get("data_format", "channels_last") != "channels_last":
+            raise ValueError(f"Only channels_last is supported ({config['name']})")
+        if tuple(config.get("dilation_rate", (1, 1))) not in ((1, 1), (1,)):
+            raise ValueError(f"Dilated convolutions are not supported ({config['name']})")
+
+        node = _Node(config["name"], kind, config, inputs, weights)
+        if kind in _FOLDABLE_LAYERS:
+            if config.get("use_bias", True):
+                node.bias = node.weights.pop()
+            if kind in ("DepthwiseConv2D", "SeparableConv2D"):
+                # (kh, kw, channels, multiplier) -> (kh, kw, output channels)
+                kh, kw, channels, multiplier = node.weights[0].shape
+                node.weights[0] = node.weights[0].reshape(kh, kw, channels * multiplier)
+            node.activation = _activation(config.get("activation"))
+        self._nodes.append(node)
+        return node.name
+
+    def _resolve(self, name: str) -> str:
+        while name in self._aliases:
+            name = self._aliases[name]
+        return name
+
+    def _fold(self) -> None:
+        """Fold BatchNormalization and ReLU/Activation layers into the layer right before them."""
+        consumers: Dict[str, int] = {}
+        for node in self._nodes:
+            for name in node.inputs:
+                consumers[name] = consumers.get(name, 0) + 1
+        by_name = {node.name: node for node in self._nodes}
+
+        kept = []
+        for node in self._nodes:
+            source = by_name.get(self._resolve(node.inputs[0])) if len(node.inputs) == 1 else None
+            foldable = (
+                source is not None and source.kind in _FOLDABLE_LAYERS
+                and source.activation is None and consumers.get(source.name) == 1
+            )
+            if foldable and node.kind == "BatchNormalization":
+                scale, shift = _batch_norm_affine(node)
+                # The last kernel's output axis is the channel axis
+                source.weights[-1] = source.weights[-1] * scale
+                source.bias = shift if source.bias is None else source.bias * scale + shift
+            elif foldable and node.kind in ("ReLU", "Activation"):
+                source.activation = _layer_activation(node)
+            else:
+                kept.append(node)
+                continue
+            self._aliases[node.name] = source.name
+            consumers[source.name] = consumers.get(node.name, 0)
+
+        self._nodes = kept
+
+    def _compile(self, node: _Node) -> Callable[..., np.ndarray]:
+        kind, config = node.kind, node.config
+        strides = tuple(config.get("strides", (1, 1)))
+        padding = config.get("padding", "valid")
+        bias, activation = node.bias, node.activation
+
+        def finish(out: np.ndarray) -> np.ndarray:
+            if bias is not None:
+                out += bias
+            return activation(out) if activation is not None else out
+
+        if kind == "Conv2D":
+            kernel = np.ascontiguousarray(node.weights[0])
+            return lambda x: finish(_conv2d(x, kernel, strides, padding))
+        if kind == "DepthwiseConv2D":
+            kernel = np.ascontiguousarray(node.weights[0])
+            return lambda x: finish(_depthwise_conv2d(x, kernel, strides, padding))
+        if kind == "SeparableConv2D":
+            depthwise = np.ascontiguousarray(node.weights[0])
+            pointwise = np.ascontiguousarray(node.weights[1])
+            return lambda x: finish(_conv2d(_depthwise_conv2d(x, depthwise, strides, padding), pointwise, (1, 1), "valid"))
+        if kind == "Dense":
+            kernel = np.ascontiguousarray(node.weights[0])
+            return lambda x: finish(x @ kernel)
+        if kind == "BatchNormalization":
+            scale, shift = _batch_norm_affine(node)
+            return lambda x: x * scale + shift
+        if kind in ("ReLU", "Activation"):
+            layer_activation = _layer_activation(node) or (lambda x: x)
+            # Not folded: the input may be read by another layer too, so don't modify it in place
+            return lambda x: layer_activation(x.copy())
+        if kind == "ZeroPadding2D":
+            (top, bottom), (left, right) = _pairs(config["padding"])
+            return lambda x: np.pad(x, ((0, 0), (top, bottom), (left, right), (0, 0)))
+        if kind == "Add":
+            return lambda *xs: sum(xs[1:], xs[0])
+        if kind == "Concatenate":
+            axis = config.get("axis", -1)
+            return lambda *xs: np.concatenate(xs, axis=axis)
+        if kind == "GlobalAveragePooling2D":
+            return lambda x: x.mean(axis=(1, 2))
+        if kind == "GlobalMaxPooling2D":
+            return lambda x: x.max(axis=(1, 2))
+        if kind in ("MaxPooling2D", "AveragePooling2D"):
+            pool = tuple(config["pool_size"])
+            pool_strides = tuple(config.get("strides") or pool)
+            reduce = np.max if kind == "MaxPooling2D" else np.mean
+            return lambda x: _pool2d(x, pool, pool_strides, padding, reduce)
+        if kind == "Flatten":
+            return lambda x: x.reshape(len(x), -1)
+        if kind == "Rescaling":
+            scale, offset = np.float32(config["scale"]), np.float32(config.get("offset", 0.0))
+            return lambda x: x * scale + offset
+        raise ValueError(f"Unsupported layer type: {kind} ({node.name})")
+
+    def _forward(self, batch: np.ndarray) -> np.ndarray:
+        values = {self.input_name: batch}
+        remaining = dict(self._uses)
+        for name, step, inputs in self._steps:
+            values[name] = step(*[values[i] for i in inputs])
+            for i in inputs:
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    del values[i]
+        return values[self.output_name]
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        batch = np.asarray(batch, dtype=np.float32)
+        return np.concatenate([
+            self._forward(batch[start:start + self.max_batch_size])
+            for start in range(0, len(batch), self.max_batch_size)
+        ])
+
+
+def _input_shape(config: Dict[str, Any]) -> Tuple:
+    """(None, H, W, C) from the first InputLayer of a (possibly nested) model config."""
+    for layer in config["config"]["layers"]:
+        if layer["class_name"] == "InputLayer":
+            return tuple(layer["config"]["batch_input_shape"])
+        if layer["class_name"] in ("Sequential", "Functional", "Model"):
+            return _input_shape(layer)
+        shape = layer["config"].get("batch_input_shape")
+        if shape:
+            return tuple(shape)
+    raise ValueError("Architecture has no input shape")
+
+
+def _pairs(padding) -> Tuple[Tuple[int, int], Tuple[int, int]]:
+    """ZeroPadding2D's padding config: an int, (rows, cols) or ((top, bottom), (left, right))."""
+    if isinstance(padding, int):
+        return (padding, padding), (padding, padding)
+    rows, cols = padding
+    rows = (rows, rows) if isinstance(rows, int) else tuple(rows)
+    cols = (cols, cols) if isinstance(cols, int) else tuple(cols)
+    return rows, cols
+
+
+def _batch_norm_affine(node: _Node) -> Tuple[np.ndarray, np.ndarray]:
+    """BatchNormalization at inference as x * scale + shift."""
+    weights = list(node.weights)
+    gamma = weights.pop(0) if node.config.get("scale", True) else 1.0
+    beta = weights.pop(0) if node.config.get("center", True) else 0.0
+    mean, variance = weights
+    scale = (gamma / np.sqrt(variance + node.config.get("epsilon", 1e-3))).astype(np.float32)
+    return scale, (beta - mean * scale).astype(np.float32)
+
+
+def _layer_activation(node: _Node) -> Optional[Callable[[np.ndarray], np.ndarray]]:
+    if node.kind == "Activation":
+        return _activation(node.config["activation"])
+    return _relu(node.config.get("max_value"), node.config.get("negative_slope", 0.0),
+                 node.config.get("threshold", 0.0))
@@ -0,0 +1,215 @@
+"""
+Hot-swappable NSFW model versions.
+
+A candidate bundle is loaded and warmed up in the background while the active
+model keeps serving. promote() then swaps it in between batches with one
+assignment (swap_nsfw_model): batches already running hold their own
+reference to the old model, so it stays alive until the last of them
+finishes and is then released.
+
+While a candidate is loaded, shadow mode re-scores a sample of live batches
+with it on a separate thread and records latency and agreement with the
+active model. Responses always come from the active model.
+"""
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Any, Deque, Dict, List, Optional
+
+import numpy as np
+
+from .nsfw_batcher import _latency_summary
+from .nsfw_model import (
+    NSFW_MODEL_STATE,
+    build_nsfw_model,
+    read_nsfw_model_bundle_at,
+    set_nsfw_shadow_scorer,
+    swap_nsfw_model,
+)
+
+
+class NSFWModelRegistry:
+    """Active/candidate model versions for THIS process, with optional shadow scoring."""
+
+    def __init__(self, models_dir: Path, warmup_runs: int = 3, sample_size: int = 1000):
+        self.models_dir = Path(models_dir).resolve()
+        self.warmup_runs = warmup_runs
+        self._lock = Lock()
+
+        self.candidate: Optional[Dict[str, Any]] = None
+        self.candidate_state: Dict[str, Any] = {"status": "none"}  # none / loading / ready / failed
+        self.shadow_rate = 0.0
+        self.swaps: List[Dict[str, Any]] = []
+
+        # One shadow batch at a time; batches arriving while it runs are skipped
+        self._shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nsfw-shadow")
+        self._shadow_busy = False
+        self._reset_shadow_stats(sample_size)
+
+    def _reset_shadow_stats(self, sample_size: int = 1000) -> None:
+        self.shadow_batches = 0
+        self.shadow_images = 0
+        self.shadow_agreements = 0
+        self.shadow_skipped = 0
+        self.shadow_errors = 0
+        self._active_ms: Deque[float] = deque(maxlen=sample_size)
+        self._candidate_ms: Deque[float] = deque(maxlen=sample_size)
+        self._max_abs_diff: Deque[float] = deque(maxlen=sample_size)
+
+    def resolve_model_path(self, path: str) -> Path:
+        """Candidate bundles must live in the models directory (.kiras files are pickles)."""
+        resolved = (self.models_dir / path).resolve()
+        if resolved.parent != self.models_dir:
+            raise ValueError(f"Model files must be inside {self.models_dir}")
+        if not resolved.exists():
+            raise FileNotFoundError(f"Model file not found: {resolved.name}")
+        return resolved
+
+    def load_candidate(self, path: str, shadow_rate: float = 0.0) -> Dict[str, Any]:
+        """Load and warm up a candidate bundle (blocking; run it off the event loop)."""
+        model_path = self.resolve_model_path(path)
+        with self._lock:
+            if self.candidate_state["status"] == "loading":
+                raise RuntimeError("A candidate model is already loading")
+            self._disable_shadow()
+            self.candidate = None
+            self.candidate_state = {"status": "loading", "source": model_path.name}
+
+        started = time.perf_counter()
+        try:
+            bundle, model_format = read_nsfw_model_bundle_at(model_path)
+            # A sibling <name>.int8.tflite is used when NSFW_BACKEND=tflite
+            base_name = model_path.name.split(".")[0]
+            candidate = build_nsfw_model(bundle, model_path.with_name(f"{base_name}.int8.tflite"))
+            load_seconds = time.perf_counter() - started
+
+            metadata = candidate["metadata"]
+            dummy = np.zeros((1, metadata['img_height'], metadata['img_width'], 3), dtype=np.float32)
+            warmup_ms = []
+            for _ in range(max(self.warmup_runs, 0)):
+                run_started = time.perf_counter()
+                candidate["backend"].predict(dummy)
+                warmup_ms.append(round((time.perf_counter() - run_started) * 1000, 2))
+        except Exception as e:
+            with self._lock:
+                self.candidate_state = {"status": "failed", "source": model_path.name, "error": str(e)}
+            print(f"❌ Failed to load candidate NSFW model {model_path.name}: {e}")
+            raise
+
+        with self._lock:
+            self.candidate = candidate
+            self.candidate_state = {
+                "status": "ready",
+                "source": model_path.name,
+                "format": model_format,
+                "backend": candidate["backend"].name,
+                "model_name": metadata.get("model_name"),
+                "version": metadata.get("version"),
+                "load_seconds": round(load_seconds, 3),
+                "warmup_ms": warmup_ms,
+            }
+            self._reset_shadow_stats()
+            self.shadow_rate = min(max(shadow_rate, 0.0), 1.0)
+            if self.shadow_rate > 0:
+                set_nsfw_shadow_scorer(self._shadow)
+        print(f"✅ Candidate NSFW model {model_path.name} ready in {load_seconds:.3f}s "
+              f"(version {metadata.get('version')}, shadow rate {self.shadow_rate})")
+        return self.status()
+
+    def promote(self) -> Dict[str, Any]:
+        """Make the ready candidate the active model."""
+        with self._lock:
+            if self.candidate is None:
+                raise RuntimeError("No candidate model is ready")
+            candidate, state = self.candidate, self.candidate_state
+            self._disable_shadow()
+            self.candidate = None
+            self.candidate_state = {"status": "none"}
+
+        previous = swap_nsfw_model(candidate, {
+            "format": state["format"],
+            "backend": state["backend"],
+            "load_seconds": state["load_seconds"],
+            "warmup_ms": state["warmup_ms"],
+            "source": state["source"],
+        })
+        swap = {
+            "at": time.time(),
+            "from_version": previous["metadata"].get("version") if previous else None,
+            "to_version": state.get("version"),
+            "source": state["source"],
+        }
+        self.swaps.append(swap)
+        print(f"🔁 NSFW model swapped: {swap['from_version']} -> {swap['to_version']} ({state['source']})")
+        return self.status()
+
+    def discard_candidate(self) -> Dict[str, Any]:
+        with self._lock:
+            self._disable_shadow()
+            self.candidate = None
+            self.candidate_state = {"status": "none"}
+        return self.status()
+
+    def _disable_shadow(self) -> None:
+        self.shadow_rate = 0.0
+        set_nsfw_shadow_scorer(None)
+
+    def _shadow(self, batch: np.ndarray, predictions: np.ndarray, active_ms: float) -> None:
+        """Shadow scorer hook, called on the inference thread: sample and hand off, never block."""
+        candidate = self.candidate
+        if candidate is None or random.random() >= self.shadow_rate:
+            return
+        metadata = candidate["metadata"]
+        if self._shadow_busy or batch.shape[1:3] != (metadata['img_height'], metadata['img_width']):
+            self.shadow_skipped += 1
+            return
+        self._shadow_busy = True
+        # The batch may be a reused input buffer: copy before handing it to another thread
+        self._shadow_executor.submit(self._score_shadow, candidate, batch.copy(), np.array(predictions), active_ms)
+
+    def _score_shadow(self, candidate: Dict[str, Any], batch: np.ndarray, predictions: np.ndarray,
+                      active_ms: float) -> None:
+        try:
+            started = time.perf_counter()
+            shadow_predictions = np.asarray(candidate["backend"].predict(batch))
+            candidate_ms = (time.perf_counter() - started) * 1000
+
+            self.shadow_batches += 1
+            self.shadow_images += len(batch)
+            self.shadow_agreements += int(np.sum(
+                np.argmax(predictions, axis=1) == np.argmax(shadow_predictions, axis=1)
+            ))
+            self._active_ms.append(active_ms)
+            self._candidate_ms.append(candidate_ms)
+            self._max_abs_diff.append(float(np.max(np.abs(predictions - shadow_predictions))))
+        except Exception as e:
+            self.shadow_errors += 1
+            print(f"⚠️ Shadow scoring failed: {e}")
+        finally:
+            self._shadow_busy = False
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "active": {
+                "source": NSFW_MODEL_STATE["source"],
+                "format": NSFW_MODEL_STATE["format"],
+                "backend": NSFW_MODEL_STATE["backend"],
+                "status": NSFW_MODEL_STATE["status"],
+            },
+            "candidate": dict(self.candidate_state),
+            "shadow": {
+                "rate": self.shadow_rate,
+                "batches": self.shadow_batches,
+                "images": self.shadow_images,
+                "skipped": self.shadow_skipped,
+                "errors": self.shadow_errors,
+                "agreement": round(self.shadow_agreements / self.shadow_images, 4) if self.shadow_images else None,
+                "max_abs_prob_diff": _latency_summary(self._max_abs_diff),
+                "active_ms": _latency_summary(self._active_ms),
+                "candidate_ms": _latency_summary(self._candidate_ms),
+            },
+            "swaps": list(self.swaps),
+        }
@@ -0,0 +1,74 @@
+"""
+Cheap checks that settle an image before it reaches the NSFW model.
+
+The extension posts every visible image, including icons, tracking pixels,
+SVG sprites and UI chrome. prepare_nsfw_image() runs these checks first:
+
+    svg        vector markup (PIL can't decode it, and it's UI chrome anyway)
+    too_small  either side below NSFW_TRIAGE_MIN_SIDE, from the header alone
+    uniform    near-constant colour on a downsampled frame
+    low_skin   a colour image with almost no skin-tone pixels
+
+The pixel checks are vectorized NumPy on a ~56x56 subsample of the decoded
+model input. They live outside main.py so inference worker processes can
+import them.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+NSFW_TRIAGE = os.getenv("NSFW_TRIAGE", "true").lower() in ("1", "true", "yes")
+NSFW_TRIAGE_MIN_SIDE = int(os.getenv("NSFW_TRIAGE_MIN_SIDE", "32"))
+# Per-channel standard deviation (0-255) below which an image counts as flat colour
+NSFW_TRIAGE_UNIFORM_STD = float(os.getenv("NSFW_TRIAGE_UNIFORM_STD", "4.0"))
+# Share of skin-tone pixels below which a colour image is skipped (0 disables the check)
+NSFW_TRIAGE_MIN_SKIN_RATIO = float(os.getenv("NSFW_TRIAGE_MIN_SKIN_RATIO", "0.01"))
+# Mean chroma (distance from grey in Cb/Cr) an image needs before skin tones mean anything:
+# greyscale and sepia images are never triaged as low_skin
+_MIN_CHROMA = 8.0
+# Subsampling step applied to the model-sized array (224 -> 56)
+_FRAME_STEP = 4
+
+TRIAGE_REASONS = ("svg", "too_small", "uniform", "low_skin")
+
+
+def triage_bytes(image_data: bytes) -> Optional[str]:
+    head = image_data[:512].lstrip().lower()
+    if head.startswith(b"<svg") or (head.startswith(b"<?xml") and b"<svg" in head):
+        return "svg"
+    return None
+
+
+def triage_size(width: int, height: int) -> Optional[str]:
+    if min(width, height) < NSFW_TRIAGE_MIN_SIDE:
+        return "too_small"
+    return None
+
+
+def skin_ratio(frame: np.ndarray) -> float:
+    """Share of pixels inside the classic YCbCr skin box (77<=Cb<=127, 133<=Cr<=173)."""
+    rgb = frame.reshape(-1, 3).astype(np.float32)
+    r, g, b = rgb[:, 0], rgb[:, 1], rgb[:, 2]
+    cb = 128.0 - 0.168736 * r - 0.331264 * g + 0.5 * b
+    cr = 128.0 + 0.5 * r - 0.418688 * g - 0.081312 * b
+    skin = (cb >= 77) & (cb <= 127) & (cr >= 133) & (cr <= 173)
+    return float(np.count_nonzero(skin)) / len(rgb)
+
+
+def triage_pixels(image: np.ndarray) -> Optional[str]:
+    """Pixel checks on an HxWx3 uint8 image (the decoded model input)."""
+    frame = image[::_FRAME_STEP, ::_FRAME_STEP]
+    if frame.size == 0:
+        return "too_small"
+
+    pixels = frame.reshape(-1, 3).astype(np.float32)
+    if float(pixels.std(axis=0).max()) < NSFW_TRIAGE_UNIFORM_STD:
+        return "uniform"
+
+    if NSFW_TRIAGE_MIN_SKIN_RATIO > 0:
+        r, g, b = pixels[:, 0], pixels[:, 1], pixels[:, 2]
+        chroma = np.abs(-0.168736 * r - 0.331264 * g + 0.5 * b) + np.abs(0.5 * r - 0.418688 * g - 0.081312 * b)
+        if float(chroma.mean()) >= _MIN_CHROMA and skin_ratio(frame) < NSFW_TRIAGE_MIN_SKIN_RATIO:
+            return "low_skin"
+    return None
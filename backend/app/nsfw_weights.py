@@ -0,0 +1,118 @@
+"""
+Memory-mappable weights format for the NSFW model.
+
+The .kiras bundle is a pickle, so every worker has to unpickle (slow, and
+unsafe for untrusted files) and keep a private copy of all weights. This
+format stores the same content as two files:
+
+    sentry_content_filter.weights.json   metadata, class_indices, architecture
+                                         and an index of every tensor
+    sentry_content_filter.weights.bin    raw little-endian tensors, 64-byte aligned
+
+The .bin file is opened with np.memmap, so loading is just a JSON parse
+instead of an unpickle. That speeds up loading; it does not by itself share
+the weights between workers. The Keras backend copies every tensor into its
+own TF variables, and the NumPy backend copies the kernels it folds
+BatchNormalization into. Only tensors that stay memmap views are shared
+through the page cache.
+"""
+import json
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+FORMAT_NAME = "sentry-weights"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+
+def read_kiras_bundle(kiras_path: Path) -> Dict[str, Any]:
+    """Unpickle a .kiras bundle (only use on trusted files)."""
+    with open(kiras_path, 'rb') as f:
+        return pickle.load(f)
+
+
+def weights_paths(base_path: Path):
+    """(sidecar json, binary weights) paths for a model base path without extension."""
+    base_path = Path(base_path)
+    return (
+        base_path.with_name(base_path.name + ".weights.json"),
+        base_path.with_name(base_path.name + ".weights.bin"),
+    )
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def save_weights_bundle(bundle: Dict[str, Any], base_path: Path) -> Path:
+    """Write a model bundle (architecture/weights/metadata/class_indices) in the mmap format."""
+    sidecar_path, bin_path = weights_paths(base_path)
+    tensors: List[Dict[str, Any]] = []
+
+    offset = 0
+    with open(bin_path, 'wb') as f:
+        for weight in bundle["weights"]:
+            array = np.ascontiguousarray(weight)
+            array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+            padding = (-offset) % ALIGNMENT
+            f.write(b"\0" * padding)
+            offset += padding
+            f.write(array.tobytes())
+            tensors.append({
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+                "nbytes": array.nbytes,
+            })
+            offset += array.nbytes
+
+    sidecar = {
+        "format": FORMAT_NAME,
+        "format_version": FORMAT_VERSION,
+        "weights_file": bin_path.name,
+        "metadata": bundle["metadata"],
+        "class_indices": bundle["class_indices"],
+        "architecture": bundle["architecture"],
+        "tensors": tensors,
+    }
+    with open(sidecar_path, 'w', encoding='utf-8') as f:
+        json.dump(sidecar, f, indent=2, default=_json_default)
+    return sidecar_path
+
+
+def load_weights_bundle(sidecar_path: Path) -> Dict[str, Any]:
+    """
+    Load a bundle written by save_weights_bundle(). The returned "weights" are
+    read-only views into one shared np.memmap of the .bin file.
+    """
+    sidecar_path = Path(sidecar_path)
+    with open(sidecar_path, 'r', encoding='utf-8') as f:
+        sidecar = json.load(f)
+
+    if sidecar.get("format") != FORMAT_NAME:
+        raise ValueError(f"{sidecar_path} is not a {FORMAT_NAME} file")
+    if sidecar.get("format_version", 0) > FORMAT_VERSION:
+        raise ValueError(f"Unsupported {FORMAT_NAME} version: {sidecar.get('format_version')}")
+
+    bin_path = sidecar_path.with_name(sidecar["weights_file"])
+    buffer = np.memmap(bin_path, dtype=np.uint8, mode='r')
+
+    weights = []
+    for tensor in sidecar["tensors"]:
+        start = tensor["offset"]
+        raw = buffer[start:start + tensor["nbytes"]]
+        weights.append(raw.view(np.dtype(tensor["dtype"])).reshape(tensor["shape"]))
+
+    return {
+        "architecture": sidecar["architecture"],
+        "weights": weights,
+        "metadata": sidecar["metadata"],
+        "class_indices": sidecar["class_indices"],
+    }
@@ -0,0 +1,228 @@
+"""
+Pre-fork multi-worker server (Linux).
+
+    python -m app.prefork --workers 4 --port 8000
+
+`uvicorn --workers N` starts N fresh interpreters that each import TensorFlow
+and load the NSFW model on their own. Here one parent process does the
+fork-safe part of that once (see prepare_nsfw_model_for_fork()), binds the
+listening socket and forks the workers, which share those pages copy-on-write.
+app.main itself is imported in each worker: it opens Firestore/Gemini gRPC
+channels, which must not be shared across fork().
+
+The parent restarts workers that die, and prints a memory report once the
+workers are up (and again on SIGUSR1).
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import Dict, List, Optional
+
+from .nsfw_model import prepare_nsfw_model_for_fork
+
+# A worker that exits this soon after starting is treated as a startup failure, not restarted
+MIN_WORKER_UPTIME_SECONDS = 10
+
+
+def memory_usage(pid: int) -> Dict[str, float]:
+    """RSS/PSS/private/shared memory of a process in MB, from /proc/<pid>/smaps_rollup."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {
+        "rss_mb": values.get("Rss", 0.0),
+        "pss_mb": values.get("Pss", 0.0),
+        "private_mb": values.get("Private_Clean", 0.0) + values.get("Private_Dirty", 0.0),
+        "shared_mb": values.get("Shared_Clean", 0.0) + values.get("Shared_Dirty", 0.0),
+        # Heap pages. File-backed pages (libraries, mmap weights) are shared between
+        # processes with or without pre-forking, anonymous ones only through fork()
+        "anon_mb": values.get("Anonymous", 0.0),
+        "pss_anon_mb": values.get("Pss_Anon", 0.0),
+    }
+
+
+def memory_report(parent_pid: int, worker_pids: List[int], preload_mb: Optional[float] = None) -> Dict[str, object]:
+    """
+    Per-process memory, and the anonymous memory saved compared to starting the
+    same workers independently (uvicorn --workers), where each would hold all of
+    its heap privately. The parent's own heap is counted against the saving.
+    """
+    processes = []
+    for role, pid in [("parent", parent_pid)] + [(f"worker-{i}", pid) for i, pid in enumerate(worker_pids)]:
+        try:
+            processes.append({"role": role, "pid": pid, **memory_usage(pid)})
+        except OSError:
+            continue
+
+    workers = [p for p in processes if p["role"] != "parent"]
+    independent_mb = sum(p["anon_mb"] for p in workers)
+    preforked_mb = sum(p["pss_anon_mb"] for p in processes)
+    saved_mb = independent_mb - preforked_mb
+    return {
+        "processes": processes,
+        "preload_mb": preload_mb,
+        "workers": len(workers),
+        "independent_anon_mb": independent_mb,
+        "preforked_anon_mb": preforked_mb,
+        "saved_mb": saved_mb,
+        "saved_per_worker_mb": saved_mb / len(workers) if workers else 0.0,
+    }
+
+
+def print_memory_report(report: Dict[str, object]) -> None:
+    print("📊 Pre-fork memory report (MB)")
+    print(f"   {'role':<10} {'pid':>7} {'rss':>9} {'pss':>9} {'private':>9} {'shared':>9} {'anon':>9} {'anon pss':>9}")
+    for p in report["processes"]:
+        print(f"   {p['role']:<10} {p['pid']:>7} {p['rss_mb']:>9.1f} {p['pss_mb']:>9.1f} {p['private_mb']:>9.1f} "
+              f"{p['shared_mb']:>9.1f} {p['anon_mb']:>9.1f} {p['pss_anon_mb']:>9.1f}")
+    if report["preload_mb"] is not None:
+        print(f"   Preloaded in the parent: {report['preload_mb']:.1f} MB RSS")
+    print(f"   Heap of {report['workers']} independent workers: {report['independent_anon_mb']:.1f} MB, "
+          f"pre-forked (incl. parent): {report['preforked_anon_mb']:.1f} MB")
+    print(f"   Saved by pre-forking: {report['saved_mb']:.1f} MB ({report['saved_per_worker_mb']:.1f} MB per worker)")
+
+
+def _bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(sock: socket.socket, args: argparse.Namespace) -> None:
+    """Worker body after fork(): serve the app on the inherited socket."""
+    # Own process group: Ctrl-C reaches only the parent, which stops workers once with SIGTERM
+    os.setpgid(0, 0)
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGUSR1):
+        signal.signal(signum, signal.SIG_DFL)
+    # The parent's objects stay frozen (permanent generation): collections here only
+    # walk what this worker allocates, so they never write to the shared pages
+    gc.enable()
+
+    import uvicorn
+
+    config = uvicorn.Config("app.main:app", log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(args: argparse.Namespace) -> None:
+    # No collections while preloading: freed objects would leave holes in the pages that
+    # later allocations (in the workers) fill, un-sharing them. gc.freeze() below keeps
+    # the workers' collections away from everything allocated up to the fork
+    gc.disable()
+    parent_pid = os.getpid()
+    rss_before = memory_usage(parent_pid)["rss_mb"]
+    started = time.perf_counter()
+    preloaded = prepare_nsfw_model_for_fork()
+    # Heavy web-stack imports are shared too; app.main itself is imported per worker
+    import fastapi  # noqa: F401
+    import uvicorn  # noqa: F401
+    preload_mb = memory_usage(parent_pid)["rss_mb"] - rss_before
+    print(f"✅ Pre-fork parent ready in {time.perf_counter() - started:.1f}s "
+          f"(model preloaded: {preloaded or 'no'}, +{preload_mb:.1f} MB)")
+
+    sock = _bind_socket(args.host, args.port)
+    gc.freeze()
+
+    workers: Dict[int, tuple] = {}  # pid -> (index, started_at)
+    stopping = False
+    report_requested = False
+
+    def spawn(index: int) -> None:
+        pid = os.fork()
+        if pid == 0:
+            # os._exit() skips the interpreter's own error reporting, so report here
+            exit_code = 0
+            try:
+                _run_worker(sock, args)
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    exit_code = e.code or 0
+                else:
+                    print(e.code)
+                    exit_code = 1
+            except BaseException:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(exit_code)
+        workers[pid] = (index, time.monotonic())
+        print(f"⚙️ Worker {index} started (pid {pid})")
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def request_report(signum, frame):
+        nonlocal report_requested
+        report_requested = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR1, request_report)
+
+    for index in range(args.workers):
+        spawn(index)
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} pre-forked workers "
+          f"(memory report: kill -USR1 {parent_pid})")
+
+    report_at = time.monotonic() + args.report_after if args.report_after >= 0 else None
+    while workers:
+        if report_requested or (report_at is not None and time.monotonic() >= report_at):
+            report_requested, report_at = False, None
+            print_memory_report(memory_report(parent_pid, list(workers), preload_mb))
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        if pid not in workers:
+            continue
+        index, started_at = workers.pop(pid)
+        # Exit code, or -N when killed by signal N
+        status = os.waitstatus_to_exitcode(status)
+        if stopping:
+            continue
+        if time.monotonic() - started_at < MIN_WORKER_UPTIME_SECONDS:
+            print(f"❌ Worker {index} exited during startup (status {status}), shutting down")
+            stop(None, None)
+            continue
+        print(f"⚠️ Worker {index} (pid {pid}) exited with status {status}, restarting")
+        spawn(index)
+
+    sock.close()
+    print("👋 All workers stopped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the backend with pre-forked workers sharing one loaded model")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Keep-alive timeout in seconds")
+    parser.add_argument("--report-after", type=float, default=30,
+                        help="Seconds after startup to print the memory report (-1 to disable)")
+    serve(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Single-flight deduplication of concurrent identical work.
+
+The same image often arrives several times at once (repeated on a page, or
+one viral post opened by several family members). SingleFlight keeps a table
+of in-flight calls: the first caller for a key starts the work, concurrent
+callers with the same key await the same task instead of downloading or
+scoring the image again. Keys are forgotten as soon as the call finishes;
+finished results are the verdict caches' job.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+class SingleFlight:
+    """In-flight call table for THIS process. kind groups the counters (e.g. "fetch", "analysis")."""
+
+    def __init__(self, enabled: bool = True, kinds: Tuple[str, ...] = ()):
+        self.enabled = enabled
+        self._calls: Dict[str, asyncio.Task] = {}
+
+        # Metrics per kind: calls that did the work, and duplicates that joined one
+        self.started: Dict[str, int] = {kind: 0 for kind in kinds}
+        self.joined: Dict[str, int] = {kind: 0 for kind in kinds}
+
+    async def run(self, key: Optional[str], work: Callable[[], Awaitable[Any]], kind: str) -> Tuple[Any, bool]:
+        """
+        (result, shared): await work() or, if a call with the same key is in
+        flight, its result (shared=True). Exceptions are shared the same way.
+        """
+        if not self.enabled or key is None:
+            return await work(), False
+        task = self._calls.get(key)
+        if task is not None:
+            self.joined[kind] = self.joined.get(kind, 0) + 1
+            # shield: a caller that goes away doesn't cancel the work for the others
+            return await asyncio.shield(task), True
+
+        self.started[kind] = self.started.get(kind, 0) + 1
+        task = asyncio.ensure_future(work())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
+
+    def metrics(self) -> Dict[str, Any]:
+        kinds = sorted(set(self.started) | set(self.joined))
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._calls),
+            **{
+                kind: {
+                    "started": self.started.get(kind, 0),
+                    # Duplicate downloads / analyses that were avoided
+                    "avoided": self.joined.get(kind, 0),
+                }
+                for kind in kinds
+            },
+        }
@@ -0,0 +1,350 @@
+"""
+Verdict caches for the image endpoints.
+
+PerceptualVerdictCache maps near-identical images (same picture at another
+size or JPEG quality) to a cached predict_nsfw result, so a repeated meme or
+thumbnail costs a hash computation instead of a forward pass.
+
+VerdictCache remembers finished responses under exact keys: the normalized
+image URL (checked before downloading) and the SHA-256 of the image bytes
+(checked after downloading, before inference).
+"""
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import numpy as np
+from PIL import Image
+
+# Number of set bits for every byte value, for vectorized Hamming distances
+_POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dhash(image: np.ndarray, hash_size: int = 8) -> int:
+    """
+    64-bit difference hash: shrink to a (hash_size+1) x hash_size grayscale
+    thumbnail and record whether each pixel is brighter than its right
+    neighbour. Robust to rescaling and recompression.
+    """
+    thumbnail = Image.fromarray(np.asarray(image, dtype=np.uint8)).convert('L')
+    thumbnail = thumbnail.resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PerceptualVerdictCache:
+    """
+    LRU + TTL cache keyed by perceptual hash. A lookup matches any cached hash
+    within max_distance bits (Hamming distance); max_distance=0 means exact
+    hash matches only.
+    """
+
+    def __init__(self, capacity: int = 10000, ttl_seconds: float = 3600, max_distance: int = 2):
+        self.capacity = max(1, capacity)
+        self.ttl_seconds = ttl_seconds
+        self.max_distance = max(0, max_distance)
+
+        # hash -> (slot, result, expires_at), oldest first
+        self._entries: "OrderedDict[int, Tuple[int, Dict[str, Any], float]]" = OrderedDict()
+        # Hashes by slot for vectorized near-match scans
+        self._hashes = np.zeros(self.capacity, dtype=np.uint64)
+        self._occupied = np.zeros(self.capacity, dtype=bool)
+        self._free_slots = list(range(self.capacity - 1, -1, -1))
+        self._lock = Lock()
+
+        # Metrics
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _remove(self, image_hash: int) -> None:
+        slot, _, _ = self._entries.pop(image_hash)
+        self._occupied[slot] = False
+        self._free_slots.append(slot)
+
+    def _nearest(self, image_hash: int) -> Optional[int]:
+        """Closest cached hash within max_distance bits, if any."""
+        if self.max_distance == 0 or not self._entries:
+            return None
+        slots = np.flatnonzero(self._occupied)
+        xor = np.bitwise_xor(self._hashes[slots], np.uint64(image_hash))
+        distances = _POPCOUNT_TABLE[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return int(self._hashes[slots[best]])
+
+    def get(self, image_hash: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            key = image_hash if image_hash in self._entries else self._nearest(image_hash)
+            if key is None:
+                self.misses += 1
+                return None
+
+            _, result, expires_at = self._entries[key]
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            if key == image_hash:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            return result
+
+    def put(self, image_hash: int, result: Dict[str, Any]) -> None:
+        with self._lock:
+            if image_hash in self._entries:
+                self._remove(image_hash)
+            while not self._free_slots:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+            slot = self._free_slots.pop()
+            self._hashes[slot] = np.uint64(image_hash)
+            self._occupied[slot] = True
+            self._entries[image_hash] = (slot, result, time.monotonic() + self.ttl_seconds)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._occupied[:] = False
+            self._free_slots = list(range(self.capacity - 1, -1, -1))
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "capacity": self.capacity,
+            "ttl_seconds": self.ttl_seconds,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.near_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def normalize_image_url(url: str) -> str:
+    """Canonical form of an image URL: lowercase scheme/host, no default port or fragment, sorted query."""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        # Malformed (e.g. port out of range): the download will report it, the key is the raw URL
+        return url.strip()
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or "/", query, ""))
+
+
+def content_digest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class VerdictCache:
+    """
+    Exact-match LRU + TTL cache of JSON-serializable responses, bounded by an
+    approximate memory budget. When disk_path is set, entries evicted from
+    memory are queued and written to a SQLite file in one batch by flush()
+    (called periodically, and at close() together with everything still in
+    memory), so warm verdicts survive restarts. The disk tier is only touched
+    from worker threads: get() looks up memory misses with asyncio.to_thread.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        ttl_seconds: float = 86400,
+        disk_path: Optional[Path] = None,
+        disk_max_entries: int = 100000,
+    ):
+        self.max_bytes = max(1, max_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.disk_max_entries = disk_max_entries
+
+        # key -> (value, size in bytes, expires_at as wall-clock time so it survives restarts)
+        self._entries: "OrderedDict[str, Tuple[Dict[str, Any], int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+        # Evicted entries waiting for the next flush() (still served from here until then)
+        self._pending: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+        # Disk I/O has its own lock so lookups in memory never wait for SQLite
+        self._db_lock = Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if disk_path:
+            disk_path = Path(disk_path)
+            disk_path.parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM verdicts WHERE expires_at < ?", (time.time(),))
+            self._db.commit()
+
+        # Metrics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spilled = 0
+        self.flushes = 0
+
+    @property
+    def disk_enabled(self) -> bool:
+        return self._db is not None
+
+    def _spill(self, items) -> None:
+        """Write (key, value, expires_at) entries to the disk store and trim it to disk_max_entries (caller holds _db_lock)."""
+        if self._db is None or not items:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO verdicts (key, value, expires_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(value), expires_at) for key, value, expires_at in items],
+        )
+        self._db.execute(
+            "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY expires_at ASC "
+            "LIMIT max(0, (SELECT COUNT(*) FROM verdicts) - ?))",
+            (self.disk_max_entries,),
+        )
+        self._db.commit()
+        self.spilled += len(items)
+        self.flushes += 1
+
+    def _store(self, key: str, value: Dict[str, Any], expires_at: float) -> None:
+        """Insert into memory and queue LRU entries over the budget for the disk (caller holds the lock)."""
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._pending.pop(key, None)
+        size = len(key) + len(json.dumps(value))
+        self._entries[key] = (value, size, expires_at)
+        self._bytes += size
+
+        now = time.time()
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            old_key, (old_value, old_size, old_expires_at) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+            if self._db is not None and old_expires_at > now:
+                self._pending[old_key] = (old_value, old_expires_at)
+        # Between flushes the queue can't outgrow what the disk would keep anyway
+        while len(self._pending) > self.disk_max_entries:
+            self._pending.popitem(last=False)
+
+    def _get_memory(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self._bytes -= size
+            pending = self._pending.pop(key, None)
+            if pending is not None and pending[1] > time.time():
+                self._store(key, *pending)
+                self.hits += 1
+                return pending[0]
+            return None
+
+    def _get_disk(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._db_lock:
+            if self._db is None:
+                return None
+            row = self._db.execute(
+                "SELECT value, expires_at FROM verdicts WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        with self._lock:
+            self._store(key, value, row[1])
+            self.disk_hits += 1
+        return value
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self._get_memory(key)
+        if value is None and self._db is not None:
+            value = await asyncio.to_thread(self._get_disk, key)
+        if value is None:
+            self.misses += 1
+        return value
+
+    def put(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._store(key, value, time.time() + self.ttl_seconds)
+
+    def flush(self) -> None:
+        """Write the queued evictions to disk in one transaction (blocking: call from a worker thread)."""
+        with self._lock:
+            now = time.time()
+            items = [(key, value, expires_at) for key, (value, expires_at) in self._pending.items() if expires_at > now]
+            self._pending.clear()
+        with self._db_lock:
+            self._spill(items)
+
+    def clear(self) -> None:
+        """Drop every entry, in memory and on disk."""
+        with self._lock:
+            self._entries.clear()
+            self._pending.clear()
+            self._bytes = 0
+        with self._db_lock:
+            if self._db is not None:
+                self._db.execute("DELETE FROM verdicts")
+                self._db.commit()
+
+    def close(self) -> None:
+        """Spill the queue and everything still in memory to disk (if enabled) and close the store."""
+        with self._lock:
+            now = time.time()
+            items = [(key, value, expires_at) for key, (value, expires_at) in self._pending.items()]
+            items += [(key, value, expires_at) for key, (value, _, expires_at) in self._entries.items()]
+            items = [item for item in items if item[2] > now]
+            self._pending.clear()
+        with self._db_lock:
+            if self._db is None:
+                return
+            self._spill(items)
+            self._db.close()
+            self._db = None
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            "disk": self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "pending": len(self._pending),
+            "spilled": self.spilled,
+            "flushes": self.flushes,
+        }
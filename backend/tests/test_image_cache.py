@@ -0,0 +1,101 @@
+import asyncio
+import http.server
+import io
+import threading
+
+import pytest
+from PIL import Image
+
+from app.image_cache import ImageDiskCache
+from app.image_fetch import ImageFetcher
+
+
+def _jpeg(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+IMAGES = {"/fresh.jpg": _jpeg((200, 30, 30)), "/etag.jpg": _jpeg((30, 200, 30))}
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def do_GET(self):
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/etag.jpg" and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = IMAGES[self.path]
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(body)))
+        if self.path == "/fresh.jpg":
+            self.send_header("Cache-Control", "max-age=3600")
+        else:
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    _Handler.requests = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+async def _fetch_all(cache, urls):
+    fetcher = ImageFetcher(cache=cache)
+    try:
+        return [await fetcher.fetch(url) for url in urls], fetcher
+    finally:
+        await fetcher.close()
+
+
+def test_max_age_hit_and_etag_revalidation(server, tmp_path):
+    cache = ImageDiskCache(tmp_path)
+    urls = [f"{server}/fresh.jpg", f"{server}/etag.jpg"] * 2
+    bodies, fetcher = asyncio.run(_fetch_all(cache, urls))
+
+    assert bodies == [IMAGES["/fresh.jpg"], IMAGES["/etag.jpg"]] * 2
+    # The fresh image is not requested again, the no-cache one is revalidated with a 304
+    assert _Handler.requests == [("/fresh.jpg", None), ("/etag.jpg", None), ("/etag.jpg", '"v1"')]
+    assert cache.metrics()["hits"] == 1
+    assert cache.metrics()["revalidated"] == 1
+    assert fetcher.requests == 3
+    cache.close()
+
+
+def test_entries_survive_a_restart(server, tmp_path):
+    cache = ImageDiskCache(tmp_path)
+    asyncio.run(_fetch_all(cache, [f"{server}/fresh.jpg"]))
+    cache.close()
+
+    restarted = ImageDiskCache(tmp_path)
+    bodies, fetcher = asyncio.run(_fetch_all(restarted, [f"{server}/fresh.jpg"]))
+    assert bodies == [IMAGES["/fresh.jpg"]]
+    assert fetcher.requests == 0
+    assert len(_Handler.requests) == 1
+    restarted.close()
+
+
+def test_failing_cache_falls_back_to_download(server, tmp_path):
+    cache = ImageDiskCache(tmp_path)
+    cache.close()
+    bodies, fetcher = asyncio.run(_fetch_all(cache, [f"{server}/fresh.jpg"]))
+    assert bodies == [IMAGES["/fresh.jpg"]]
+    assert fetcher.requests == 1
+    assert fetcher.metrics()["cache_errors"] == 2
@@ -0,0 +1,50 @@
+import asyncio
+
+import pytest
+
+from app.image_fetch import ImageFetcher, ImageRejectedError, sniff_image_format
+from app.nsfw_triage import triage_bytes
+
+SVG = b'<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"></svg>'
+RSS = b'<?xml version="1.0"?>\n<rss version="2.0"><channel><title>feed</title></channel></rss>'
+
+
+def test_sniff_svg_matches_triage():
+    assert sniff_image_format(SVG) == "SVG"
+    assert sniff_image_format(b"  <svg></svg>") == "SVG"
+    assert triage_bytes(SVG) == "svg"
+
+
+def test_other_xml_is_not_an_image():
+    assert sniff_image_format(RSS) is None
+    assert triage_bytes(RSS) is None
+    fetcher = ImageFetcher()
+    with pytest.raises(ImageRejectedError) as rejected:
+        fetcher.check_bytes(RSS)
+    assert rejected.value.reason == "not_an_image"
+
+
+async def _chunks(data, size):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def test_read_body_in_small_chunks(monkeypatch):
+    fetcher = ImageFetcher()
+    probes = []
+    check_header = fetcher.check_header
+    monkeypatch.setattr(fetcher, "check_header", lambda head, final=False: probes.append(len(head)) or check_header(head, final))
+    # A header PIL can't size from a prefix: the probe keeps failing up to HEADER_PROBE_BYTES
+    data = b"\xff\xd8\xff\xe0" + b"\0" * 300_000
+    assert asyncio.run(fetcher.read_body(_chunks(data, 1024))) == data
+    # Re-probed only as the buffer doubles, not once per 1 KB chunk
+    assert len(probes) <= 10
+
+
+def test_read_body_rejects_oversized_pixels_early():
+    fetcher = ImageFetcher(max_pixels=1000)
+    png = b"\x89PNG\r\n\x1a\n" + b"\0\0\0\rIHDR" + (2000).to_bytes(4, "big") * 2 + b"\0" * 100_000
+    with pytest.raises(ImageRejectedError) as rejected:
+        asyncio.run(fetcher.read_body(_chunks(png, 4096), str(len(png))))
+    assert rejected.value.reason == "too_many_pixels"
+    assert fetcher.bytes_avoided == len(png) - 4096
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+
+from app.nsfw_batcher import NSFWBatcher
+
+
+class _SlowModel:
+    """predict_batch stand-in that records how many batches run at the same time."""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, images):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(self.seconds)
+        with self.lock:
+            self.running -= 1
+        return [float(image[0, 0, 0]) for image in images]
+
+
+async def _submit_waves(batcher, waves, per_wave):
+    results = []
+    for wave in range(waves):
+        images = [np.full((2, 2, 3), wave * per_wave + index, dtype=np.float32) for index in range(per_wave)]
+        results.append([asyncio.create_task(batcher.submit(image)) for image in images])
+        # Let the scheduler pick this wave up as its own batch
+        await asyncio.sleep(0.05)
+    values = [await asyncio.gather(*tasks) for tasks in results]
+    await batcher.stop()
+    return values
+
+
+def test_batches_run_concurrently_up_to_max_in_flight():
+    model = _SlowModel(0.3)
+    batcher = NSFWBatcher(model, window_ms=1, max_batch_size=4, max_in_flight=2)
+    values = asyncio.run(_submit_waves(batcher, waves=3, per_wave=4))
+
+    # Every caller gets its own result back
+    assert values == [[float(wave * 4 + index) for index in range(4)] for wave in range(3)]
+    assert model.peak == 2
+    assert batcher.batches == 3
+
+
+def test_single_batch_in_flight_by_default():
+    model = _SlowModel(0.1)
+    batcher = NSFWBatcher(model, window_ms=1, max_batch_size=4)
+    asyncio.run(_submit_waves(batcher, waves=2, per_wave=2))
+    assert model.peak == 1
@@ -0,0 +1,26 @@
+from app.nsfw_buffers import BatchBufferPool
+
+
+def test_overlapping_batches_of_different_sizes():
+    pool = BatchBufferPool(8, 8, max_buffers=4)
+    with pool.batch(4) as outer:
+        with pool.batch(1) as inner:
+            assert inner.shape == (1, 8, 8, 3)
+        assert outer.shape == (4, 8, 8, 3)
+    # Two free buffers (capacities 1 and 4): the fitting one isn't first in the free list
+    with pool.batch(3) as batch:
+        assert batch.shape == (3, 8, 8, 3)
+    assert pool.reused == 1
+    assert pool.overflows == 0
+
+
+def test_replaces_too_small_buffer_at_the_limit():
+    pool = BatchBufferPool(8, 8, max_buffers=2)
+    with pool.batch(4):
+        with pool.batch(1):
+            pass
+    with pool.batch(2):
+        with pool.batch(8) as batch:
+            assert batch.shape == (8, 8, 8, 3)
+    assert pool.grown == 1
+    assert pool.metrics()["buffers"] == 2
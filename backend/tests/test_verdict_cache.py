@@ -0,0 +1,38 @@
+import asyncio
+
+from app.verdict_cache import VerdictCache, normalize_image_url
+
+
+def test_normalize_image_url():
+    assert normalize_image_url(" HTTP://Example.COM:80/a.jpg?b=2&a=1#top ") == "http://example.com/a.jpg?a=1&b=2"
+    assert normalize_image_url("https://example.com:8443/a.jpg") == "https://example.com:8443/a.jpg"
+
+
+def test_normalize_malformed_url_falls_back_to_raw():
+    assert normalize_image_url(" http://a:99999/x.jpg ") == "http://a:99999/x.jpg"
+    assert normalize_image_url("http://[::1/x.jpg") == "http://[::1/x.jpg"
+
+
+def test_evictions_spill_to_disk_on_flush(tmp_path):
+    path = tmp_path / "verdicts.sqlite3"
+    cache = VerdictCache(max_bytes=200, disk_path=path)
+    for index in range(10):
+        cache.put(f"nsfw:url:{index}", {"safe": True, "index": index})
+    assert cache.evictions > 0
+    assert cache.spilled == 0
+    # Queued evictions are still served before the flush
+    assert asyncio.run(cache.get("nsfw:url:0")) == {"safe": True, "index": 0}
+
+    cache.flush()
+    assert cache.flushes == 1
+    assert cache.metrics()["pending"] == 0
+    cache.close()
+
+    restarted = VerdictCache(max_bytes=200, disk_path=path)
+    assert [asyncio.run(restarted.get(f"nsfw:url:{index}")) for index in range(10)] == [
+        {"safe": True, "index": index} for index in range(10)
+    ]
+    assert restarted.disk_hits > 0
+    assert asyncio.run(restarted.get("nsfw:url:missing")) is None
+    assert restarted.misses == 1
+    restarted.close()
@@ -0,0 +1,116 @@
+"""
+Benchmark the image payload sent to Gemini: SDK default vs. prepare_gemini_image().
+
+Run from the backend/ directory:
+
+    python -m tools.bench_gemini_image
+    python -m tools.bench_gemini_image --images path/to/sample/images --max-edge 768 --format webp
+    python -m tools.bench_gemini_image --images path/to/sample/images --calls 3 --output gemini_image.json
+
+Without --calls only the payloads are compared. Passing a PIL image to
+generate_content makes the SDK send it as a full-resolution lossless WebP;
+the prepared path sends a downscaled JPEG/WebP blob without metadata. With
+--calls N (needs GEMINI_API_KEY) each image is also sent N times per variant
+with a short prompt, reporting the median latency and the prompt token count.
+"""
+import argparse
+import io
+import json
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+from PIL import Image
+
+from app.gemini_image import prepare_gemini_image
+from tools.bench_preprocess import SYNTHETIC_SIZES, encode_jpeg
+from tools.image_sets import list_image_files, synthetic_images
+
+PROMPT = "Is this image safe for children? Answer with one word: safe or unsafe."
+
+
+def sdk_blob(image_data: bytes) -> Tuple[bytes, float]:
+    """What generate_content([prompt, PIL image]) uploads, and the ms spent encoding it."""
+    from google.generativeai.types import content_types
+
+    started = time.perf_counter()
+    blob = content_types.image_to_blob(Image.open(io.BytesIO(image_data)))
+    return blob.data, (time.perf_counter() - started) * 1000
+
+
+def time_gemini(model, image: Any, calls: int) -> Dict[str, Any]:
+    latencies, tokens = [], None
+    for _ in range(calls):
+        started = time.perf_counter()
+        response = model.generate_content([PROMPT, image])
+        latencies.append((time.perf_counter() - started) * 1000)
+        tokens = getattr(response.usage_metadata, "prompt_token_count", None)
+    return {"median_ms": round(statistics.median(latencies), 1), "prompt_tokens": tokens}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, default=None, help="Folder of local sample images")
+    parser.add_argument("--count", type=int, default=3, help="Images per synthetic size")
+    parser.add_argument("--max-edge", type=int, default=1024)
+    parser.add_argument("--format", choices=["jpeg", "webp"], default="jpeg")
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--calls", type=int, default=0, help="Gemini calls per image and variant (0 = payloads only)")
+    parser.add_argument("--output", type=Path, default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    samples: List[Tuple[str, bytes]] = []
+    if args.images:
+        samples = [(path.name, path.read_bytes()) for path in list_image_files(args.images)]
+    else:
+        for width, height in SYNTHETIC_SIZES:
+            for index, array in enumerate(synthetic_images(args.count, height=height, width=width)):
+                samples.append((f"JPEG {width}x{height} #{index}", encode_jpeg(array)))
+    if not samples:
+        raise SystemExit(f"❌ No images found in {args.images}")
+
+    model = None
+    if args.calls:
+        import google.generativeai as genai
+        genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+        model = genai.GenerativeModel("gemini-2.5-flash")
+
+    rows = []
+    print(f"Prepared: max edge {args.max_edge}, {args.format} q{args.quality}")
+    print(f"{'image':<28}{'original KB':>12}{'SDK KB':>10}{'sent KB':>10}{'saved':>8}{'SDK ms':>9}{'prep ms':>9}")
+    for label, image_data in samples:
+        sdk_data, sdk_ms = sdk_blob(image_data)
+        prepared = prepare_gemini_image(image_data, args.max_edge, args.format, args.quality)
+        row = {
+            "image": label,
+            "original_bytes": len(image_data),
+            "sdk_bytes": len(sdk_data),
+            "sent_bytes": prepared["sent_bytes"],
+            "sent_size": prepared["sent_size"],
+            "sdk_encode_ms": round(sdk_ms, 2),
+            "prepare_ms": round(prepared["prepare_ms"], 2),
+        }
+        if model is not None:
+            row["gemini_sdk"] = time_gemini(model, Image.open(io.BytesIO(image_data)), args.calls)
+            row["gemini_prepared"] = time_gemini(model, prepared["blob"], args.calls)
+        rows.append(row)
+        print(f"{label[:27]:<28}{row['original_bytes'] / 1024:>12.1f}{row['sdk_bytes'] / 1024:>10.1f}"
+              f"{row['sent_bytes'] / 1024:>10.1f}{1 - row['sent_bytes'] / row['sdk_bytes']:>7.1%}"
+              f"{row['sdk_encode_ms']:>9.1f}{row['prepare_ms']:>9.1f}")
+        if model is not None:
+            print(f"{'':<28}Gemini {row['gemini_sdk']['median_ms']:.0f} ms ({row['gemini_sdk']['prompt_tokens']} tokens) -> "
+                  f"{row['gemini_prepared']['median_ms']:.0f} ms ({row['gemini_prepared']['prompt_tokens']} tokens)")
+
+    sdk_total = sum(row["sdk_bytes"] for row in rows)
+    sent_total = sum(row["sent_bytes"] for row in rows)
+    print(f"\nTotal: SDK {sdk_total / 1024:.0f} KB -> sent {sent_total / 1024:.0f} KB ({1 - sent_total / sdk_total:.1%} saved)")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({"max_edge": args.max_edge, "format": args.format, "quality": args.quality, "images": rows}, f, indent=2)
+        print(f"✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Memory benchmark: RSS of the NSFW inference path under sustained load.
+
+Run from the backend/ directory:
+
+    python -m tools.bench_memory
+    NSFW_BUFFER_POOL=false python -m tools.bench_memory --output no_pool.json
+    python -m tools.bench_memory --batches 5000 --output pool.json --compare no_pool.json
+
+Scores --batches batches of mixed sizes (1 to --max-batch, as the batcher and
+/analyze-images-nsfw produce them) through predict_nsfw_batch and samples the
+process RSS every --sample-every batches. After the warm-up share of the run,
+RSS should stay flat: the report shows the growth after warm-up and the
+fitted slope in MB per 1000 batches, plus the input buffer pool counters.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.nsfw_model import (
+    NSFW_BUFFER_POOL,
+    NSFW_MODEL_STATE,
+    load_nsfw_model,
+    nsfw_buffer_pools,
+    predict_nsfw_batch,
+    warm_up_nsfw_model,
+)
+from tools.bench_nsfw import peak_rss_mb
+from tools.image_sets import synthetic_images
+
+
+def current_rss_mb() -> float:
+    """Current resident set size (Linux); falls back to the peak elsewhere."""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+def summarize_rss(samples: List[Dict[str, float]], warmup_share: float) -> Dict[str, Any]:
+    steady = samples[int(len(samples) * warmup_share):] or samples
+    batches = np.array([sample["batch"] for sample in steady], dtype=np.float64)
+    rss = np.array([sample["rss_mb"] for sample in steady], dtype=np.float64)
+    slope = float(np.polyfit(batches, rss, 1)[0]) * 1000 if len(steady) > 1 else 0.0
+    return {
+        "start_mb": round(samples[0]["rss_mb"], 1),
+        "after_warmup_mb": round(float(rss[0]), 1),
+        "end_mb": round(float(rss[-1]), 1),
+        "max_mb": round(float(rss.max()), 1),
+        "growth_after_warmup_mb": round(float(rss[-1] - rss[0]), 1),
+        "slope_mb_per_1000_batches": round(slope, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=2000)
+    parser.add_argument("--max-batch", type=int, default=16)
+    parser.add_argument("--sample-every", type=int, default=20, help="Batches between RSS samples")
+    parser.add_argument("--warmup-share", type=float, default=0.2, help="Share of the run excluded as warm-up")
+    parser.add_argument("--output", type=Path, default=Path("nsfw_memory.json"))
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier result file to diff against")
+    args = parser.parse_args()
+
+    model_data = load_nsfw_model()
+    if model_data is None:
+        raise SystemExit("❌ NSFW model could not be loaded")
+    warm_up_nsfw_model()
+    metadata = model_data["metadata"]
+
+    # Decoded images as prepare_nsfw_image hands them over: model-sized uint8 arrays
+    images = synthetic_images(64, height=metadata['img_height'], width=metadata['img_width'])
+    rng = np.random.default_rng(0)
+    sizes = rng.integers(1, args.max_batch + 1, args.batches)
+    print(f"Scoring {args.batches} batches of 1-{args.max_batch} images, backend {NSFW_MODEL_STATE['backend']}, "
+          f"buffer pool {'on' if NSFW_BUFFER_POOL else 'off'}")
+
+    samples = [{"batch": 0, "rss_mb": current_rss_mb()}]
+    started = time.perf_counter()
+    for i, size in enumerate(sizes, start=1):
+        offset = int(rng.integers(0, len(images)))
+        predict_nsfw_batch([images[(offset + j) % len(images)] for j in range(size)])
+        if i % args.sample_every == 0 or i == args.batches:
+            samples.append({"batch": i, "rss_mb": current_rss_mb()})
+    elapsed = time.perf_counter() - started
+
+    results = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "backend": NSFW_MODEL_STATE["backend"],
+        "buffer_pool": NSFW_BUFFER_POOL,
+        "batches": args.batches,
+        "images": int(sizes.sum()),
+        "images_per_s": round(float(sizes.sum()) / elapsed, 1),
+        "rss": summarize_rss(samples, args.warmup_share),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "input_buffers": nsfw_buffer_pools.metrics(),
+        "samples": samples,
+    }
+
+    rss = results["rss"]
+    print(f"RSS: start {rss['start_mb']} MB, after warm-up {rss['after_warmup_mb']} MB, end {rss['end_mb']} MB, "
+          f"max {rss['max_mb']} MB")
+    print(f"     growth after warm-up {rss['growth_after_warmup_mb']:+.1f} MB, "
+          f"slope {rss['slope_mb_per_1000_batches']:+.3f} MB per 1000 batches ({results['images_per_s']} img/s)")
+    for pool in results["input_buffers"]["pools"]:
+        print(f"     buffers {pool['input_size']}: {pool['buffers']} allocated, reuse rate {pool['reuse_rate']}, "
+              f"{pool['overflows']} overflows")
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["rss"]
+        print(f"\nChange vs. {args.compare}:")
+        for key in ("after_warmup_mb", "end_mb", "max_mb", "growth_after_warmup_mb", "slope_mb_per_1000_batches"):
+            print(f"   {key:<28}{baseline[key]:>10} -> {rss[key]:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Benchmark the NSFW inference path stage by stage.
+
+Run from the backend/ directory:
+
+    python -m tools.bench_nsfw
+    python -m tools.bench_nsfw --images path/to/sample/images --output after.json
+    python -m tools.bench_nsfw --output after.json --compare before.json
+
+For every batch size (1, 8, 32, 64 by default) it times decode, resize,
+normalize and the forward pass separately, reports p50/p95/p99 latency per
+batch and end-to-end throughput, and records peak RSS. Results are written
+as JSON; --compare prints the change against an earlier run.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+from PIL import Image
+
+from app.nsfw_model import (
+    NSFW_MODEL_STATE,
+    NSFW_RESAMPLE,
+    load_nsfw_model,
+    open_nsfw_image,
+    preprocess_nsfw_batch,
+    resize_for_model,
+    warm_up_nsfw_model,
+)
+from tools.image_sets import list_image_files, synthetic_images
+
+STAGES = ["decode", "resize", "normalize", "forward", "total"]
+SYNTHETIC_SIZES = [(640, 480), (1280, 720), (1920, 1080)]
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples, dtype=np.float64)
+    return {
+        "mean": round(float(values.mean()), 3),
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p95": round(float(np.percentile(values, 95)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def encode_jpeg(array: np.ndarray, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def load_samples(args) -> List[bytes]:
+    if args.images:
+        return [path.read_bytes() for path in list_image_files(args.images, args.count)]
+    samples = []
+    for width, height in SYNTHETIC_SIZES:
+        samples.extend(encode_jpeg(array) for array in synthetic_images(args.count, height=height, width=width))
+    return samples
+
+
+def run_batch(model_data: Dict[str, Any], samples: List[bytes]) -> Dict[str, float]:
+    """Score one batch the way the server does, returning milliseconds per stage."""
+    metadata = model_data["metadata"]
+    target_w, target_h = metadata['img_width'], metadata['img_height']
+    timings = {}
+
+    started = time.perf_counter()
+    images = [open_nsfw_image(data, (target_w, target_h)) for data in samples]
+    # Image.open is lazy: force the pixel decode inside this stage
+    for img in images:
+        img.load()
+    timings["decode"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    arrays = [np.asarray(resize_for_model(img, target_w, target_h)) for img in images]
+    timings["resize"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = preprocess_nsfw_batch(arrays, target_h, target_w)
+    timings["normalize"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    model_data["backend"].predict(batch)
+    timings["forward"] = time.perf_counter() - started
+
+    timings["total"] = sum(timings.values())
+    return {stage: seconds * 1000 for stage, seconds in timings.items()}
+
+
+def bench_batch_size(model_data: Dict[str, Any], samples: List[bytes], batch_size: int,
+                     iterations: int) -> Dict[str, Any]:
+    def batch_at(i: int) -> List[bytes]:
+        return [samples[(i * batch_size + j) % len(samples)] for j in range(batch_size)]
+
+    # First call per batch shape (re)builds the graph: keep it out of the numbers
+    run_batch(model_data, batch_at(0))
+
+    per_stage: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    for i in range(iterations):
+        for stage, ms in run_batch(model_data, batch_at(i + 1)).items():
+            per_stage[stage].append(ms)
+
+    total_seconds = sum(per_stage["total"]) / 1000
+    return {
+        "batch_size": batch_size,
+        "iterations": iterations,
+        "latency_ms": {stage: summarize(values) for stage, values in per_stage.items()},
+        "per_image_ms": {stage: round(float(np.mean(values)) / batch_size, 3) for stage, values in per_stage.items()},
+        "throughput_images_per_s": round(batch_size * iterations / total_seconds, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def environment() -> Dict[str, Any]:
+    info = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "backend": NSFW_MODEL_STATE["backend"],
+        "format": NSFW_MODEL_STATE["format"],
+        "resample": NSFW_RESAMPLE,
+    }
+    try:
+        import tensorflow as tf
+        info["tensorflow"] = tf.__version__
+    except ImportError:
+        pass
+    return info
+
+
+def print_results(results: Dict[str, Any]) -> None:
+    print(f"{'batch':>6}{'img/s':>10}" + "".join(f"{stage + ' p50':>15}" for stage in STAGES)
+          + f"{'total p95':>12}{'total p99':>12}{'peak RSS':>11}")
+    for run in results["runs"]:
+        latency = run["latency_ms"]
+        print(f"{run['batch_size']:>6}{run['throughput_images_per_s']:>10.1f}"
+              + "".join(f"{latency[stage]['p50']:>15.2f}" for stage in STAGES)
+              + f"{latency['total']['p95']:>12.2f}{latency['total']['p99']:>12.2f}{run['peak_rss_mb']:>9.1f}MB")
+
+
+def print_comparison(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    """Relative change of p50 per stage and of throughput against a previous run (negative = faster)."""
+    previous_runs = {run["batch_size"]: run for run in baseline["runs"]}
+    print(f"\nChange vs. {baseline.get('label') or baseline.get('created_at')}:")
+    print(f"{'batch':>6}{'img/s':>10}" + "".join(f"{stage + ' p50':>15}" for stage in STAGES))
+    for run in results["runs"]:
+        previous = previous_runs.get(run["batch_size"])
+        if previous is None:
+            continue
+        row = f"{run['batch_size']:>6}"
+        row += f"{(run['throughput_images_per_s'] / previous['throughput_images_per_s'] - 1) * 100:>+9.1f}%"
+        for stage in STAGES:
+            before = previous["latency_ms"][stage]["p50"]
+            after = run["latency_ms"][stage]["p50"]
+            row += f"{(after / before - 1) * 100:>+14.1f}%" if before else f"{'-':>15}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, default=None, help="Folder of local sample images (default: synthetic)")
+    parser.add_argument("--count", type=int, default=16, help="Synthetic images per size, or max local images")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--iterations", type=int, default=20, help="Timed batches per batch size")
+    parser.add_argument("--output", type=Path, default=Path("nsfw_bench.json"))
+    parser.add_argument("--label", default=None, help="Name for this run (e.g. a branch or commit)")
+    parser.add_argument("--compare", type=Path, default=None, help="Earlier result file to diff against")
+    args = parser.parse_args()
+
+    model_data = load_nsfw_model()
+    if model_data is None:
+        raise SystemExit("❌ NSFW model could not be loaded")
+    warm_up_nsfw_model()
+
+    samples = load_samples(args)
+    if not samples:
+        raise SystemExit("❌ No sample images found")
+    print(f"Benchmarking {len(samples)} {'local' if args.images else 'synthetic'} images, "
+          f"backend {NSFW_MODEL_STATE['backend']}, {args.iterations} batches per size")
+
+    results = {
+        "label": args.label,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "environment": environment(),
+        "images": str(args.images) if args.images else "synthetic",
+        "sample_count": len(samples),
+        "runs": [bench_batch_size(model_data, samples, size, args.iterations) for size in args.batch_sizes],
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+    print_results(results)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
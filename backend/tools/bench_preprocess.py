@@ -0,0 +1,103 @@
+"""
+Benchmark NSFW image preprocessing: the original full-resolution path vs. the
+current reduced-size decode + single-pass normalization.
+
+Run from the backend/ directory:
+
+    python -m tools.bench_preprocess
+    python -m tools.bench_preprocess --images path/to/sample/images
+
+Reports the median cost per image for each path and the mean absolute pixel
+difference between their outputs (in 0-255 units).
+"""
+import argparse
+import io
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.nsfw_model import NSFW_RESAMPLE, preprocess_nsfw_batch, resize_for_model
+from tools.image_sets import list_image_files, synthetic_images
+
+TARGET_H, TARGET_W = 224, 224
+SYNTHETIC_SIZES = [(640, 480), (1920, 1080), (4032, 3024)]
+
+
+def legacy_preprocess(image_data: bytes) -> np.ndarray:
+    """The original path: full decode, per-image fromarray + LANCZOS, np.max, astype, divide."""
+    img = Image.open(io.BytesIO(image_data))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img_array = np.expand_dims(np.array(img), axis=0)
+    resized = []
+    for i in range(img_array.shape[0]):
+        resized_img = Image.fromarray(img_array[i].astype('uint8'))
+        resized_img = resized_img.resize((TARGET_W, TARGET_H), Image.Resampling.LANCZOS)
+        resized.append(np.array(resized_img))
+    img_array = np.array(resized)
+    if np.max(img_array) > 1:
+        img_array = img_array.astype('float32') / 255.0
+    return img_array
+
+
+def current_preprocess(image_data: bytes) -> np.ndarray:
+    """The current path: JPEG draft decode, cheap resize, normalize into the batch buffer."""
+    img = Image.open(io.BytesIO(image_data))
+    img.draft('RGB', (TARGET_W, TARGET_H))
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    img = resize_for_model(img, TARGET_W, TARGET_H)
+    return preprocess_nsfw_batch([np.asarray(img)], TARGET_H, TARGET_W)
+
+
+def time_per_image(fn: Callable[[bytes], np.ndarray], samples: List[bytes], repeats: int) -> float:
+    """Median milliseconds per image over all samples and repeats."""
+    timings = []
+    for _ in range(repeats):
+        for image_data in samples:
+            started = time.perf_counter()
+            fn(image_data)
+            timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def encode_jpeg(array: np.ndarray, quality: int = 90) -> bytes:
+    buffer = io.BytesIO()
+    Image.fromarray(array).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, default=None, help="Folder of local sample images")
+    parser.add_argument("--count", type=int, default=5, help="Images per synthetic size")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    groups: List[Tuple[str, List[bytes]]] = []
+    if args.images:
+        groups.append((str(args.images), [path.read_bytes() for path in list_image_files(args.images)]))
+    else:
+        for width, height in SYNTHETIC_SIZES:
+            images = synthetic_images(args.count, height=height, width=width)
+            groups.append((f"JPEG {width}x{height}", [encode_jpeg(array) for array in images]))
+
+    print(f"Resample filter: {NSFW_RESAMPLE} (legacy: lanczos)")
+    print(f"{'input':<22}{'legacy ms':>12}{'current ms':>12}{'speedup':>10}{'pixel diff':>12}")
+    for label, samples in groups:
+        if not samples:
+            continue
+        legacy_ms = time_per_image(legacy_preprocess, samples, args.repeats)
+        current_ms = time_per_image(current_preprocess, samples, args.repeats)
+        diff = np.mean([
+            np.abs(legacy_preprocess(data) - current_preprocess(data)).mean() * 255 for data in samples
+        ])
+        print(f"{label:<22}{legacy_ms:>12.2f}{current_ms:>12.2f}{legacy_ms / current_ms:>9.1f}x{diff:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Parity check: quantized TFLite (or NumPy) backend vs. the full-precision Keras model.
+
+Run from the backend/ directory:
+
+    python -m tools.check_quantized_parity --images path/to/sample/images
+    python -m tools.check_quantized_parity --images path/to/sample/images --backend numpy --tolerance 0.001
+
+Compares class probabilities image by image and exits with status 1 when the
+largest probability drift exceeds --tolerance or the predicted classes agree
+on fewer than --min-agreement of the images.
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.nsfw_backends import KerasBackend, NumpyBackend, TFLiteBackend
+from app.nsfw_model import NSFW_TFLITE_PATH, preprocess_nsfw_batch, read_nsfw_model_bundle
+from tools.image_sets import load_image_folder, synthetic_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, default=None, help="Folder of local test images")
+    parser.add_argument("--limit", type=int, default=500)
+    parser.add_argument("--backend", choices=["tflite", "numpy"], default="tflite", help="Backend to check")
+    parser.add_argument("--tflite", type=Path, default=NSFW_TFLITE_PATH)
+    parser.add_argument("--tolerance", type=float, default=0.05, help="Maximum allowed absolute probability drift")
+    parser.add_argument("--min-agreement", type=float, default=0.98, help="Minimum share of images with the same class")
+    args = parser.parse_args()
+
+    bundle, _ = read_nsfw_model_bundle()
+    if bundle is None:
+        raise SystemExit("❌ NSFW model not found")
+    if args.backend == "tflite" and not args.tflite.exists():
+        raise SystemExit(f"❌ TFLite model not found at {args.tflite}, run tools/export_tflite.py first")
+    metadata = bundle["metadata"]
+
+    if args.images:
+        samples = load_image_folder(args.images, args.limit)
+    else:
+        print("⚠️ No --images given, comparing on synthetic images only")
+        samples = [(Path(f"synthetic-{i}"), array) for i, array in enumerate(synthetic_images(32))]
+    if not samples:
+        raise SystemExit("❌ No images found")
+
+    keras_backend = KerasBackend(bundle)
+    candidate_backend = TFLiteBackend(args.tflite) if args.backend == "tflite" else NumpyBackend(bundle)
+
+    drifts = []
+    agreements = 0
+    keras_ms = []
+    candidate_ms = []
+    for path, array in samples:
+        batch = preprocess_nsfw_batch([array], metadata['img_height'], metadata['img_width']).astype(np.float32)
+
+        started = time.perf_counter()
+        expected = keras_backend.predict(batch)[0]
+        keras_ms.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        actual = candidate_backend.predict(batch)[0]
+        candidate_ms.append((time.perf_counter() - started) * 1000)
+
+        drift = float(np.max(np.abs(expected - actual)))
+        drifts.append(drift)
+        if np.argmax(expected) == np.argmax(actual):
+            agreements += 1
+        elif drift > args.tolerance:
+            print(f"   ✗ {path}: keras={np.round(expected, 4)} {args.backend}={np.round(actual, 4)}")
+
+    drifts = np.array(drifts)
+    agreement = agreements / len(samples)
+    print(f"📊 {len(samples)} images | class agreement {agreement:.2%} | "
+          f"drift mean {drifts.mean():.4f}, p95 {np.percentile(drifts, 95):.4f}, max {drifts.max():.4f}")
+    print(f"   Latency per image: keras {np.median(keras_ms):.1f} ms, {args.backend} {np.median(candidate_ms):.1f} ms (median)")
+
+    if drifts.max() > args.tolerance or agreement < args.min_agreement:
+        print(f"❌ Parity check failed (tolerance {args.tolerance}, min agreement {args.min_agreement:.0%})")
+        sys.exit(1)
+    print("✅ Parity check passed")
+
+
+if __name__ == "__main__":
+    main()
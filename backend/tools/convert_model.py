@@ -0,0 +1,55 @@
+"""
+Convert the pickled .kiras bundle to the memory-mappable weights format.
+
+Run from the backend/ directory:
+
+    python -m tools.convert_model
+    python -m tools.convert_model --input path/to/model.kiras --output path/to/model
+
+The server picks up app/models/sentry_content_filter.weights.{json,bin}
+automatically; the .kiras file keeps working as a fallback.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.nsfw_model import NSFW_MODEL_PATH
+from app.nsfw_weights import load_weights_bundle, read_kiras_bundle, save_weights_bundle, weights_paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--input", type=Path, default=NSFW_MODEL_PATH, help="Path to the .kiras bundle")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Output base path without extension (default: next to the input)")
+    args = parser.parse_args()
+
+    output = args.output or args.input.with_suffix("")
+
+    started = time.perf_counter()
+    bundle = read_kiras_bundle(args.input)
+    unpickle_seconds = time.perf_counter() - started
+
+    sidecar_path = save_weights_bundle(bundle, output)
+    _, bin_path = weights_paths(output)
+
+    # Read it back and make sure every tensor survived the round trip
+    started = time.perf_counter()
+    converted = load_weights_bundle(sidecar_path)
+    mmap_seconds = time.perf_counter() - started
+
+    if len(converted["weights"]) != len(bundle["weights"]):
+        raise SystemExit("❌ Tensor count mismatch after conversion")
+    for index, (original, loaded) in enumerate(zip(bundle["weights"], converted["weights"])):
+        if original.shape != loaded.shape or not np.array_equal(original, loaded):
+            raise SystemExit(f"❌ Tensor {index} differs after conversion")
+
+    print(f"✅ Wrote {sidecar_path} and {bin_path} ({bin_path.stat().st_size / 1e6:.1f} MB, "
+          f"{len(converted['weights'])} tensors)")
+    print(f"   Load time: pickle {unpickle_seconds * 1000:.1f} ms -> mmap {mmap_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
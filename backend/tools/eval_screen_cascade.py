@@ -0,0 +1,136 @@
+"""
+Evaluate the screening model cascade: recall trade-off and throughput gain.
+
+Run from the backend/ directory:
+
+    python -m tools.eval_screen_cascade --images path/to/labeled/images
+    python -m tools.eval_screen_cascade --images path/to/labeled/images --thresholds 0.02 0.05 0.1 --output cascade.json
+
+--images must contain one subfolder per class (as for tools.train_screen_model).
+Both models score every image once; each threshold is then applied to all
+non-safe classes. For every threshold the report shows the share of images
+escalated to the full model, per-class recall of the cascade next to the
+full model alone, and the expected throughput gain:
+
+    t_full / (t_screen + escalation_rate * t_full)
+
+with t_* the measured per-image forward times at --batch-size.
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.nsfw_model import (
+    NSFW_SCREEN_MODEL_PATH,
+    build_nsfw_model,
+    load_nsfw_model,
+    preprocess_nsfw_batch,
+    read_nsfw_model_bundle_at,
+    screen_thresholds,
+)
+from tools.image_sets import load_labeled_folder
+
+
+def score(model_data: Dict[str, Any], arrays: List[np.ndarray], batch_size: int):
+    """Probabilities for every image and the forward time per image in ms (after one warm-up batch)."""
+    metadata = model_data["metadata"]
+    inputs = preprocess_nsfw_batch(arrays, metadata['img_height'], metadata['img_width'])
+    model_data["backend"].predict(inputs[:batch_size])
+
+    predictions = []
+    started = time.perf_counter()
+    for start in range(0, len(inputs), batch_size):
+        predictions.append(model_data["backend"].predict(inputs[start:start + batch_size]))
+    per_image_ms = (time.perf_counter() - started) * 1000 / len(inputs)
+    return np.concatenate(predictions), per_image_ms
+
+
+def recall_by_class(predicted: np.ndarray, labels: np.ndarray, classes: List[str]) -> Dict[str, float]:
+    return {
+        name: round(float(np.mean(predicted[labels == index] == index)), 4)
+        for index, name in enumerate(classes) if np.any(labels == index)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, required=True, help="Folder with one subfolder per class")
+    parser.add_argument("--limit", type=int, default=None, help="Max images per class")
+    parser.add_argument("--screen", type=Path, default=NSFW_SCREEN_MODEL_PATH, help="Screening model bundle")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.02, 0.05, 0.1, 0.2, 0.3, 0.5])
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--output", type=Path, default=None, help="Write the report as JSON")
+    args = parser.parse_args()
+
+    full = load_nsfw_model()
+    if full is None:
+        raise SystemExit("❌ NSFW model could not be loaded")
+    if not args.screen.exists():
+        raise SystemExit(f"❌ Screening model not found: {args.screen} (train one with tools.train_screen_model)")
+    bundle, _ = read_nsfw_model_bundle_at(args.screen)
+    screen = build_nsfw_model(bundle, tflite_path=None)
+
+    classes = [full["idx_to_class"][i] for i in range(len(full["idx_to_class"]))]
+    screen_classes = [screen["idx_to_class"][i] for i in range(len(screen["idx_to_class"]))]
+    if screen_classes != classes:
+        raise SystemExit(f"❌ Class mismatch: full model {classes}, screening model {screen_classes}")
+
+    samples = load_labeled_folder(args.images, classes, args.limit)
+    if not samples:
+        raise SystemExit(f"❌ No labeled images found in {args.images} (expected subfolders {classes})")
+    arrays = [array for _, array, _ in samples]
+    labels = np.array([full["class_indices"][label] for _, _, label in samples])
+
+    full_predictions, full_ms = score(full, arrays, args.batch_size)
+    screen_predictions, screen_ms = score(screen, arrays, args.batch_size)
+    full_classes = np.argmax(full_predictions, axis=1)
+    screen_classes_pred = np.argmax(screen_predictions, axis=1)
+    print(f"Evaluating {len(samples)} images, full model {full_ms:.2f} ms/image, "
+          f"screening model {screen_ms:.2f} ms/image (batch {args.batch_size})")
+
+    full_recall = recall_by_class(full_classes, labels, classes)
+    runs = []
+    for threshold in args.thresholds:
+        suspicious = np.any(screen_predictions >= screen_thresholds(classes, {}, threshold), axis=1)
+        cascade_classes = np.where(suspicious, full_classes, screen_classes_pred)
+        escalation_rate = float(np.mean(suspicious))
+        runs.append({
+            "threshold": threshold,
+            "escalation_rate": round(escalation_rate, 4),
+            "recall": recall_by_class(cascade_classes, labels, classes),
+            "accuracy": round(float(np.mean(cascade_classes == labels)), 4),
+            # Images the full model gets right and the cascade gets wrong
+            "lost_vs_full": int(np.sum((full_classes == labels) & (cascade_classes != labels))),
+            "throughput_gain": round(full_ms / (screen_ms + escalation_rate * full_ms), 2),
+        })
+
+    print(f"{'threshold':>10}{'escalated':>11}{'accuracy':>10}{'gain':>7}"
+          + "".join(f"{'recall ' + name:>16}" for name in classes))
+    print(f"{'full only':>10}{'100.0%':>11}{np.mean(full_classes == labels):>10.3f}{1.0:>6.2f}x"
+          + "".join(f"{full_recall.get(name, float('nan')):>16.3f}" for name in classes))
+    for run in runs:
+        print(f"{run['threshold']:>10}{run['escalation_rate'] * 100:>10.1f}%{run['accuracy']:>10.3f}"
+              f"{run['throughput_gain']:>6.2f}x"
+              + "".join(f"{run['recall'].get(name, float('nan')):>16.3f}" for name in classes))
+
+    if args.output:
+        report = {
+            "images": str(args.images),
+            "sample_count": len(samples),
+            "batch_size": args.batch_size,
+            "full_ms_per_image": round(full_ms, 3),
+            "screen_ms_per_image": round(screen_ms, 3),
+            "full_only": {"recall": full_recall, "accuracy": round(float(np.mean(full_classes == labels)), 4)},
+            "runs": runs,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
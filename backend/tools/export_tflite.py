@@ -0,0 +1,69 @@
+"""
+Export the NSFW model to a quantized TFLite graph for NSFW_BACKEND=tflite.
+
+Run from the backend/ directory:
+
+    python -m tools.export_tflite --images path/to/sample/images
+    python -m tools.export_tflite --mode dynamic
+
+--mode int8 (default) quantizes weights AND activations to int8 and needs a
+representative image set for calibration (synthetic images are used if none
+is given, which works but calibrates worse). --mode dynamic only quantizes
+the weights. Always check the result with tools/check_quantized_parity.py.
+"""
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+from app.nsfw_backends import build_keras_model
+from app.nsfw_model import NSFW_TFLITE_PATH, preprocess_nsfw_batch, read_nsfw_model_bundle
+from tools.image_sets import load_image_folder, synthetic_images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, default=None, help="Folder of representative images for calibration")
+    parser.add_argument("--limit", type=int, default=200, help="Maximum calibration images")
+    parser.add_argument("--mode", choices=["int8", "dynamic"], default="int8")
+    parser.add_argument("--output", type=Path, default=NSFW_TFLITE_PATH)
+    args = parser.parse_args()
+
+    import tensorflow as tf
+
+    bundle, model_format = read_nsfw_model_bundle()
+    if bundle is None:
+        raise SystemExit("❌ NSFW model not found")
+    metadata = bundle["metadata"]
+    model = build_keras_model(bundle)
+    print(f"📦 Loaded Keras model ({model_format}), exporting {args.mode} TFLite graph")
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+
+    if args.mode == "int8":
+        if args.images:
+            samples = [array for _, array in load_image_folder(args.images, args.limit)]
+        else:
+            print("⚠️ No --images given, calibrating on synthetic images")
+            samples = synthetic_images(min(args.limit, 32))
+        if not samples:
+            raise SystemExit("❌ No calibration images found")
+
+        def representative_dataset():
+            for sample in samples:
+                yield [preprocess_nsfw_batch([sample], metadata['img_height'], metadata['img_width']).astype(np.float32)]
+
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        # Keep float32 I/O so callers don't have to know the quantization parameters
+        converter.inference_input_type = tf.float32
+        converter.inference_output_type = tf.float32
+
+    tflite_model = converter.convert()
+    args.output.write_bytes(tflite_model)
+    print(f"✅ Wrote {args.output} ({len(tflite_model) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
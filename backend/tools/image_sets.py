@@ -0,0 +1,54 @@
+"""Helpers for loading local sample images used by the offline tools."""
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".bmp"}
+
+
+def list_image_files(folder: Path, limit: Optional[int] = None) -> List[Path]:
+    """All image files under folder (recursively), sorted for reproducible runs."""
+    files = sorted(
+        path for path in Path(folder).rglob("*")
+        if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS
+    )
+    return files[:limit] if limit else files
+
+
+def load_image_folder(folder: Path, limit: Optional[int] = None) -> List[Tuple[Path, np.ndarray]]:
+    """Decode every image under folder to an RGB array, skipping files PIL can't open."""
+    images = []
+    for path in list_image_files(folder, limit):
+        try:
+            with Image.open(path) as img:
+                images.append((path, np.array(img.convert('RGB'))))
+        except Exception as e:
+            print(f"⚠️ Skipping {path}: {e}")
+    return images
+
+
+def synthetic_images(count: int, height: int = 480, width: int = 640, seed: int = 0) -> List[np.ndarray]:
+    """Random smooth RGB images for runs without a local sample set."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        # Upsampled low-resolution noise looks more like a photo than per-pixel noise
+        small = rng.integers(0, 256, (height // 16 + 1, width // 16 + 1, 3), dtype=np.uint8)
+        img = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+        images.append(np.array(img))
+    return images
+
+
+def load_labeled_folder(folder: Path, classes: List[str],
+                        limit: Optional[int] = None) -> List[Tuple[Path, np.ndarray, str]]:
+    """Images from folder/<class name>/ subfolders, as (path, RGB array, class name)."""
+    images = []
+    for name in classes:
+        class_folder = Path(folder) / name
+        if not class_folder.is_dir():
+            print(f"⚠️ No folder for class '{name}' in {folder}")
+            continue
+        images.extend((path, array, name) for path, array in load_image_folder(class_folder, limit))
+    return images
@@ -0,0 +1,131 @@
+"""
+Train the tiny first-stage screening model for the NSFW cascade.
+
+Run from the backend/ directory:
+
+    python -m tools.train_screen_model --images path/to/labeled/images
+    python -m tools.train_screen_model --images path/to/labeled/images --distill
+
+--images must contain one subfolder per class of the full model (e.g. safe/
+and unsafe/). With --distill the screen learns the full model's probabilities
+instead of the folder labels, so it mimics the model it sits in front of.
+
+The result is written next to the full model as sentry_screen.weights.{json,bin},
+where the server picks it up (see NSFW_SCREEN_* in app/nsfw_model.py). Check
+the recall trade-off with tools.eval_screen_cascade before deploying it.
+"""
+import argparse
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app.nsfw_model import (
+    NSFW_MODEL_PATH,
+    NSFW_SCREEN_MODEL_PATH,
+    load_nsfw_model,
+    preprocess_nsfw_batch,
+)
+from app.nsfw_weights import save_weights_bundle
+from tools.image_sets import load_labeled_folder
+
+
+def build_screen_model(input_size: int, num_classes: int):
+    """Four strided conv blocks and a softmax head: ~15k parameters at 96x96."""
+    from tensorflow import keras
+
+    return keras.Sequential([
+        keras.layers.Input(shape=(input_size, input_size, 3)),
+        keras.layers.Conv2D(16, 3, strides=2, padding="same", activation="relu"),
+        keras.layers.Conv2D(32, 3, strides=2, padding="same", activation="relu"),
+        keras.layers.SeparableConv2D(64, 3, strides=2, padding="same", activation="relu"),
+        keras.layers.SeparableConv2D(96, 3, strides=2, padding="same", activation="relu"),
+        keras.layers.GlobalAveragePooling2D(),
+        keras.layers.Dense(num_classes, activation="softmax"),
+    ], name="sentry_screen")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=Path, required=True, help="Folder with one subfolder per class")
+    parser.add_argument("--limit", type=int, default=None, help="Max images per class")
+    parser.add_argument("--input-size", type=int, default=96)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--distill", action="store_true", help="Train on the full model's probabilities")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--version", default="1.0.0")
+    parser.add_argument("--output", type=Path, default=None,
+                        help="Output base path without extension (default: next to the full model)")
+    args = parser.parse_args()
+
+    model_data = load_nsfw_model()
+    if model_data is None:
+        raise SystemExit("❌ NSFW model could not be loaded")
+    class_indices = model_data["class_indices"]
+    classes = [model_data["idx_to_class"][i] for i in range(len(class_indices))]
+
+    samples = load_labeled_folder(args.images, classes, args.limit)
+    if not samples:
+        raise SystemExit(f"❌ No labeled images found in {args.images} (expected subfolders {classes})")
+    counts = {name: sum(1 for _, _, label in samples if label == name) for name in classes}
+    print(f"Training on {len(samples)} images {counts}, input {args.input_size}x{args.input_size}")
+
+    arrays = [array for _, array, _ in samples]
+    inputs = preprocess_nsfw_batch(arrays, args.input_size, args.input_size)
+    if args.distill:
+        metadata = model_data["metadata"]
+        full_inputs = preprocess_nsfw_batch(arrays, metadata['img_height'], metadata['img_width'])
+        targets = np.concatenate([
+            model_data["backend"].predict(full_inputs[start:start + args.batch_size])
+            for start in range(0, len(full_inputs), args.batch_size)
+        ])
+    else:
+        targets = np.eye(len(classes), dtype=np.float32)[[class_indices[label] for _, _, label in samples]]
+
+    # validation_split takes the last rows, which would otherwise all be the last class
+    order = np.random.default_rng(args.seed).permutation(len(inputs))
+    inputs, targets = inputs[order], targets[order]
+
+    from tensorflow import keras
+
+    model = build_screen_model(args.input_size, len(classes))
+    model.compile(optimizer=keras.optimizers.Adam(args.learning_rate), loss="categorical_crossentropy",
+                  metrics=["accuracy"])
+    started = time.perf_counter()
+    model.fit(inputs, targets, epochs=args.epochs, batch_size=args.batch_size, shuffle=True,
+              validation_split=0.2 if len(samples) >= 50 else 0.0, verbose=2)
+    train_seconds = time.perf_counter() - started
+
+    metadata = {
+        "model_name": "sentry_screen",
+        "version": args.version,
+        "framework": "tensorflow/keras",
+        "img_height": args.input_size,
+        "img_width": args.input_size,
+        "classes": classes,
+        "class_indices": class_indices,
+        "num_classes": len(classes),
+        "parameters": int(model.count_params()),
+        "training_config": {
+            "images": len(samples),
+            "epochs": args.epochs,
+            "batch_size": args.batch_size,
+            "learning_rate": args.learning_rate,
+            "distilled_from": NSFW_MODEL_PATH.name if args.distill else None,
+        },
+    }
+    output = args.output or NSFW_SCREEN_MODEL_PATH.with_name("sentry_screen")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    sidecar_path = save_weights_bundle({
+        "architecture": model.to_json(),
+        "weights": model.get_weights(),
+        "metadata": metadata,
+        "class_indices": class_indices,
+    }, output)
+    print(f"✅ Wrote {sidecar_path} ({metadata['parameters']} parameters, trained in {train_seconds:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()